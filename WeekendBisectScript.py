@@ -1,10 +1,20 @@
 import bpy
+import bmesh
+import numpy as np
+from mathutils import Vector
 
 # Set the Manual height here:
 #BSH = 5.4
 #Otherwise it usess the 3d cursor's Z Value
 BSH = bpy.context.scene.cursor.location[2]
 
+# Set heights here (ie. [3.0, 6.0, 9.0]) to slice every selected mesh into one object per floor instead of
+# splitting it into RoofREF/MainHullREF at BSH
+SLICE_HEIGHTS = []
+
+# Vertices closer to the cut than this stay on both sides
+BISECT_EPSILON = 1e-5
+
 
 
 def ShowMessageBox(message = "", title = "Message Box", icon = 'INFO'):
@@ -14,6 +24,173 @@ def ShowMessageBox(message = "", title = "Message Box", icon = 'INFO'):
 
     bpy.context.window_manager.popup_menu(draw, title = title, icon = icon)
 
+#########################
+# The world space plane z = height in obj's local space, as (point, normal).
+#########################
+def LocalPlane(obj, height):
+    matrix = obj.matrix_world
+    point = matrix.inverted_safe() @ Vector((0.0, 0.0, height))
+    normal = (matrix.to_3x3().transposed() @ Vector((0.0, 0.0, 1.0))).normalized()
+    return point, normal
+
+#########################
+# Copies obj (and its mesh) into the same collections under name.
+#########################
+def CopyObject(obj, name, mesh):
+    copy = obj.copy()
+    copy.data = mesh
+    copy.name = name
+    for collection in obj.users_collection:
+        collection.objects.link(copy)
+    return copy
+
+#########################
+# Deletes the vertices of bm on one side of the plane (above when above is True), keeping the ones on it.
+#########################
+def ClearSide(bm, point, normal, above):
+    if above:
+        verts = [v for v in bm.verts if (v.co - point).dot(normal) > BISECT_EPSILON]
+    else:
+        verts = [v for v in bm.verts if (v.co - point).dot(normal) < -BISECT_EPSILON]
+    bmesh.ops.delete(bm, geom=verts, context='VERTS')
+
+#########################
+# Splits obj at world height in one bmesh pass. obj itself becomes RoofREF (everything above the cut),
+# a copy MainHullREF (everything below) and a hidden, untouched copy BackupMainHullREF.
+# Returns (roof, hull, backup).
+#########################
+def BisectObject(obj, height):
+    mesh = obj.data
+    backup = CopyObject(obj, "BackupMainHullREF", mesh.copy())
+
+    bm = bmesh.new()
+    bm.from_mesh(mesh)
+    # Same as mesh.reveal() before the old edit mode bisect
+    for elements in (bm.verts, bm.edges, bm.faces):
+        for element in elements:
+            element.hide_set(False)
+    point, normal = LocalPlane(obj, height)
+    bmesh.ops.bisect_plane(bm, geom=bm.verts[:] + bm.edges[:] + bm.faces[:], dist=BISECT_EPSILON, plane_co=point, plane_no=normal)
+
+    below = bm.copy()
+    ClearSide(below, point, normal, True)
+    hullMesh = mesh.copy()
+    below.to_mesh(hullMesh)
+    below.free()
+    hull = CopyObject(obj, "MainHullREF", hullMesh)
+
+    ClearSide(bm, point, normal, False)
+    # Linked duplicates keep the uncut mesh
+    if mesh.users > 1:
+        obj.data = mesh = mesh.copy()
+    bm.to_mesh(mesh)
+    bm.free()
+    obj.name = "RoofREF"
+
+    backup.hide_set(True)
+    return obj, hull, backup
+
+#########################
+# Bisects every object in objs at world height, returns a (roof, hull, backup) tuple per object.
+#########################
+def BisectObjects(objs, height):
+    return [BisectObject(obj, height) for obj in objs]
+
+#########################
+# World space Z of the vertices of obj's mesh.
+#########################
+def WorldHeights(obj, mesh):
+    co = np.empty(len(mesh.vertices) * 3, dtype=np.float64)
+    mesh.vertices.foreach_get("co", co)
+    row = np.array(obj.matrix_world, dtype=np.float64)[2]
+    return co.reshape(-1, 3) @ row[:3] + row[3]
+
+#########################
+# Cuts bm along every height in one bisect per plane, passing only the faces that cross that plane. The faces
+# to cut are found with one searchsorted over all vertex heights of the uncut mesh.
+#########################
+def CutPlanes(obj, bm, heights):
+    mesh = obj.data
+    z = WorldHeights(obj, mesh)
+    if len(mesh.polygons) == 0:
+        return
+    starts = np.empty(len(mesh.polygons), dtype=np.int64)
+    mesh.polygons.foreach_get("loop_start", starts)
+    loops = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loops)
+    low = np.minimum.reduceat(z[loops], starts)
+    high = np.maximum.reduceat(z[loops], starts)
+    crossing = np.flatnonzero(np.searchsorted(heights, low + BISECT_EPSILON) != np.searchsorted(heights, high - BISECT_EPSILON))
+    if len(crossing) == 0:
+        return
+
+    row = obj.matrix_world.row[2]
+    bm.faces.ensure_lookup_table()
+    candidates = [bm.faces[i] for i in crossing]
+    for height in heights:
+        cut = []
+        rest = []
+        for face in candidates:
+            faceZ = [row.dot(v.co.to_4d()) for v in face.verts]
+            (cut if min(faceZ) < height - BISECT_EPSILON and max(faceZ) > height + BISECT_EPSILON else rest).append(face)
+        if not cut:
+            continue
+        edges = {edge for face in cut for edge in face.edges}
+        verts = {vert for face in cut for vert in face.verts}
+        point, normal = LocalPlane(obj, height)
+        result = bmesh.ops.bisect_plane(bm, geom=cut + list(edges) + list(verts), dist=BISECT_EPSILON, plane_co=point, plane_no=normal)
+        rest.extend(element for element in result["geom"] if isinstance(element, bmesh.types.BMFace))
+        candidates = rest
+
+#########################
+# Slices obj at every world height into one object per slab (named <name>_Slab0 from the bottom up), and hides
+# obj as the backup. Only faces crossing a plane are cut, the rest is sorted into slabs by vertex height with
+# one searchsorted. Returns the slab objects, empty slabs are skipped.
+#########################
+def SliceObject(obj, heights):
+    heights = np.unique(np.asarray(heights, dtype=np.float64))
+    bm = bmesh.new()
+    bm.from_mesh(obj.data)
+    for elements in (bm.verts, bm.edges, bm.faces):
+        for element in elements:
+            element.hide_set(False)
+    CutPlanes(obj, bm, heights)
+
+    cutMesh = obj.data.copy()
+    bm.to_mesh(cutMesh)
+    z = WorldHeights(obj, cutMesh)
+    bpy.data.meshes.remove(cutMesh)
+    # Vertices on a plane belong to the slabs on both sides of it
+    lowest = np.searchsorted(heights, z - BISECT_EPSILON)
+    highest = np.searchsorted(heights, z + BISECT_EPSILON)
+
+    slabs = []
+    for slab in range(len(heights) + 1):
+        outside = np.flatnonzero((highest < slab) | (lowest > slab))
+        if len(outside) == len(z):
+            continue
+        slabBm = bm.copy()
+        slabBm.verts.ensure_lookup_table()
+        bmesh.ops.delete(slabBm, geom=[slabBm.verts[i] for i in outside], context='VERTS')
+        if len(slabBm.verts) == 0:
+            slabBm.free()
+            continue
+        slabMesh = obj.data.copy()
+        slabBm.to_mesh(slabMesh)
+        slabBm.free()
+        slabs.append(CopyObject(obj, "{}_Slab{}".format(obj.name, slab), slabMesh))
+    bm.free()
+
+    obj.hide_set(True)
+    return slabs
+
+#########################
+# Slices every object in objs at the world heights, returns the slab objects per object.
+#########################
+def SliceObjects(objs, heights):
+    return [SliceObject(obj, heights) for obj in objs]
+
+
 if (len(bpy.context.selected_objects) <= 0):
     ShowMessageBox("You must select at least one object in the scene.", "Mesh Joining - Script", 'ERROR')
 else:
@@ -21,48 +198,10 @@ else:
     objs = [obj for obj in bpy.context.selected_objects if obj.type == 'MESH']
     # Switch to Object Mode, as this script will only work in that context.
     bpy.ops.object.mode_set(mode='OBJECT')
-    
-    bpy.context.object.name = "RoofREF"
-    bpy.ops.object.duplicate(linked=False, mode='TRANSLATION' )
-    bpy.context.object.name = "MainHullREF"
-    bpy.ops.object.duplicate(linked=False, mode='TRANSLATION' )
-    bpy.context.object.name = "BackupMainHullREF"
-    bpy.ops.object.duplicate(linked=False, mode='TRANSLATION' )
-    bpy.context.object.name = "leftoversdodelete"
 
-    bpy.ops.object.select_all(action='DESELECT')
-    for obj in bpy.context.scene.objects:
-        if obj.name.startswith('MainHullREF'):
-            obj.select_set(True)
+    if SLICE_HEIGHTS:
+        SliceObjects(objs, SLICE_HEIGHTS)
+    else:
+        BisectObjects(objs, BSH)
 
-    bpy.ops.object.editmode_toggle()
-    bpy.ops.mesh.reveal()
-    bpy.ops.mesh.select_all(action='SELECT')
-    bpy.ops.mesh.bisect(plane_co=(0, 0, BSH), plane_no=(0, 0, 1), use_fill=False, clear_inner=False, clear_outer=True, xstart=177, xend=639, ystart=266, yend=228, flip=False)
-    bpy.ops.mesh.select_all(action='DESELECT')
-    bpy.ops.object.editmode_toggle()
-
-    bpy.ops.object.select_all(action='DESELECT')
-    for obj in bpy.context.scene.objects:
-        if obj.name.startswith('RoofREF'):
-            obj.select_set(True)
-
-    bpy.ops.object.editmode_toggle()
-    bpy.ops.mesh.reveal()
-    bpy.ops.mesh.select_all(action='SELECT')
-    bpy.ops.mesh.bisect(plane_co=(0, 0, BSH), plane_no=(0, 0, 1), use_fill=False, clear_inner=True, clear_outer=False, xstart=177, xend=639, ystart=266, yend=228, flip=False)
-    bpy.ops.mesh.select_all(action='DESELECT')
-    bpy.ops.object.editmode_toggle()
-
-    bpy.ops.object.select_all(action='DESELECT')
-    for obj in bpy.context.scene.objects:
-        if obj.name.startswith('leftoversdodelete'):
-            obj.select_set(True)
-            bpy.ops.object.delete(use_global=False)
-            
     bpy.ops.object.select_all(action='DESELECT')
-    for obj in bpy.context.scene.objects:
-        if obj.name.startswith('BackupMainHullREF'):
-            obj.select_set(True)
-            obj.hide_set(True)
-
@@ -1,5 +1,25 @@
 import bpy
+import numpy as np
+import os
+import sys
+import tracemalloc
+from contextlib import nullcontext
 
+# Optional per-pass profiling, see _PassProfiler.py. The script runs the same without it.
+try:
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from _PassProfiler import PassProfiler
+except ImportError:
+    PassProfiler = None
+
+# Set a path here to write per-pass timings, bpy.ops counts and vert/face counts as JSON.
+PROFILE_OUTPUT = ""
+
+# Join the selection in chunks of this many objects straight into NumPy buffers instead of with the
+# make_single_user/convert/transform_apply/join operators. Uses a fraction of the memory on 1M+ triangle
+# selections, but only keeps the active UV map and drops vertex groups, shape keys and custom normals (see
+# StreamingMeshJoin). 0 uses the operators.
+STREAMING_JOIN_CHUNK = 0
 
 def ShowMessageBox(message = "", title = "Message Box", icon = 'INFO'):
 
@@ -8,6 +28,11 @@ def ShowMessageBox(message = "", title = "Message Box", icon = 'INFO'):
 
     bpy.context.window_manager.popup_menu(draw, title = title, icon = icon)
     
+def ProfiledPass(profiler, name):
+    if profiler is None:
+        return nullcontext()
+    return profiler.Pass(name, bpy.context.selected_objects)
+
 def GameReadyMeshJoin():
     bpy.ops.object.make_single_user(object=True, obdata=True, material=False, animation=False, obdata_animation=False)
     bpy.ops.object.convert(target='MESH')
@@ -16,6 +41,203 @@ def GameReadyMeshJoin():
     bpy.ops.object.modifier_add(type='TRIANGULATE')
     bpy.context.object.modifiers["Triangulate"].min_vertices = 5
     
+class GrowingArray:
+    """Preallocated NumPy buffer of rows that doubles its capacity when it is full."""
+
+    def __init__(self, dtype, width = 1, capacity = 1024):
+        self.data = np.empty((capacity, width), dtype=dtype)
+        self.size = 0
+
+    def Extend(self, values):
+        values = values.reshape(-1, self.data.shape[1])
+        end = self.size + len(values)
+        if end > len(self.data):
+            grown = np.empty((max(end, 2 * len(self.data)), self.data.shape[1]), dtype=self.data.dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:end] = values
+        self.size = end
+
+    def View(self):
+        return self.data[:self.size]
+
+#########################
+# Appends the evaluated, world space geometry of obj (modifiers applied, like convert + transform_apply)
+# to the buffers. matrix is obj's world matrix as a NumPy array, materialSlots maps materials to their slot in
+# the joined mesh. colors holds one corner domain buffer per color attribute name; objects without one of
+# them get white, like object.join does.
+#########################
+def AppendObject(buffers, colors, obj, matrix, depsgraph, materials, materialSlots):
+    evaluated = obj.evaluated_get(depsgraph)
+    mesh = evaluated.to_mesh()
+    try:
+        verts = len(mesh.vertices)
+        co = np.empty(verts * 3, dtype=np.float32)
+        mesh.vertices.foreach_get("co", co)
+        co = co.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3]
+
+        polys = len(mesh.polygons)
+        starts = np.empty(polys, dtype=np.int64)
+        mesh.polygons.foreach_get("loop_start", starts)
+        totals = np.empty(polys, dtype=np.int64)
+        mesh.polygons.foreach_get("loop_total", totals)
+        loopVerts = np.empty(len(mesh.loops), dtype=np.int32)
+        mesh.loops.foreach_get("vertex_index", loopVerts)
+        smooth = np.empty(polys, dtype=bool)
+        mesh.polygons.foreach_get("use_smooth", smooth)
+        slots = np.empty(polys, dtype=np.int32)
+        mesh.polygons.foreach_get("material_index", slots)
+        uv = np.zeros(len(mesh.loops) * 2, dtype=np.float32)
+        if mesh.uv_layers.active:
+            mesh.uv_layers.active.data.foreach_get("uv", uv)
+
+        # Loops in polygon order, reversed per polygon when a negative scale turns the faces inside out
+        order = np.arange(len(mesh.loops))
+        if polys and np.linalg.det(matrix[:3, :3]) < 0:
+            owner = np.repeat(np.arange(polys), totals)
+            order = starts[owner] + (starts[owner] + totals[owner] - 1 - order)
+        loopVerts = loopVerts[order]
+        uv = uv.reshape(-1, 2)[order]
+
+        # Seams and sharp edges as pairs of joined vertex indices, the joined mesh's edges are rebuilt
+        edges = np.empty(len(mesh.edges) * 2, dtype=np.int32)
+        mesh.edges.foreach_get("vertices", edges)
+        edges = edges.reshape(-1, 2) + buffers["co"].size
+        for flag in ("use_seam", "use_edge_sharp"):
+            flags = np.empty(len(mesh.edges), dtype=bool)
+            mesh.edges.foreach_get(flag, flags)
+            buffers[flag].Extend(edges[flags])
+
+        # Color attributes, point domain ones are spread to the corners
+        loopsBefore = buffers["loops"].size
+        objectColors = {}
+        for attribute in getattr(mesh, "color_attributes", ()):
+            values = np.empty(len(attribute.data) * 4, dtype=np.float32)
+            attribute.data.foreach_get("color", values)
+            values = values.reshape(-1, 4)
+            objectColors[attribute.name] = values[loopVerts] if attribute.domain == 'POINT' else values[order]
+        for colorName in set(colors) | set(objectColors):
+            if colorName not in colors:
+                colors[colorName] = GrowingArray(np.float32, 4)
+                colors[colorName].Extend(np.ones((loopsBefore, 4), dtype=np.float32))
+            values = objectColors.get(colorName)
+            colors[colorName].Extend(values if values is not None else np.ones((len(loopVerts), 4), dtype=np.float32))
+
+        slotMap = []
+        for slot in obj.material_slots or [None]:
+            material = slot.material if slot else None
+            if material not in materialSlots:
+                materialSlots[material] = len(materials)
+                materials.append(material)
+            slotMap.append(materialSlots[material])
+        slotMap = np.array(slotMap, dtype=np.int32)
+
+        buffers["starts"].Extend(starts + buffers["loops"].size)
+        buffers["totals"].Extend(totals.astype(np.int32))
+        buffers["loops"].Extend(loopVerts + buffers["co"].size)
+        buffers["co"].Extend(co.astype(np.float32))
+        buffers["uv"].Extend(uv)
+        buffers["smooth"].Extend(smooth)
+        buffers["material"].Extend(slotMap[np.clip(slots, 0, len(slotMap) - 1)])
+    finally:
+        evaluated.to_mesh_clear()
+
+#########################
+# Joins objs into one new mesh object, chunk objects at a time, and returns it (None when none of them has
+# geometry). Like GameReadyMeshJoin the result is in world space, has all modifiers applied and replaces the
+# originals: every chunk is removed (with its meshes) as soon as it has been copied into the buffers. Prints
+# the peak memory the join allocated. Materials, smooth shading, seams, sharp edges, color attributes and the
+# active UV map carry over; other UV maps, vertex groups, shape keys and custom normals don't, unlike object.join.
+#########################
+def StreamingMeshJoin(objs, chunk):
+    objs = [obj for obj in objs if obj.type in {'MESH', 'CURVE', 'SURFACE', 'FONT', 'META'}]
+    if not objs:
+        return None
+    active = bpy.context.object if bpy.context.object in objs else objs[0]
+    name = active.name
+    meshName = active.data.name if active.type == 'MESH' else name
+    collections = list(active.users_collection)
+
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+    else:
+        tracemalloc.start()
+
+    buffers = {
+        "co": GrowingArray(np.float32, 3),
+        "loops": GrowingArray(np.int32),
+        "starts": GrowingArray(np.int64),
+        "totals": GrowingArray(np.int32),
+        "uv": GrowingArray(np.float32, 2),
+        "smooth": GrowingArray(bool),
+        "material": GrowingArray(np.int32),
+        "use_seam": GrowingArray(np.int32, 2),
+        "use_edge_sharp": GrowingArray(np.int32, 2),
+    }
+    colors = {}
+    materials = []
+    materialSlots = {}
+    count = len(objs)
+    # Removing a chunk unparents its children, so their world matrices are read before anything is removed
+    matrices = [np.array(obj.matrix_world, dtype=np.float64) for obj in objs]
+    for start in range(0, count, chunk):
+        done = objs[start:start + chunk]
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        for obj, matrix in zip(done, matrices[start:start + chunk]):
+            AppendObject(buffers, colors, obj, matrix, depsgraph, materials, materialSlots)
+        # Free every chunk as soon as it is in the buffers, so the originals and the copy never all exist at once
+        data = {obj.data for obj in done if obj.data is not None}
+        bpy.data.batch_remove(done)
+        bpy.data.batch_remove([item for item in data if item.users == 0])
+
+    loops = buffers["loops"].View().ravel()
+    starts = buffers["starts"].View().ravel()
+    mesh = bpy.data.meshes.new(meshName)
+    mesh.vertices.add(buffers["co"].size)
+    mesh.vertices.foreach_set("co", buffers["co"].View().ravel())
+    mesh.loops.add(len(loops))
+    mesh.loops.foreach_set("vertex_index", loops)
+    mesh.polygons.add(len(starts))
+    mesh.polygons.foreach_set("loop_start", starts.astype(np.int32))
+    if bpy.app.version < (4, 0, 0):
+        mesh.polygons.foreach_set("loop_total", buffers["totals"].View().ravel())
+    mesh.polygons.foreach_set("use_smooth", buffers["smooth"].View().ravel())
+    mesh.polygons.foreach_set("material_index", buffers["material"].View().ravel())
+    mesh.uv_layers.new(name="UVMap").data.foreach_set("uv", buffers["uv"].View().ravel())
+    for material in materials:
+        mesh.materials.append(material)
+    for colorName, values in colors.items():
+        mesh.color_attributes.new(colorName, 'FLOAT_COLOR', 'CORNER').data.foreach_set("color", values.View().ravel())
+    mesh.update(calc_edges=True)
+    mesh.validate()
+
+    # Seams and sharp edges back onto the rebuilt edges, matched by their sorted vertex pair
+    edges = np.empty(len(mesh.edges) * 2, dtype=np.int64)
+    mesh.edges.foreach_get("vertices", edges)
+    edges = np.sort(edges.reshape(-1, 2), axis=1)
+    edgeKeys = edges[:, 0] * len(mesh.vertices) + edges[:, 1]
+    for flag in ("use_seam", "use_edge_sharp"):
+        pairs = np.sort(buffers[flag].View().astype(np.int64), axis=1)
+        mesh.edges.foreach_set(flag, np.isin(edgeKeys, pairs[:, 0] * len(mesh.vertices) + pairs[:, 1]))
+
+    bufferBytes = sum(buffer.data.nbytes for buffer in buffers.values())
+    _, peak = tracemalloc.get_traced_memory()
+    if not tracing:
+        tracemalloc.stop()
+    print("Streaming join: {} objects, {} verts, {} faces, peak {:.1f} MB ({:.1f} MB buffers)".format(count, len(mesh.vertices), len(mesh.polygons), peak / 2**20, bufferBytes / 2**20))
+
+    joined = bpy.data.objects.new(name, mesh)
+    for collection in collections:
+        collection.objects.link(joined)
+
+    bpy.ops.object.select_all(action='DESELECT')
+    joined.select_set(True)
+    bpy.context.view_layer.objects.active = joined
+    bpy.ops.object.modifier_add(type='TRIANGULATE')
+    bpy.context.object.modifiers["Triangulate"].min_vertices = 5
+    return joined
+
 def CleanUp():
     # Getting rid of stuff with no faces
     bpy.ops.object.convert(target='MESH')
@@ -53,8 +275,27 @@ else:
     # Switch to Object Mode, as this script will only work in that context.
     bpy.ops.object.mode_set(mode='OBJECT')
     
-    GameReadyMeshJoin()
-    CleanUp()
-    AllQuads() #This one is Heavy! comment it out  for +1M tris or more
-    FixNormals()
+    profiler = PassProfiler("WeekendMeshJoinScript").Start() if PassProfiler and PROFILE_OUTPUT else None
+
+    with ProfiledPass(profiler, "GameReadyMeshJoin"):
+        if STREAMING_JOIN_CHUNK > 0:
+            joined = StreamingMeshJoin(objs, STREAMING_JOIN_CHUNK)
+        else:
+            GameReadyMeshJoin()
+            joined = bpy.context.object
+
+    if joined is None:
+        ShowMessageBox("None of the selected objects has geometry to join.", "Mesh Joining - Script", 'ERROR')
+    else:
+        with ProfiledPass(profiler, "CleanUp"):
+            CleanUp()
+        with ProfiledPass(profiler, "AllQuads"):
+            AllQuads() #This one is Heavy! comment it out  for +1M tris or more
+        with ProfiledPass(profiler, "FixNormals"):
+            FixNormals()
+
+    if profiler:
+        profiler.Stop()
+        profiler.PrintSummary()
+        profiler.Write(PROFILE_OUTPUT)
     
\ No newline at end of file
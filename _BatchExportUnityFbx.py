@@ -0,0 +1,287 @@
+"""
+Exports tile collections of many .blend files to Unity FBX files at once, without opening the Blender UI.
+
+This is a plain Python script, run it from a normal terminal (not from inside Blender):
+
+    python _BatchExportUnityFbx.py "D:/Levels" --blender "C:/Program Files/Blender Foundation/Blender 3.6/blender.exe" --output-dir "D:/Unity/Assets/Tiles"
+    python _BatchExportUnityFbx.py "D:/Levels/*.blend" --collections "Tile_*" "Props" --jobs 8
+
+Every file is opened by its own `blender --background` worker (this same script, started by Blender) that
+writes one FBX per matching collection with export_unity_fbx from blender-to-unity-fbx-exporter.py. Workers
+run side by side (one per core by default). The FBX files end up in <output dir>/<file>/<collection>.fbx, where
+<file> is the .blend file's path below the folder all inputs share (without .blend), and a JSON manifest lists
+every export with its timing and size.
+"""
+import argparse
+import fnmatch
+import glob
+import importlib.util
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+try:
+    import bpy
+except ImportError:
+    bpy = None
+
+EXPORTER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "blender-to-unity-fbx-exporter.py")
+
+#########################
+# Expands the directories and glob patterns given on the command line into a sorted list of .blend files.
+#########################
+def FindBlendFiles(inputs):
+    files = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            pattern = os.path.join(item, "**", "*.blend")
+        else:
+            pattern = item
+        for path in glob.glob(pattern, recursive=True):
+            if path.lower().endswith(".blend") and os.path.isfile(path):
+                files.add(os.path.abspath(path))
+    return sorted(files)
+
+#########################
+# Output folder of every .blend file: its path relative to the folder all of them share, without the
+# extension, so A/tile.blend and B/tile.blend don't write into the same folder. Returns (folders, clashes),
+# clashes lists the files that would still share a folder (ie. names that only differ in case on Windows).
+#########################
+def OutputFolders(blendFiles, outputDir):
+    root = os.path.commonpath([os.path.dirname(path) for path in blendFiles])
+    folders = {}
+    owners = {}
+    clashes = []
+    for path in blendFiles:
+        folder = os.path.join(os.path.abspath(outputDir), os.path.splitext(os.path.relpath(path, root))[0])
+        key = os.path.normcase(folder)
+        if key in owners:
+            clashes.append((owners[key], path))
+        owners[key] = path
+        folders[path] = folder
+    return folders, clashes
+
+#########################
+# Exports the collections of one .blend file in its own background Blender process and returns a result
+# dict with the worker's exports, or the error that made it fail.
+#########################
+def ExportBlendFile(blendFile, outputFolder, args, reportDir):
+    name = os.path.splitext(os.path.basename(blendFile))[0]
+    reportPath = os.path.join(reportDir, "{}_{}.json".format(name, abs(hash(blendFile))))
+    command = [
+        args.blender,
+        "--background",
+        "--factory-startup",
+        "--threads", str(args.threads),
+        blendFile,
+        "--python-exit-code", "1",
+        "--python", os.path.abspath(__file__),
+        "--",
+        "--output-dir", outputFolder,
+        "--report-json", reportPath,
+        "--collections",
+    ] + args.collections
+    if args.triangulate:
+        command.append("--triangulate")
+    if args.tangents:
+        command.append("--tangents")
+    if args.cache_dir:
+        command += ["--cache-dir", os.path.abspath(args.cache_dir)]
+    if args.dry_run:
+        command.append("--dry-run")
+    command += ["--rotation-engine", args.rotation_engine]
+
+    result = {"file": blendFile, "status": "failed"}
+    start = time.perf_counter()
+    try:
+        process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, errors="replace", timeout=args.timeout or None)
+        returnCode = process.returncode
+        output = process.stdout
+    except subprocess.TimeoutExpired:
+        returnCode = None
+        output = "Timed out after {}s".format(args.timeout)
+    result["seconds"] = round(time.perf_counter() - start, 3)
+
+    if returnCode == 0 and os.path.isfile(reportPath):
+        with open(reportPath) as f:
+            report = json.load(f)
+        failed = [export for export in report["exports"] if export["status"] != "ok"]
+        result.update(status="failed" if failed else "ok", exports=report["exports"])
+        return result
+
+    # Keep the end of the log, that's where Blender prints the traceback or crash reason.
+    result["returnCode"] = returnCode
+    result["error"] = "\n".join(output.strip().splitlines()[-20:])
+    return result
+
+#########################
+# Command line entry point.
+#########################
+def Main(argv = None):
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Export the collections of many .blend files to Unity FBX in parallel background Blender processes.")
+    parser.add_argument("inputs", nargs="+", help="Directories (searched recursively) or glob patterns of .blend files.")
+    parser.add_argument("--collections", nargs="+", default=[], help="Names or patterns of the collections to export (default: every top level collection).")
+    parser.add_argument("--output-dir", default="fbx", help="Where to write the FBX files, one folder per .blend file.")
+    parser.add_argument("--blender", default=os.environ.get("BLENDER", shutil.which("blender") or "blender"), help="Path to the local Blender executable (default: $BLENDER or blender on PATH).")
+    parser.add_argument("--jobs", type=int, default=cores, help="Number of Blender processes to run at once (default: one per core).")
+    parser.add_argument("--threads", type=int, default=0, help="Threads per Blender process (default: cores / jobs).")
+    parser.add_argument("--timeout", type=float, default=0, help="Seconds before a worker is killed, 0 for no limit.")
+    parser.add_argument("--triangulate", action="store_true", help="Triangulate faces while exporting.")
+    parser.add_argument("--tangents", action="store_true", help="Export tangents.")
+    parser.add_argument("--manifest", default="fbx_manifest.json", help="Where to write the JSON manifest.")
+    parser.add_argument("--cache-dir", default="", help="Keep exported FBX files here and copy them instead of exporting again when nothing changed.")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the collections that would be exported again (needs --cache-dir).")
+    parser.add_argument("--rotation-engine", choices=("OPERATOR", "MATRIX"), default="OPERATOR", help="OPERATOR exports in place with transform_apply like the exporter's default, MATRIX exports from a temporary copy with the matrix engine (check it first with blender-to-unity-fbx-exporter.py --compare-rotation-engines).")
+    args = parser.parse_args(argv)
+
+    if args.dry_run and not args.cache_dir:
+        parser.error("--dry-run needs --cache-dir")
+
+    args.jobs = max(1, args.jobs)
+    if args.threads <= 0:
+        args.threads = max(1, cores // args.jobs)
+
+    blendFiles = FindBlendFiles(args.inputs)
+    if not blendFiles:
+        print("No .blend files to export.")
+        return 1
+
+    outputFolders, clashes = OutputFolders(blendFiles, args.output_dir)
+    if clashes:
+        for first, second in clashes:
+            print("{} and {} would export into the same folder".format(first, second))
+        return 1
+
+    print("Exporting {} files with {} workers...".format(len(blendFiles), args.jobs))
+    start = time.perf_counter()
+    results = []
+    with tempfile.TemporaryDirectory(prefix="fbx_reports_") as reportDir:
+        with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+            futures = [pool.submit(ExportBlendFile, path, outputFolders[path], args, reportDir) for path in blendFiles]
+            for done, future in enumerate(as_completed(futures), 1):
+                result = future.result()
+                results.append(result)
+                print("[{}/{}] {} {} ({} collections, {}s)".format(done, len(futures), result["status"].upper(), result["file"], len(result.get("exports", [])), result.get("seconds", 0)))
+
+    results.sort(key=lambda result: result["file"])
+    exports = [export for result in results for export in result.get("exports", [])]
+    failed = [result["file"] for result in results if result["status"] != "ok"]
+    manifest = {
+        "seconds": round(time.perf_counter() - start, 3),
+        "files": len(results),
+        "failed": len(failed),
+        "exports": len(exports),
+        "totalBytes": sum(export.get("bytes", 0) for export in exports),
+        "results": results,
+    }
+    with open(args.manifest, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    if args.dry_run:
+        rebuild = [export for export in exports if export.get("cache") == "would rebuild"]
+        for export in rebuild:
+            print("WOULD REBUILD {} {}".format(export["file"], export["collection"]))
+        print("{} of {} collections would be exported again".format(len(rebuild), len(exports)))
+    else:
+        print("{} FBX files ({} from the cache), {} bytes".format(manifest["exports"], sum(1 for export in exports if export.get("cache") == "cached"), manifest["totalBytes"]))
+    print("{} failed, manifest written to {}".format(len(failed), args.manifest))
+    return 1 if failed else 0
+
+#########################
+# Everything below runs inside the background Blender process started by ExportBlendFile.
+#########################
+
+#########################
+# Loads blender-to-unity-fbx-exporter.py (its file name is not importable) and registers its operator.
+#########################
+def LoadExporter():
+    spec = importlib.util.spec_from_file_location("blender_to_unity_fbx_exporter", EXPORTER_SCRIPT)
+    exporter = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(exporter)
+    if not hasattr(bpy.types, "EXPORT_SCENE_OT_unity_fbx"):
+        exporter.register()
+    return exporter
+
+#########################
+# The layer collection of collection in the view layer, so it can be made the active collection.
+#########################
+def FindLayerCollection(layerCollection, collection):
+    stack = [layerCollection]
+    while stack:
+        item = stack.pop()
+        if item.collection == collection:
+            return item
+        stack.extend(item.children)
+    return None
+
+#########################
+# Worker entry point, the arguments are the ones after "--" on the Blender command line.
+#########################
+def Worker(argv):
+    parser = argparse.ArgumentParser(prog="_BatchExportUnityFbx.py (worker)")
+    parser.add_argument("--output-dir", required=True)
+    parser.add_argument("--report-json", required=True)
+    parser.add_argument("--collections", nargs="*", default=[])
+    parser.add_argument("--triangulate", action="store_true")
+    parser.add_argument("--tangents", action="store_true")
+    parser.add_argument("--cache-dir", default="")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--rotation-engine", default="OPERATOR")
+    args = parser.parse_args(argv)
+
+    exporter = LoadExporter()
+    cache = exporter.ExportCache(args.cache_dir) if args.cache_dir else None
+    context = bpy.context
+
+    # By name, the in-place export restores the file through undo, which invalidates references to IDs
+    if args.collections:
+        collectionNames = [collection.name for collection in bpy.data.collections if any(fnmatch.fnmatchcase(collection.name, pattern) for pattern in args.collections)]
+    else:
+        collectionNames = [collection.name for collection in context.scene.collection.children]
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    exports = []
+    for collectionName in collectionNames:
+        viewLayer = context.view_layer
+        layerCollection = FindLayerCollection(viewLayer.layer_collection, bpy.data.collections[collectionName])
+        fbxPath = os.path.join(args.output_dir, collectionName + ".fbx")
+        export = {"file": bpy.data.filepath, "collection": collectionName, "fbx": fbxPath, "rotationEngine": args.rotation_engine, "status": "failed"}
+        if layerCollection is None or layerCollection.exclude:
+            export["error"] = "Collection is not in the view layer"
+            exports.append(export)
+            continue
+
+        if os.path.exists(fbxPath) and not args.dry_run:
+            os.remove(fbxPath)
+        viewLayer.active_layer_collection = layerCollection
+        # The exporter moves the active object to the origin, so whatever was last clicked in the file would
+        # change the output. No object is active, the exported transforms are the ones in the file.
+        viewLayer.objects.active = None
+        export["activeObject"] = None
+        start = time.perf_counter()
+        exporter.export_unity_fbx(context, fbxPath, True, False, False, False, 'Y', 'X', args.tangents, args.triangulate, rotation_engine=args.rotation_engine, from_copy=args.rotation_engine == 'MATRIX', cache=cache, dry_run=args.dry_run)
+        export["seconds"] = round(time.perf_counter() - start, 3)
+        if cache:
+            export["cache"] = cache.last_status
+        if args.dry_run:
+            export["status"] = "ok"
+        elif os.path.isfile(fbxPath):
+            export.update(status="ok", bytes=os.path.getsize(fbxPath))
+        exports.append(export)
+        print("{} {} ({}s)".format(export["status"].upper(), fbxPath, export["seconds"]))
+
+    with open(args.report_json, "w") as f:
+        json.dump({"file": bpy.data.filepath, "exports": exports}, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    if bpy is not None:
+        Worker(sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else [])
+    else:
+        sys.exit(Main())
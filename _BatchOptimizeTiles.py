@@ -0,0 +1,178 @@
+"""
+Runs _CompleteOptimizationScript.py over many .blend files at once, without opening the Blender UI.
+
+This is a plain Python script, run it from a normal terminal (not from inside Blender):
+
+    python _BatchOptimizeTiles.py "D:/Tiles" --blender "C:/Program Files/Blender Foundation/Blender 3.6/blender.exe"
+    python _BatchOptimizeTiles.py "D:/Tiles/**/*.blend" --jobs 8 --output nightly.json
+
+Every file is opened by its own `blender --background` worker that optimizes every mesh in the file and
+saves it. Workers run side by side (one per core by default). Each worker's finalReport and
+totalVertsRemoved are collected into one JSON summary. Files that crash are retried, and files that keep
+crashing are written to a quarantine list that later runs skip until it is cleared.
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+OPTIMIZATION_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "_CompleteOptimizationScript.py")
+
+#########################
+# Expands the directories and glob patterns given on the command line into a sorted list of .blend files.
+#########################
+def FindBlendFiles(inputs):
+    files = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            pattern = os.path.join(item, "**", "*.blend")
+        else:
+            pattern = item
+        for path in glob.glob(pattern, recursive=True):
+            if path.lower().endswith(".blend") and os.path.isfile(path):
+                files.add(os.path.abspath(path))
+    return sorted(files)
+
+#########################
+# Reads the quarantine list (one absolute path per line).
+#########################
+def LoadQuarantine(filepath):
+    if not filepath or not os.path.isfile(filepath):
+        return set()
+    with open(filepath) as f:
+        return {line.strip() for line in f if line.strip()}
+
+#########################
+# Adds newly crashed files to the quarantine list.
+#########################
+def SaveQuarantine(filepath, quarantined):
+    if not filepath:
+        return
+    with open(filepath, "w") as f:
+        for path in sorted(quarantined):
+            f.write(path + "\n")
+
+#########################
+# Optimizes one .blend file in its own background Blender process. Retries crashed runs and returns a
+# result dict with the worker's report, or the error that made it give up.
+#########################
+def OptimizeBlendFile(blendFile, args, reportDir):
+    reportPath = os.path.join(reportDir, "{}_{}.json".format(os.path.splitext(os.path.basename(blendFile))[0], abs(hash(blendFile))))
+    command = [
+        args.blender,
+        "--background",
+        "--factory-startup",
+        "--threads", str(args.threads),
+        blendFile,
+        "--python-exit-code", "1",
+        "--python", OPTIMIZATION_SCRIPT,
+        "--",
+        "--all-objects",
+        "--report-json", reportPath,
+    ]
+    if not args.no_save:
+        command.append("--save")
+    if args.cache_dir:
+        command += ["--cache-dir", os.path.abspath(args.cache_dir)]
+    if args.clear_cache:
+        command.append("--clear-cache")
+
+    result = {"file": blendFile, "status": "failed", "attempts": 0}
+    for attempt in range(1 + args.retries):
+        result["attempts"] = attempt + 1
+        if os.path.exists(reportPath):
+            os.remove(reportPath)
+
+        start = time.perf_counter()
+        try:
+            process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, errors="replace", timeout=args.timeout or None)
+            returnCode = process.returncode
+            output = process.stdout
+        except subprocess.TimeoutExpired:
+            returnCode = None
+            output = "Timed out after {}s".format(args.timeout)
+        result["seconds"] = round(time.perf_counter() - start, 3)
+
+        if returnCode == 0 and os.path.isfile(reportPath):
+            with open(reportPath) as f:
+                report = json.load(f)
+            result.update(status="ok", finalReport=report["finalReport"], totalVertsRemoved=report["totalVertsRemoved"], objects=report["objects"], tasks=report["tasks"])
+            result.pop("error", None)
+            return result
+
+        # Keep the end of the log, that's where Blender prints the traceback or crash reason.
+        result["returnCode"] = returnCode
+        result["error"] = "\n".join(output.strip().splitlines()[-20:])
+
+    return result
+
+#########################
+# Command line entry point.
+#########################
+def Main(argv = None):
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Optimize many tile .blend files in parallel background Blender processes.")
+    parser.add_argument("inputs", nargs="+", help="Directories (searched recursively) or glob patterns of .blend files.")
+    parser.add_argument("--blender", default=os.environ.get("BLENDER", shutil.which("blender") or "blender"), help="Path to the local Blender executable (default: $BLENDER or blender on PATH).")
+    parser.add_argument("--jobs", type=int, default=cores, help="Number of Blender processes to run at once (default: one per core).")
+    parser.add_argument("--threads", type=int, default=0, help="Threads per Blender process (default: cores / jobs).")
+    parser.add_argument("--retries", type=int, default=1, help="How many times to retry a file that crashed or timed out.")
+    parser.add_argument("--timeout", type=float, default=0, help="Seconds before a worker is killed, 0 for no limit.")
+    parser.add_argument("--output", default="optimization_report.json", help="Where to write the JSON summary.")
+    parser.add_argument("--quarantine", default="quarantine.txt", help="File listing .blend files that keep crashing. They are skipped until removed from the list.")
+    parser.add_argument("--no-save", action="store_true", help="Report what would change without saving the .blend files.")
+    parser.add_argument("--cache-dir", default="", help="Keep the optimization caches in this directory instead of beside each .blend file.")
+    parser.add_argument("--clear-cache", action="store_true", help="Forget the cached objects of every file and optimize everything again.")
+    args = parser.parse_args(argv)
+
+    args.jobs = max(1, args.jobs)
+    if args.threads <= 0:
+        args.threads = max(1, cores // args.jobs)
+
+    quarantined = LoadQuarantine(args.quarantine)
+    blendFiles = FindBlendFiles(args.inputs)
+    skipped = [path for path in blendFiles if path in quarantined]
+    blendFiles = [path for path in blendFiles if path not in quarantined]
+    if not blendFiles:
+        print("No .blend files to optimize.")
+        return 1
+
+    print("Optimizing {} files with {} workers ({} quarantined files skipped)...".format(len(blendFiles), args.jobs, len(skipped)))
+    start = time.perf_counter()
+    results = []
+    with tempfile.TemporaryDirectory(prefix="tile_reports_") as reportDir:
+        with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+            futures = [pool.submit(OptimizeBlendFile, path, args, reportDir) for path in blendFiles]
+            for done, future in enumerate(as_completed(futures), 1):
+                result = future.result()
+                results.append(result)
+                print("[{}/{}] {} {} ({}s)".format(done, len(futures), result["status"].upper(), result["file"], result.get("seconds", 0)))
+
+    failed = [result["file"] for result in results if result["status"] != "ok"]
+    quarantined.update(failed)
+    SaveQuarantine(args.quarantine, quarantined)
+
+    results.sort(key=lambda result: result["file"])
+    summary = {
+        "seconds": round(time.perf_counter() - start, 3),
+        "files": len(results),
+        "failed": len(failed),
+        "skipped": skipped,
+        "totalVertsRemoved": sum(result.get("totalVertsRemoved", 0) for result in results),
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(summary, f, indent=2)
+
+    print("TOTAL VERTICES REMOVED: {}".format(summary["totalVertsRemoved"]))
+    print("{} failed, summary written to {}".format(len(failed), args.output))
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(Main())
@@ -1,17 +1,208 @@
 import bpy
-from datetime import date
+import bmesh
+import numpy as np
+import argparse
+import csv
+import fnmatch
+import hashlib
+import inspect
+import io
+import json
+import os
+import sys
+from contextlib import contextmanager
+from datetime import date, datetime
+from time import perf_counter, time
 from os import system
 cls = lambda: system('cls')
 
-# Cache a reference to all selected objects.
-objs = [obj for obj in bpy.context.selected_objects if obj.type == 'MESH']
+# Optional per-pass profiling, see _PassProfiler.py. The script runs the same without it.
+try:
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from _PassProfiler import PassProfiler
+except ImportError:
+    PassProfiler = None
+
+# Set a path here (or pass --profile-json) to write per-pass timings, bpy.ops counts and vert/face counts.
+PROFILE_OUTPUT = ""
+
+# Set a path here (or pass --pipeline) to a JSON/TOML pipeline file, see _OptimizationPipeline.json.
+# Leave it empty to run DEFAULT_PIPELINE.
+PIPELINE_FILE = ""
+
+# Objects whose mesh is unchanged since they were last optimized (with the same pipeline) are skipped.
+# The cache lives beside the .blend file unless CACHE_DIR is set, and keeps at most CACHE_MAX_ENTRIES meshes.
+USE_CACHE = True
+CACHE_DIR = ""
+CACHE_MAX_ENTRIES = 50000
+
+#########################
+# Command line options for headless runs, everything after "--" belongs to this script. Example:
+# blender --background tile.blend --python _CompleteOptimizationScript.py -- --all-objects --save --report-json tile.json
+# Running the script from the text editor leaves them all off.
+#########################
+def ParseScriptArguments():
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    parser = argparse.ArgumentParser(prog="_CompleteOptimizationScript.py")
+    parser.add_argument("--all-objects", action="store_true", help="Optimize every mesh in the scene instead of the selection.")
+    parser.add_argument("--save", action="store_true", help="Save the .blend file after optimizing.")
+    parser.add_argument("--pipeline", default=PIPELINE_FILE, help="JSON or TOML file listing the passes to run, see _OptimizationPipeline.json.")
+    parser.add_argument("--no-cache", action="store_true", help="Optimize every object, even if it is unchanged since the last run.")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="Keep the optimization cache in this directory instead of beside the .blend file.")
+    parser.add_argument("--clear-cache", action="store_true", help="Forget every cached object of this .blend file before running.")
+    parser.add_argument("--report-json", default="", help="Write the final report (lines, events and task timings) to this JSON file.")
+    parser.add_argument("--report-csv", default="", help="Write the final report events to this CSV file.")
+    parser.add_argument("--profile-json", default=PROFILE_OUTPUT, help="Write per-pass profiling data to this JSON file (needs _PassProfiler.py).")
+    parser.add_argument("--cprofile", action="store_true", help="Also run cProfile over every pass, saved next to the profile JSON as .prof.")
+    parser.add_argument("--tracemalloc", action="store_true", help="Also record the peak Python memory of every pass.")
+    args, _ = parser.parse_known_args(argv)
+    return args
+
+scriptArgs = ParseScriptArguments()
+
+# Cache a reference to all selected objects (or every mesh in the scene when running headless).
+if scriptArgs.all_objects:
+    objs = [obj for obj in bpy.context.scene.objects if obj.type == 'MESH']
+else:
+    objs = [obj for obj in bpy.context.selected_objects if obj.type == 'MESH']
 
 # Switch to Object Mode, as this script will only work in that context.
-bpy.ops.object.mode_set(mode='OBJECT')
+# Background files might not have an active object, in which case they are already in object mode.
+if bpy.ops.object.mode_set.poll():
+    bpy.ops.object.mode_set(mode='OBJECT')
+
+#region Report
+#########################
+# Report lines for every task that records events. {count} is the aggregated count for the object.
+#########################
+REPORT_MESSAGES = {
+    "RemoveDuplicateMaterials": "Re-assigned {count} duplicated material faces to original material in {name}",
+    "RemoveUnusedMaterials": "Removed {count} unused materials in {name}",
+    "RemoveEmptyMaterialSlots": "Removed {count} empty materials in {name}",
+    "SkippedSlotCompaction": "Skipped material slot compaction in {name} (shared mesh with object linked materials)",
+    "MergeByDistance": "Merge by Distance removed {count} vertices in {name}",
+    "PurgeOrphanMaterialData": "Purged {count} orphan materials",
+    "RemoveZeroVertObjectsFromScene": "Removed {count} objects with 0 vertices",
+}
+
+#########################
+# Collects what the optimization tasks did as typed events instead of one big string.
+# Events are aggregated per (object, task) as they come in, so a task that fires once per face still only
+# costs one entry. Each entry holds [count, calls, seconds], where calls is the number of timed runs.
+# Scene wide tasks use "" as the object name.
+# The report renders to text for the terminal, or to JSON and CSV for batch runs.
+#########################
+class OptimizationReport:
+    def __init__(self, blendFile = ""):
+        self.blendFile = blendFile
+        self.started = datetime.now()
+        self.objectCount = 0
+        self.entries = {}
+        self.skipped = {}
+
+    #########################
+    # Records count things done by task on objectName.
+    #########################
+    def Add(self, objectName, task, count = 1, seconds = 0.0, calls = 0):
+        entry = self.entries.get((objectName, task))
+        if entry is None:
+            self.entries[(objectName, task)] = [count, calls, seconds]
+        else:
+            entry[0] += count
+            entry[1] += calls
+            entry[2] += seconds
+
+    #########################
+    # Times the wrapped block as one call of task on objectName.
+    #########################
+    @contextmanager
+    def Timed(self, task, objectName = ""):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.Add(objectName, task, 0, perf_counter() - start, 1)
+
+    #########################
+    # Records that a pipeline pass was skipped on count objects because it had nothing to do.
+    #########################
+    def Skip(self, task, count = 1):
+        self.skipped[task] = self.skipped.get(task, 0) + count
+
+    #########################
+    # Sum of the counts recorded for a task over all objects.
+    #########################
+    def Total(self, task):
+        return sum(entry[0] for (objectName, entryTask), entry in self.entries.items() if entryTask == task)
+
+    #########################
+    # Total seconds and calls per task, slowest task first. Shows which pass is the bottleneck on a tile.
+    #########################
+    def TaskTimings(self):
+        timings = {}
+        for (objectName, task), (count, calls, seconds) in self.entries.items():
+            timing = timings.setdefault(task, [0.0, 0])
+            timing[0] += seconds
+            timing[1] += calls
+        return sorted(((task, seconds, calls) for task, (seconds, calls) in timings.items() if calls > 0), key=lambda timing: -timing[1])
+
+    #########################
+    # The human readable report lines, in the order the events first came in.
+    #########################
+    def Lines(self):
+        lines = []
+        for (objectName, task), (count, calls, seconds) in self.entries.items():
+            message = REPORT_MESSAGES.get(task)
+            if message and count > 0:
+                lines.append(message.format(name=objectName, count=count))
+        return lines
+
+    def ToText(self):
+        lines = self.Lines()
+        lines.append("")
+        lines.append("TASK TIMINGS")
+        for task, seconds, calls in self.TaskTimings():
+            lines.append("{:<32} {:>9.3f}s  {} calls".format(task, seconds, calls))
+        if self.skipped:
+            lines.append("")
+            lines.append("SKIPPED (NOTHING TO DO)")
+            for task, count in self.skipped.items():
+                lines.append("{:<32} {} times".format(task, count))
+        return "\n".join(lines)
+
+    def ToDict(self):
+        return {
+            "file": self.blendFile,
+            "date": self.started.isoformat(timespec="seconds"),
+            "objects": self.objectCount,
+            "finalReport": self.Lines(),
+            "totalVertsRemoved": self.Total("MergeByDistance"),
+            "tasks": [{"task": task, "seconds": round(seconds, 6), "calls": calls} for task, seconds, calls in self.TaskTimings()],
+            "skipped": self.skipped,
+            "events": [{"object": objectName, "task": task, "count": count, "calls": calls, "seconds": round(seconds, 6)} for (objectName, task), (count, calls, seconds) in self.entries.items()],
+        }
+
+    def ToJson(self):
+        return json.dumps(self.ToDict(), indent=2)
+
+    def ToCsv(self):
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow(["object", "task", "count", "calls", "seconds"])
+        for (objectName, task), (count, calls, seconds) in self.entries.items():
+            writer.writerow([objectName, task, count, calls, "{:.6f}".format(seconds)])
+        return out.getvalue()
+
+#endregion
 
 # GLOBALS
-finalReport = ""
-totalVertsRemoved = 0
+report = OptimizationReport(bpy.context.blend_data.filepath)
+profiler = None
+if scriptArgs.profile_json:
+    if PassProfiler:
+        profiler = PassProfiler("_CompleteOptimizationScript", scriptArgs.cprofile, scriptArgs.tracemalloc)
+    else:
+        print("_PassProfiler.py was not found next to this script, profiling is off.")
 
 #region Helpers
 
@@ -39,7 +230,8 @@ def OutputReportPrefixToTerminal():
     print("")
     print("###########################################")
     print("")
-    print("Begin Optimizing {}....".format(bpy.path.basename(bpy.context.blend_data.filepath)))
+    print("Begin Optimizing {}....".format(bpy.path.basename(report.blendFile)))
+    print("Started: {}".format(report.started.strftime("%Y-%m-%d %H:%M:%S")))
     print("")  
     for x in range(1):
         print("###########################################")
@@ -49,9 +241,6 @@ def OutputReportPrefixToTerminal():
 # Outputs the final report to the blender terminal after we have optimized the selected objects.
 #########################
 def PrintFinalReport():
-    global finalReport
-    global totalVertsRemoved
-    
     today = date.today()
     
     print("")
@@ -65,12 +254,24 @@ def PrintFinalReport():
     for x in range(1):
         print("###########################################")
     print("")
-    print(finalReport)
-    print("TOTAL VERTICES REMOVED: {}".format(totalVertsRemoved))
+    print(report.ToText())
+    print("")
+    print("TOTAL VERTICES REMOVED: {}".format(report.Total("MergeByDistance")))
     print("")
     for x in range(4):
         print("###########################################")
 
+#########################
+# Writes the final report to a JSON or CSV file so batch runs (see _BatchOptimizeTiles.py) can collect it.
+#########################
+def WriteReportFiles(jsonPath = "", csvPath = ""):
+    if jsonPath:
+        with open(jsonPath, "w") as f:
+            f.write(report.ToJson())
+    if csvPath:
+        with open(csvPath, "w", newline="") as f:
+            f.write(report.ToCsv())
+
 #########################
 # Clears out the blender terminal of all previous text output.
 #########################    
@@ -82,9 +283,140 @@ def ClearTerminal():
 # selected objects have been optimized. ie. Yellow.001 material.
 #########################    
 def PurgeOrphanMaterialData():
-    for block in bpy.data.materials:
-        if block.users == 0:
-            bpy.data.materials.remove(block) 
+    orphans = [block for block in bpy.data.materials if block.users == 0]
+    for block in orphans:
+        bpy.data.materials.remove(block)
+    report.Add("", "PurgeOrphanMaterialData", len(orphans))
+
+#endregion
+
+#region Merge Core
+#########################
+# Pure NumPy part of the merge by distance engine. Nothing in this region touches bpy, so it can be
+# copied out and run (or timed with BenchmarkMergeByDistance) on plain arrays outside of Blender.
+#########################
+
+# Half of the 26 neighbouring grid cells. Searching these plus a vertex's own cell finds every close pair
+# exactly once, the other half would only find the same pairs again from the other side.
+_HALF_NEIGHBOUR_OFFSETS = np.array([(x, y, z) for x in (-1, 0, 1) for y in (-1, 0, 1) for z in (-1, 0, 1) if (x, y, z) > (0, 0, 0)], dtype=np.int64)
+
+# Bits per axis when packing a grid cell into one int64 key.
+_CELL_BITS = 21
+
+#########################
+# Finds every pair of vertices (i < j) that are within threshold of each other, sorted by i.
+# Vertices are snapped to a threshold-sized grid, so a vertex can only be close to vertices in its own
+# cell or one of the 26 cells around it. Cells are packed into sorted int64 keys, which turns every
+# neighbour lookup into a single searchsorted over the whole mesh.
+#########################
+def FindMergeCandidatePairs(coords, threshold):
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+    if len(coords) < 2 or threshold <= 0:
+        return np.empty((0, 2), dtype=np.int64)
+
+    # Any cell size >= threshold is still correct, it just tests more candidates. Grow the cells on
+    # huge meshes so every axis fits in its share of the key.
+    lowest = coords.min(axis=0)
+    extent = float((coords.max(axis=0) - lowest).max())
+    cellSize = max(threshold, extent / ((1 << _CELL_BITS) - 4))
+
+    # Keep one empty cell of padding on both sides so neighbour offsets never wrap into another axis.
+    cells = np.floor((coords - lowest) / cellSize).astype(np.int64) + 1
+    keys = (cells[:, 0] << (2 * _CELL_BITS)) | (cells[:, 1] << _CELL_BITS) | cells[:, 2]
+    order = np.argsort(keys, kind='stable')
+    sortedKeys = keys[order]
+
+    positions = np.arange(len(order))
+    owners = []
+    candidates = []
+
+    # Pairs inside the same cell. Only look forward so each pair is found once.
+    cellEnds = np.searchsorted(sortedKeys, sortedKeys, side='right')
+    ExpandSortedRanges(owners, candidates, positions + 1, cellEnds)
+
+    # Pairs between neighbouring cells. Shifting sorted keys by a constant keeps them sorted, which
+    # keeps searchsorted fast.
+    for offset in _HALF_NEIGHBOUR_OFFSETS:
+        delta = (int(offset[0]) << (2 * _CELL_BITS)) + (int(offset[1]) << _CELL_BITS) + int(offset[2])
+        neighbourKeys = sortedKeys + delta
+        starts = np.searchsorted(sortedKeys, neighbourKeys, side='left')
+        ends = np.searchsorted(sortedKeys, neighbourKeys, side='right')
+        ExpandSortedRanges(owners, candidates, starts, ends)
+
+    if not owners:
+        return np.empty((0, 2), dtype=np.int64)
+
+    first = order[np.concatenate(owners)]
+    second = order[np.concatenate(candidates)]
+    deltas = coords[first] - coords[second]
+    close = np.einsum('ij,ij->i', deltas, deltas) <= threshold * threshold
+    low = np.minimum(first[close], second[close])
+    high = np.maximum(first[close], second[close])
+
+    packed = np.sort(low * len(coords) + high)
+    return np.stack([packed // len(coords), packed % len(coords)], axis=1)
+
+#########################
+# Expands the per-vertex ranges [starts, ends) of sorted positions into (owner, candidate) position pairs
+# and appends them to the given lists. Empty ranges are skipped.
+#########################
+def ExpandSortedRanges(owners, candidates, starts, ends):
+    counts = ends - starts
+    hits = np.flatnonzero(counts > 0)
+    if len(hits) == 0:
+        return
+    hitCounts = counts[hits]
+    owners.append(np.repeat(hits, hitCounts))
+    runStarts = np.repeat(starts[hits] - np.cumsum(hitCounts) + hitCounts, hitCounts)
+    candidates.append(runStarts + np.arange(len(runStarts)))
+
+#########################
+# Builds the weld map for merge by distance. Returns an array where targets[i] is the vertex that i
+# gets welded into, or -1 if i survives.
+# Vertices are visited in index order, and every vertex that is still free claims all free vertices
+# within threshold of itself (no chaining through neighbours). Blender's remove_doubles claims the same
+# way but visits vertices in its own spatial order, not index order, so it can keep a different vertex
+# of a cluster. Clusters smaller than threshold lose the same number of vertices either way; in wider
+# clusters the vertex counts can differ too.
+#########################
+def FindMergeTargets(coords, threshold):
+    coords = np.asarray(coords).reshape(-1, 3)
+    targets = np.full(len(coords), -1, dtype=np.int64)
+    pairs = FindMergeCandidatePairs(coords, threshold)
+    if len(pairs) == 0:
+        return targets
+
+    # Vertices that show up in a single pair can't be contested, so weld those straight away and only
+    # walk the clusters of three or more vertices one pair at a time.
+    uses = np.bincount(pairs.ravel(), minlength=len(coords))
+    simple = (uses[pairs[:, 0]] == 1) & (uses[pairs[:, 1]] == 1)
+    targets[pairs[simple, 1]] = pairs[simple, 0]
+
+    # Pairs come back sorted by their first vertex, which gives us the index order for free.
+    merged = np.zeros(len(coords), dtype=bool)
+    for keep, weld in pairs[~simple].tolist():
+        if merged[keep] or merged[weld]:
+            continue
+        targets[weld] = keep
+        merged[weld] = True
+
+    return targets
+
+#########################
+# Times FindMergeTargets on a synthetic grid where every vertex has a jittered duplicate. Not called by the
+# optimization run, call it by hand from the Python console (or plain Python) to check the merge speed.
+#########################
+def BenchmarkMergeByDistance(quadsPerSide = 500, threshold = 0.0001):
+    side = np.arange(quadsPerSide + 1, dtype=np.float64)
+    grid = np.stack(np.meshgrid(side, side, [0.0], indexing='ij'), axis=-1).reshape(-1, 3)
+    jitter = np.random.default_rng(0).uniform(-threshold * 0.25, threshold * 0.25, grid.shape)
+    coords = np.concatenate([grid, grid + jitter]).astype(np.float32)
+
+    start = perf_counter()
+    targets = FindMergeTargets(coords, threshold)
+    elapsed = perf_counter() - start
+    print("Merge by Distance core: {} vertices, {} removed in {:.3f}s".format(len(coords), int((targets >= 0).sum()), elapsed))
+    return elapsed
 
 #endregion
 
@@ -93,97 +425,187 @@ def PurgeOrphanMaterialData():
 # Assign original material to all instances of a duplicate material
 # Example: Any object with "Material.001" assigned would have it replaced with "Material"
 #########################            
-def RemoveDuplicateMaterials():
-    global finalReport
-    
-    mats = bpy.data.materials
+def RemoveDuplicateMaterials(obj):
+    reassigned = RemapDuplicateMaterialFaces(obj, bpy.data.materials)
+    report.Add(obj.name, "RemoveDuplicateMaterials", reassigned)
 
-    # Loop through all selected objects.
-    for obj in objs:
-        # For each material slot on the selected object.
-        for slt in obj.material_slots:
-            # split the material name into different parts.
-            part = slt.name.rpartition('.')
-            # if part 2 is numeric (001, 002, etc) and part 0 (Yellow) exists in our materials list...
-            if part[2].isnumeric() and part[0] in mats:
-                # search for any faces using the duplicate material. ie. Yellow.001
-                faces = [x for x in obj.data.polygons if x.material_index == obj.material_slots.find(slt.name)]
-                # if we found any faces... 
-                if (len(faces) > 0):
-                    for f in faces:
-                        finalReport += "Re-assigned duplicated material faces to original material in {} \n".format(obj.name)
-                        # reassign to the original mat (Yellow)
-                        f.material_index = obj.material_slots.find(part[0])
-       
-#########################
-# Automatically remove materials from selected objects that aren't assigned to any faces
-#########################
-def RemoveUnusedMaterials(obj):
-    global finalReport
-    
-    count = len(obj.material_slots)
-    #print("Old Material Slot Count: {}".format(count))
-    bpy.context.view_layer.objects.active = obj
-    bpy.ops.object.material_slot_remove_unused()
-    newCount = len(obj.material_slots)
-    #print("New Material Slot Count: {}".format(newCount))
-    if (count != newCount):
-        finalReport += "Removed unused materials in {} \n".format(obj.name)
+#########################
+# Builds the slot remap table for one object. remap[i] is the slot that faces on slot i should use.
+# Example: slots [Yellow, Blue, Yellow.001] -> [0, 1, 0]
+#########################
+def BuildDuplicateMaterialRemap(obj, mats):
+    slotNames = [slt.name for slt in obj.material_slots]
+    remap = np.arange(len(slotNames), dtype=np.int32)
+
+    for i, name in enumerate(slotNames):
+        # split the material name into different parts.
+        part = name.rpartition('.')
+        # if part 2 is numeric (001, 002, etc) and part 0 (Yellow) exists in our materials list...
+        if part[2].isnumeric() and part[0] in mats:
+            # ...and the object actually has a slot for the original material (Yellow).
+            original = obj.material_slots.find(part[0])
+            if original >= 0:
+                remap[i] = original
+
+    # Follow chains like Yellow.001.002 -> Yellow.001 -> Yellow down to the last slot.
+    for _ in range(len(remap)):
+        chained = remap[remap]
+        if np.array_equal(chained, remap):
+            break
+        remap = chained
+
+    return remap
 
 #########################
-# Remove ALL Empty(unnamed) Material Slots from Selected Objects
-# Example: Unnamed material slots are removed from all selected objects and only the named materials remain. 
+# Re-assigns the faces of one object from duplicate material slots to the original slot in one bulk pass.
+# Returns the number of faces that changed.
 #########################
-def RemoveEmptyMaterialSlots(obj):
-    global finalReport
-    
-    for x in obj.material_slots:
-        if x.name == "":
-            bpy.context.view_layer.objects.active = obj
-            obj.active_material_index = x.slot_index
-            bpy.ops.object.material_slot_remove()
-            finalReport += "Removed empty materials in {} \n".format(obj.name)
-
-#########################
-# Re-order Materials by Name to Alphabetical Order
-# Example: BEFORE: blue, white, red, green, black. AFTER: black, blue, green, red, white
-#########################                 
-def ApplyAlphabeticalOrderToMaterials(obj):
-    mats = [mat.name for mat in obj.material_slots]
-    mats.sort()
-
-    for i, mat_name in enumerate(mats):
-        # set active material slot to end slot
-        obj.active_material_index = len(obj.material_slots)-1
-        while obj.active_material.name != mat_name:
-            obj.active_material_index -=1
-        while obj.active_material_index > i:
-            bpy.ops.object.material_slot_move(direction='UP')
+def RemapDuplicateMaterialFaces(obj, mats):
+    polygons = obj.data.polygons
+    if len(polygons) == 0 or len(obj.material_slots) == 0:
+        return 0
+
+    remap = BuildDuplicateMaterialRemap(obj, mats)
+    if np.array_equal(remap, np.arange(len(remap))):
+        return 0
+
+    indices = np.empty(len(polygons), dtype=np.int32)
+    polygons.foreach_get("material_index", indices)
+    # Faces pointing past the last slot are left alone, same as before.
+    valid = indices < len(remap)
+    remapped = indices.copy()
+    remapped[valid] = remap[indices[valid]]
+
+    changed = int(np.count_nonzero(remapped != indices))
+    if changed > 0:
+        polygons.foreach_set("material_index", remapped)
+        obj.data.update()
+    return changed
+
+#########################
+# Works out the final material slot list for one object without touching bpy.
+# slotKeys holds one hashable key per slot (the material, or None for an empty slot), slotNames the
+# names used for sorting and used the number of faces on each slot.
+# Returns (finalSlots, remap): the old slot index for every slot that survives, in its new order, and
+# remap[old slot] -> new slot for the polygon material_index array.
+# Mirrors the old operator chain: unused slots go first, faces on a removed empty slot fall back to the
+# slot above it (like material_slot_remove), slots sharing a material collapse into the first one and
+# the rest is sorted by name.
+#########################
+def PlanMaterialSlotCompaction(slotKeys, slotNames, used, removeUnused = True, removeEmpty = True, sortAlphabetically = True):
+    count = len(slotKeys)
+    kept = np.ones(count, dtype=bool)
+    if removeUnused:
+        kept &= np.asarray(used) > 0
+    if removeEmpty:
+        kept &= np.array([key is not None for key in slotKeys], dtype=bool)
+
+    keptSlots = np.flatnonzero(kept)
+    if len(keptSlots) == 0:
+        return [], np.zeros(count, dtype=np.int32)
+
+    # Every removed slot hands its faces to the closest kept slot above it, or the first kept slot.
+    below = np.searchsorted(keptSlots, np.arange(count), side='right') - 1
+    owner = keptSlots[np.maximum(below, 0)]
+
+    # Slots that share a material collapse into the first of them.
+    first = {}
+    for i in keptSlots.tolist():
+        first.setdefault(slotKeys[i], i)
+    owner = np.array([first[slotKeys[i]] for i in owner.tolist()], dtype=np.int64)
+
+    finalSlots = list(first.values())
+    if sortAlphabetically:
+        finalSlots.sort(key=lambda i: slotNames[i])
+
+    newIndex = np.zeros(count, dtype=np.int32)
+    newIndex[finalSlots] = np.arange(len(finalSlots), dtype=np.int32)
+    return finalSlots, newIndex[owner]
+
+#########################
+# Removes unused and empty material slots, merges slots sharing a material and sorts the rest
+# alphabetically in a single pass. The polygon material_index array is remapped in one vectorized
+# lookup and the slots are rebuilt directly, so there are no operators, no active object changes and
+# no context overrides. Safe to run on thousands of objects in background mode.
+# Example: BEFORE: white, <empty>, red, blue (unused), red. AFTER: red, white
+#########################
+def CompactMaterialSlots(obj, removeUnused = True, removeEmpty = True, sortAlphabetically = True):
+    slots = obj.material_slots
+    count = len(slots)
+    if count == 0:
+        return
+
+    mesh = obj.data
+    polygons = mesh.polygons
+    indices = np.empty(len(polygons), dtype=np.int32)
+    polygons.foreach_get("material_index", indices)
+    # Blender draws faces past the last slot with the last slot, so count them there.
+    np.clip(indices, 0, count - 1, out=indices)
+    used = np.bincount(indices, minlength=count)
+
+    slotKeys = [slt.material for slt in slots]
+    slotNames = [slt.name for slt in slots]
+    slotLinks = [slt.link for slt in slots]
+    finalSlots, remap = PlanMaterialSlotCompaction(slotKeys, slotNames, used, removeUnused, removeEmpty, sortAlphabetically)
+    if finalSlots == list(range(count)):
+        return
+
+    # Object linked slots live on the object, so rebuilding the mesh list would scramble them for the
+    # other users of a shared mesh.
+    if mesh.users > 1 and 'OBJECT' in slotLinks:
+        report.Add(obj.name, "SkippedSlotCompaction")
+        return
+
+    # Object linked slots keep whatever material the mesh had underneath them.
+    dataMaterials = list(mesh.materials)
+    mesh.materials.clear()
+    for i in finalSlots:
+        mesh.materials.append(dataMaterials[i])
+    for newSlot, i in enumerate(finalSlots):
+        slots[newSlot].link = slotLinks[i]
+        slots[newSlot].material = slotKeys[i]
+
+    if len(polygons) > 0:
+        polygons.foreach_set("material_index", remap[indices])
+    mesh.update()
+
+    if removeUnused:
+        report.Add(obj.name, "RemoveUnusedMaterials", int(np.count_nonzero(used == 0)))
+    if removeEmpty:
+        keptEmpty = [i for i in range(count) if slotKeys[i] is None and (used[i] > 0 or not removeUnused)]
+        report.Add(obj.name, "RemoveEmptyMaterialSlots", len(keptEmpty))
 
 #########################
 # Merge vertices based on their proximity to optimize total vert count.
+# Reads the vertex coordinates in bulk, finds the weld map with FindMergeTargets and welds
+# through bmesh, so we never have to enter edit mode or touch the selection.
 #########################                
-def MergeByDistance(obj):
-    global finalReport
-    global totalVertsRemoved
-    mergeByDistanceThreshold = 0.0001
-    
+def MergeByDistance(obj, mergeByDistanceThreshold = 0.0001):
+    mesh = obj.data
     # Cache a quick reference to the current vert count so we can compare later.
-    oldVertCount = len(obj.data.vertices);
-    
-    # Remove Doubles (Merge By Distance)
-    bpy.ops.object.select_all(action='DESELECT') # deselect all object
-    bpy.context.view_layer.objects.active = obj
-    bpy.ops.object.editmode_toggle()
-    bpy.ops.mesh.select_all(action='SELECT')
-    bpy.ops.mesh.remove_doubles(threshold = mergeByDistanceThreshold)
-    bpy.ops.object.editmode_toggle()
+    oldVertCount = len(mesh.vertices)
+    if oldVertCount == 0:
+        return
+
+    coords = np.empty(oldVertCount * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", coords)
+    targets = FindMergeTargets(coords.reshape(-1, 3), mergeByDistanceThreshold)
+    doubles = np.flatnonzero(targets >= 0)
+
+    # Nothing to weld, don't pay for a bmesh round trip.
+    if len(doubles) > 0:
+        bm = bmesh.new()
+        bm.from_mesh(mesh)
+        bm.verts.ensure_lookup_table()
+        verts = bm.verts
+        targetmap = {verts[int(i)]: verts[int(targets[i])] for i in doubles}
+        bmesh.ops.weld_verts(bm, targetmap=targetmap)
+        bm.to_mesh(mesh)
+        bm.free()
+        mesh.update()
     
-    newVertCount = len(obj.data.vertices);
-    vertCountDifference = oldVertCount - newVertCount;
-    totalVertsRemoved += vertCountDifference;
-    if (oldVertCount != newVertCount):
-        finalReport += "Merge by Distance removed {difference} vertices in {name} \n".format(name=obj.name, difference=vertCountDifference)
+    newVertCount = len(mesh.vertices)
+    report.Add(obj.name, "MergeByDistance", oldVertCount - newVertCount)
 
 #########################
 # Remove any objects that have 0 vertices from the scene.
@@ -194,39 +616,353 @@ def RemoveZeroVertObjectsFromScene():
     empty_meshobs = [o for o in scene.objects
                     if o.type == 'MESH'
                     and not o.data.vertices]
+    report.Add("", "RemoveZeroVertObjectsFromScene", len(empty_meshobs))
                  
     while empty_meshobs:
         bpy.data.objects.remove(empty_meshobs.pop()) 
 
 #endregion
 
+#region Benchmarks
+#########################
+# Compares the old per-face RemoveDuplicateMaterials loop with the bulk remap on a throw-away grid mesh
+# with faceCount faces spread over "Yellow" and "Yellow.001". Not called by the optimization run.
+# The mesh, object and benchmark materials are removed again afterwards.
+#########################
+def BenchmarkRemoveDuplicateMaterials(faceCount = 1000000):
+    side = int(faceCount ** 0.5)
+    mats = bpy.data.materials
+    original = mats.new("BenchmarkYellow")
+    duplicate = mats.new("BenchmarkYellow.001")
+
+    mesh = bpy.data.meshes.new("BenchmarkDuplicateMaterials")
+    verts = [(x, y, 0.0) for x in range(side + 1) for y in range(side + 1)]
+    faces = [(x * (side + 1) + y, (x + 1) * (side + 1) + y, (x + 1) * (side + 1) + y + 1, x * (side + 1) + y + 1) for x in range(side) for y in range(side)]
+    mesh.from_pydata(verts, [], faces)
+    obj = bpy.data.objects.new("BenchmarkDuplicateMaterials", mesh)
+    mesh.materials.append(original)
+    mesh.materials.append(duplicate)
+
+    startIndices = np.tile(np.array([0, 1], dtype=np.int32), len(mesh.polygons) // 2 + 1)[:len(mesh.polygons)]
+
+    # Old path: one list comprehension and one report line per face.
+    mesh.polygons.foreach_set("material_index", startIndices)
+    report = ""
+    start = perf_counter()
+    for slt in obj.material_slots:
+        part = slt.name.rpartition('.')
+        if part[2].isnumeric() and part[0] in mats:
+            faces = [x for x in obj.data.polygons if x.material_index == obj.material_slots.find(slt.name)]
+            for f in faces:
+                report += "Re-assigned duplicated material faces to original material in {} \n".format(obj.name)
+                f.material_index = obj.material_slots.find(part[0])
+    oldTime = perf_counter() - start
+
+    # New path: one foreach_get, one lookup, one foreach_set.
+    mesh.polygons.foreach_set("material_index", startIndices)
+    start = perf_counter()
+    reassigned = RemapDuplicateMaterialFaces(obj, mats)
+    newTime = perf_counter() - start
+
+    print("RemoveDuplicateMaterials on {} faces ({} re-assigned)".format(len(mesh.polygons), reassigned))
+    print("Per-face loop: {:.3f}s ({} report characters)".format(oldTime, len(report)))
+    print("Bulk remap: {:.3f}s ({:.1f}x faster)".format(newTime, oldTime / max(newTime, 1e-9)))
+
+    bpy.data.objects.remove(obj)
+    bpy.data.meshes.remove(mesh)
+    mats.remove(original)
+    mats.remove(duplicate)
+    return oldTime, newTime
+
+#endregion
+
+#region Pipeline
+#########################
+# Cheap checks that tell the pipeline runner a pass has nothing to do, so it can skip it entirely.
+# Per-object checks take the object plus the pass parameters, scene checks only the parameters.
+#########################
+def NeedsDuplicateMaterialRemap(obj):
+    remap = BuildDuplicateMaterialRemap(obj, bpy.data.materials)
+    return not np.array_equal(remap, np.arange(len(remap)))
+
+def NeedsMaterialSlotCompaction(obj, removeUnused = True, removeEmpty = True, sortAlphabetically = True):
+    slots = obj.material_slots
+    if len(slots) == 0:
+        return False
+    names = [slt.name for slt in slots]
+    if removeEmpty and "" in names:
+        return True
+    if sortAlphabetically and names != sorted(names):
+        return True
+    materials = [slt.material for slt in slots]
+    if len(set(materials)) != len(materials):
+        return True
+    if removeUnused:
+        polygons = obj.data.polygons
+        indices = np.empty(len(polygons), dtype=np.int32)
+        polygons.foreach_get("material_index", indices)
+        np.clip(indices, 0, len(slots) - 1, out=indices)
+        return len(np.unique(indices)) != len(slots)
+    return False
+
+def HasOrphanMaterials():
+    return any(block.users == 0 for block in bpy.data.materials)
+
+#########################
+# Every pass a pipeline can use: name -> (function, precondition or None, runs once per object).
+#########################
+PIPELINE_PASSES = {
+    "RemoveDuplicateMaterials": (RemoveDuplicateMaterials, NeedsDuplicateMaterialRemap, True),
+    "CompactMaterialSlots": (CompactMaterialSlots, NeedsMaterialSlotCompaction, True),
+    "MergeByDistance": (MergeByDistance, None, True),
+    "PurgeOrphanMaterialData": (PurgeOrphanMaterialData, HasOrphanMaterials, False),
+    "RemoveZeroVertObjectsFromScene": (RemoveZeroVertObjectsFromScene, None, False),
+}
+
+# Pipeline step keys that are handled by the runner instead of being passed on to the pass function.
+PIPELINE_STEP_KEYS = ("pass", "enabled", "include", "exclude")
+
+#########################
+# The passes the script has always run, in the same order. A pipeline file uses the same layout:
+#   "objects": include/exclude name patterns (fnmatch, ie. "NavMesh*") applied before any pass runs.
+#   "passes": run in order. "enabled": false turns a pass off, "include"/"exclude" filter the objects
+#             for that pass only and every other key is a parameter of the pass function.
+#########################
+DEFAULT_PIPELINE = {
+    "objects": {"include": ["*"], "exclude": []},
+    "passes": [
+        {"pass": "RemoveDuplicateMaterials"},
+        {"pass": "CompactMaterialSlots", "removeUnused": True, "removeEmpty": True, "sortAlphabetically": True},
+        {"pass": "MergeByDistance", "mergeByDistanceThreshold": 0.0001},
+        {"pass": "PurgeOrphanMaterialData"},
+        {"pass": "RemoveZeroVertObjectsFromScene"},
+    ],
+}
+
+#########################
+# Reads a pipeline definition from a .json or .toml file (.toml needs Python 3.11+ or tomli).
+#########################
+def LoadPipeline(filepath):
+    if filepath.lower().endswith(".toml"):
+        # tomllib is only in Python 3.11+ (Blender 4.1+), older Blenders need the tomli package installed
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise ValueError("Reading '{}' needs Python 3.11+ or the tomli package, this Blender runs Python {}.{}. Use a .json pipeline instead.".format(filepath, *sys.version_info[:2]))
+        with open(filepath, "rb") as f:
+            return tomllib.load(f)
+    with open(filepath) as f:
+        return json.load(f)
+
+#########################
+# Makes sure every pass exists and only gets parameters its function accepts, before anything runs.
+#########################
+def ValidatePipeline(pipeline):
+    for step in pipeline.get("passes", []):
+        name = step.get("pass")
+        if name not in PIPELINE_PASSES:
+            raise ValueError("Unknown pass '{}' in pipeline. Known passes: {}".format(name, ", ".join(PIPELINE_PASSES)))
+        function = PIPELINE_PASSES[name][0]
+        accepted = inspect.signature(function).parameters
+        for key in step:
+            if key not in PIPELINE_STEP_KEYS and key not in accepted:
+                raise ValueError("Pass '{}' has no parameter '{}'".format(name, key))
+
+#########################
+# Keeps the objects that match the include patterns and none of the exclude patterns. Objects removed by
+# an earlier pass are dropped too.
+#########################
+def FilterObjects(objects, filters):
+    include = filters.get("include", ["*"])
+    exclude = filters.get("exclude", [])
+    filtered = []
+    for obj in objects:
+        try:
+            name = obj.name
+        except ReferenceError:
+            continue
+        if any(fnmatch.fnmatchcase(name, pattern) for pattern in include) and not any(fnmatch.fnmatchcase(name, pattern) for pattern in exclude):
+            filtered.append(obj)
+    return filtered
+
+#endregion
+
+#region Cache
+#########################
+# Remembers which meshes are already optimized, keyed on a hash of their content and the pipeline config.
+# Stored as JSON ({hash: last time it was seen}) beside the .blend file or in cacheDir, and trimmed to the
+# maxEntries most recently seen meshes when saved.
+#########################
+class OptimizationCache:
+    def __init__(self, blendFile, cacheDir = "", maxEntries = CACHE_MAX_ENTRIES):
+        if cacheDir:
+            # One cache file per .blend so parallel batch workers never write the same file.
+            pathHash = hashlib.blake2b(os.path.abspath(blendFile).encode(), digest_size=8).hexdigest()
+            self.filepath = os.path.join(cacheDir, "{}-{}.optcache.json".format(os.path.basename(blendFile), pathHash))
+        else:
+            self.filepath = blendFile + ".optcache.json"
+        self.maxEntries = maxEntries
+        self.entries = {}
+
+    def Load(self):
+        if os.path.isfile(self.filepath):
+            try:
+                with open(self.filepath) as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                # A broken cache only costs us a full run.
+                self.entries = {}
+        return self
+
+    def Save(self):
+        if len(self.entries) > self.maxEntries:
+            newest = sorted(self.entries.items(), key=lambda item: -item[1])[:self.maxEntries]
+            self.entries = dict(newest)
+        directory = os.path.dirname(self.filepath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.filepath, "w") as f:
+            json.dump(self.entries, f)
+
+    #########################
+    # Explicit invalidation: forget everything and delete the cache file.
+    #########################
+    def Clear(self):
+        self.entries = {}
+        if os.path.isfile(self.filepath):
+            os.remove(self.filepath)
+
+    def Contains(self, key):
+        if key in self.entries:
+            self.entries[key] = time()
+            return True
+        return False
+
+    def Add(self, key):
+        self.entries[key] = time()
+
+#########################
+# Digest of a pipeline config. Any change to passes, parameters or filters changes every cache key.
+#########################
+def PipelineDigest(pipeline):
+    return hashlib.blake2b(json.dumps(pipeline, sort_keys=True).encode(), digest_size=16).digest()
+
+#########################
+# Fast content hash of one object: vertex positions, face topology, face materials, material slots and
+# the object name (pipeline filters match on it), mixed with the pipeline digest.
+#########################
+def MeshContentHash(obj, pipelineDigest):
+    mesh = obj.data
+    h = hashlib.blake2b(pipelineDigest, digest_size=16)
+    h.update(obj.name.encode())
+    for collection, attribute, components in (("vertices", "co", 3), ("loops", "vertex_index", 1), ("polygons", "loop_start", 1), ("polygons", "material_index", 1)):
+        items = getattr(mesh, collection)
+        buffer = np.empty(len(items) * components, dtype=np.float32 if attribute == "co" else np.int32)
+        items.foreach_get(attribute, buffer)
+        h.update(len(items).to_bytes(8, "little"))
+        h.update(buffer.tobytes())
+    h.update("\0".join(slt.name for slt in obj.material_slots).encode())
+    return h.hexdigest()
+
+#endregion
+
 #region Init
 #########################
-# Runs a series of methods to optimize the blend file and selected objects.
+# Times one task for the report, and instruments it when profiling is on.
+#########################
+@contextmanager
+def RunTask(task, objects = (), objectName = ""):
+    with report.Timed(task, objectName):
+        if profiler:
+            with profiler.Pass(task, objects):
+                yield
+        else:
+            yield
+
+#########################
+# Runs the passes of a pipeline to optimize the blend file and selected objects.
+# Passes whose precondition says there is nothing to do are skipped.
 #########################       
-def RunOptimizations():
-    # Run through any pre-processors first.
+def RunOptimizations(pipeline = DEFAULT_PIPELINE, cache = None):
+    ValidatePipeline(pipeline)
+    pipelineObjs = FilterObjects(objs, pipeline.get("objects", {}))
+    report.objectCount = len(pipelineObjs)
+    if profiler:
+        profiler.Start()
+
     OutputReportPrefixToTerminal()   
-    RemoveDuplicateMaterials()
-
-    # Run the main loop through all selected objects and do work.
-    for obj in objs:
-            RemoveUnusedMaterials(obj)
-            RemoveEmptyMaterialSlots(obj)
-            ApplyAlphabeticalOrderToMaterials(obj)
-            MergeByDistance(obj)
-            
-    # Finalize by purging any orphan material data.
-    PurgeOrphanMaterialData()
-    RemoveZeroVertObjectsFromScene()
+
+    # Skip objects that are already optimized with this pipeline and haven't changed since.
+    if cache:
+        digest = PipelineDigest(pipeline)
+        with RunTask("OptimizationCache", pipelineObjs):
+            changed = [obj for obj in pipelineObjs if not cache.Contains(MeshContentHash(obj, digest))]
+        report.Skip("OptimizationCache", len(pipelineObjs) - len(changed))
+        pipelineObjs = changed
+
+    for step in pipeline.get("passes", []):
+        if not step.get("enabled", True):
+            continue
+        name = step["pass"]
+        function, precondition, perObject = PIPELINE_PASSES[name]
+        params = {key: value for key, value in step.items() if key not in PIPELINE_STEP_KEYS}
+
+        if perObject:
+            for obj in FilterObjects(pipelineObjs, step):
+                if precondition and not precondition(obj, **params):
+                    report.Skip(name)
+                    continue
+                with RunTask(name, [obj], obj.name):
+                    function(obj, **params)
+        elif precondition and not precondition(**params):
+            report.Skip(name)
+        else:
+            with RunTask(name, FilterObjects(pipelineObjs, step)):
+                function(**params)
+
+    if cache:
+        for obj in FilterObjects(pipelineObjs, {}):
+            cache.Add(MeshContentHash(obj, digest))
+
+    if profiler:
+        profiler.Stop()
+        profiler.PrintSummary()
+        profiler.Write(scriptArgs.profile_json)
+
+#########################
+# The optimization cache for this .blend file, or None when caching is off or the file was never saved.
+#########################
+def OpenOptimizationCache():
+    if not USE_CACHE or scriptArgs.no_cache or not bpy.data.filepath:
+        return None
+    cache = OptimizationCache(bpy.data.filepath, scriptArgs.cache_dir)
+    if scriptArgs.clear_cache:
+        cache.Clear()
+        return cache
+    return cache.Load()
 
 # If the user has not selected any objects, throw an error.
-if (len(bpy.context.selected_objects) <= 0):
-    ShowMessageBox("You must select at least one object in the scene.", "Automate Blender Scripts - Optimization Script", 'ERROR')
+if (not scriptArgs.all_objects and len(bpy.context.selected_objects) <= 0):
+    if bpy.app.background:
+        print("You must select at least one object in the scene, or pass --all-objects.")
+    else:
+        ShowMessageBox("You must select at least one object in the scene.", "Automate Blender Scripts - Optimization Script", 'ERROR')
 else:
-    ClearTerminal()
+    # There is no terminal of our own to clear in background mode.
+    if not bpy.app.background:
+        ClearTerminal()
     # GO GO TILE OPTIMIZATIONS!     
-    RunOptimizations()
+    cache = OpenOptimizationCache()
+    RunOptimizations(LoadPipeline(scriptArgs.pipeline) if scriptArgs.pipeline else DEFAULT_PIPELINE, cache)
     PrintFinalReport()
+    if cache:
+        cache.Save()
+
+    WriteReportFiles(scriptArgs.report_json, scriptArgs.report_csv)
+    if scriptArgs.save:
+        bpy.ops.wm.save_mainfile()
 
 #endregion
@@ -1,5 +1,11 @@
 import bpy
+import os
+import sys
+from contextlib import contextmanager, nullcontext
+import numpy as np
+from time import perf_counter
 from bpy.types import Operator, Panel
+from bpy_extras.io_utils import ExportHelper
 
 bl_info = {
     "name": "LOD Generator",
@@ -7,9 +13,42 @@ bl_info = {
     "category": "Object",
     "author": "Alex Knutson",
     "version": (1, 0),
-    "description": "Generate Level of Detail (LOD) objects for the selected mesh"
+    "description": "Generate Level of Detail (LOD) objects for the selected meshes"
 }
 
+# Optional per-pass profiling, see _PassProfiler.py. Only available when that file sits next to this one,
+# the add-on works the same without it.
+try:
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from _PassProfiler import PassProfiler
+except ImportError:
+    PassProfiler = None
+
+# Optional NumPy quadric decimator, see _QuadricDecimator.py. Without it only the DECIMATE modifier backend works.
+try:
+    import _QuadricDecimator
+except ImportError:
+    _QuadricDecimator = None
+
+# Set a path here to write per-pass timings, bpy.ops counts and vert/face counts as JSON after each operator.
+PROFILE_OUTPUT = ""
+
+def start_profiler(name):
+    if PassProfiler and PROFILE_OUTPUT:
+        return PassProfiler(name).Start()
+    return None
+
+def profiled_pass(profiler, name, objects):
+    if profiler is None:
+        return nullcontext()
+    return profiler.Pass(name, objects)
+
+def finish_profiler(profiler):
+    if profiler:
+        profiler.Stop()
+        profiler.PrintSummary()
+        profiler.Write(PROFILE_OUTPUT)
+
 class LODProperties(bpy.types.PropertyGroup):
     lod0_ratio: bpy.props.FloatProperty(
         name="LOD0 Decimation Ratio",
@@ -35,6 +74,453 @@ class LODProperties(bpy.types.PropertyGroup):
         min=0.0,
         max=1.0,
     )
+    batch_mode: bpy.props.EnumProperty(
+        name="Generate For",
+        items=(
+            ('ACTIVE', "Active Object", "Generate LODs for the active object"),
+            ('SELECTED', "Selected Meshes", "Generate LODs for every selected mesh"),
+            ('COLLECTION', "Collection", "Generate LODs for every mesh in a collection"),
+        ),
+        default='ACTIVE',
+    )
+    batch_collection: bpy.props.PointerProperty(
+        name="Collection",
+        type=bpy.types.Collection,
+    )
+    decimation_backend: bpy.props.EnumProperty(
+        name="Decimation",
+        items=(
+            ('MODIFIER', "Decimate Modifier", "Add a DECIMATE modifier to every LOD, applied by Apply LODs"),
+            ('QUADRIC', "Quadric (NumPy)", "Build the decimated LOD meshes directly with _QuadricDecimator.py"),
+        ),
+        default='MODIFIER',
+    )
+    ratio_mode: bpy.props.EnumProperty(
+        name="Ratios",
+        items=(
+            ('MANUAL', "Manual", "Use the four decimation ratios above"),
+            ('ERROR', "Geometric Error", "Decimate each LOD as far as it stays within a maximum surface deviation"),
+            ('SCREEN_SIZE', "Screen Size", "Decimate each LOD as far as its deviation stays below a pixel error at the size it is shown"),
+        ),
+        default='MANUAL',
+    )
+    max_error: bpy.props.FloatProperty(
+        name="LOD0 Max Error %",
+        description="Largest allowed surface deviation of LOD0, in percent of the bounding box diagonal",
+        default=0.5,
+        min=0.0,
+        max=100.0,
+    )
+    error_growth: bpy.props.FloatProperty(
+        name="Error Growth",
+        description="Every following LOD may deviate this many times more than the previous one",
+        default=2.0,
+        min=1.0,
+    )
+    screen_size: bpy.props.FloatProperty(
+        name="LOD0 Screen Size",
+        description="Fraction of the screen height the object covers when LOD0 is shown. Every following LOD is shown at half the size",
+        default=0.5,
+        min=0.001,
+        max=1.0,
+    )
+    screen_height: bpy.props.IntProperty(
+        name="Screen Height",
+        description="Vertical resolution in pixels the game is played at",
+        default=1080,
+        min=1,
+    )
+    pixel_error: bpy.props.FloatProperty(
+        name="Pixel Error",
+        description="Largest allowed surface deviation on screen, in pixels",
+        default=1.0,
+        min=0.0,
+    )
+    min_ratio: bpy.props.FloatProperty(
+        name="Min Ratio",
+        description="Automatic ratios never go below this",
+        default=0.02,
+        min=0.0,
+        max=1.0,
+    )
+    progressive: bpy.props.BoolProperty(
+        name="Progressive Chain",
+        description="Decimate every LOD from the previous one instead of from a full copy of the original mesh. "
+                    "The LODs are finished right away and need no Apply LODs step",
+        default=False,
+    )
+
+LOD_NAMES = ["_LOD0", "_LOD1", "_LOD2", "_LOD3"]
+
+def get_lod_source_objects(context, lod_props):
+    """Objects to generate LODs for, depending on the batch mode. LODs made by this add-on are skipped."""
+    if lod_props.batch_mode == 'SELECTED':
+        objects = [obj for obj in context.selected_objects if obj.type == 'MESH']
+    elif lod_props.batch_mode == 'COLLECTION':
+        collection = lod_props.batch_collection
+        objects = [obj for obj in collection.all_objects if obj.type == 'MESH'] if collection else []
+    else:
+        objects = [context.active_object] if context.active_object else []
+    return [obj for obj in objects if "lod_source" not in obj]
+
+def bounding_box_widths(objects):
+    """Local X width of every object's bounding box, computed for all objects at once."""
+    if not objects:
+        return np.zeros(0)
+    corners = np.array([obj.bound_box[:] for obj in objects], dtype=np.float64).reshape(len(objects), 8, 3)
+    return np.ptp(corners[:, :, 0], axis=1)
+
+def read_mesh_triangles(mesh):
+    """Vertex positions, triangles, and the source loops, polygon and material of every triangle of a mesh."""
+    mesh.calc_loop_triangles()
+    vertices = np.empty(len(mesh.vertices) * 3, dtype=np.float64)
+    mesh.vertices.foreach_get("co", vertices)
+    count = len(mesh.loop_triangles)
+    triangles = np.empty(count * 3, dtype=np.int64)
+    mesh.loop_triangles.foreach_get("vertices", triangles)
+    loops = np.empty(count * 3, dtype=np.int64)
+    mesh.loop_triangles.foreach_get("loops", loops)
+    polygons = np.empty(count, dtype=np.int64)
+    mesh.loop_triangles.foreach_get("polygon_index", polygons)
+    return vertices.reshape(-1, 3), triangles.reshape(-1, 3), loops.reshape(-1, 3), polygons
+
+def build_lod_mesh(source, name, vertices, triangles, loops, polygons):
+    """New triangle mesh from decimated arrays. Materials, smooth shading and UVs are carried over from source."""
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(len(vertices))
+    mesh.vertices.foreach_set("co", vertices.astype(np.float32).ravel())
+    mesh.loops.add(len(triangles) * 3)
+    mesh.loops.foreach_set("vertex_index", triangles.astype(np.int32).ravel())
+    mesh.polygons.add(len(triangles))
+    mesh.polygons.foreach_set("loop_start", np.arange(0, len(triangles) * 3, 3, dtype=np.int32))
+    if bpy.app.version < (4, 0, 0):
+        mesh.polygons.foreach_set("loop_total", np.full(len(triangles), 3, dtype=np.int32))
+
+    for material in source.materials:
+        mesh.materials.append(material)
+    for attribute in ("material_index", "use_smooth"):
+        values = np.empty(len(source.polygons), dtype=np.int32 if attribute == "material_index" else bool)
+        source.polygons.foreach_get(attribute, values)
+        mesh.polygons.foreach_set(attribute, values[polygons])
+    for source_layer in source.uv_layers:
+        uvs = np.empty(len(source.loops) * 2, dtype=np.float32)
+        source_layer.data.foreach_get("uv", uvs)
+        mesh.uv_layers.new(name=source_layer.name).data.foreach_set("uv", uvs.reshape(-1, 2)[loops.ravel()].ravel())
+
+    mesh.update(calc_edges=True)
+    return mesh
+
+def decimate_quadric(mesh, ratios, tolerances = None, min_ratio = 0.0):
+    """One LOD mesh per ratio, all cut from a single quadric decimation run. With tolerances the ratios are
+    chosen automatically from the same run. Returns the meshes and the ratios used."""
+    vertices, triangles, loops, polygons = read_mesh_triangles(mesh)
+    decimator = _QuadricDecimator.QuadricDecimator(vertices, triangles)
+    face_count = len(triangles)
+
+    def cut(ratio):
+        return decimator.Extract(max(1, int(round(face_count * ratio))))
+
+    if tolerances is None:
+        decimator.Run(max(1, int(round(face_count * min(ratios)))))
+    else:
+        decimator.Run(max(1, int(round(face_count * min_ratio))))
+        ratios = choose_lod_ratios(lambda ratio: cut(ratio)[:2], vertices, triangles, tolerances, min_ratio)
+
+    lod_meshes = []
+    for i, ratio in enumerate(ratios):
+        lod_vertices, lod_triangles, face_index = cut(ratio)
+        lod_meshes.append(build_lod_mesh(mesh, mesh.name.split(".")[0] + LOD_NAMES[i], lod_vertices, lod_triangles, loops[face_index], polygons[face_index]))
+    return lod_meshes, ratios
+
+def triangle_count(mesh):
+    mesh.calc_loop_triangles()
+    return len(mesh.loop_triangles)
+
+@contextmanager
+def decimate_helper(context, mesh):
+    """A bare object using mesh with only a DECIMATE modifier, linked to the scene while in use.
+    The source object's own modifiers are not baked into what it evaluates to."""
+    helper = bpy.data.objects.new("lod_decimate_helper", mesh)
+    context.scene.collection.objects.link(helper)
+    try:
+        yield helper, helper.modifiers.new("lod_decimate", 'DECIMATE')
+    finally:
+        bpy.data.objects.remove(helper)
+
+def bake_lod_meshes(context, obj, ratios, progressive = True):
+    """One mesh per ratio with the DECIMATE modifier already applied, without bpy.ops or mode switching.
+    Progressive makes every LOD from the previous one instead of the full mesh, so only the original and
+    the levels made so far are in memory, never four full copies."""
+    # Every level aims at its absolute ratio of the original, so rounding does not add up along the chain
+    original_triangles = triangle_count(obj.data)
+    previous_triangles = original_triangles
+    lod_meshes = []
+    with decimate_helper(context, obj.data) as (helper, decimate_mod):
+        for i, ratio in enumerate(ratios):
+            decimate_mod.ratio = min(1.0, ratio * original_triangles / max(1, previous_triangles))
+            depsgraph = context.evaluated_depsgraph_get()
+            mesh = bpy.data.meshes.new_from_object(helper.evaluated_get(depsgraph), preserve_all_data_layers=True, depsgraph=depsgraph)
+            mesh.name = obj.data.name.split(".")[0] + LOD_NAMES[i]
+            lod_meshes.append(mesh)
+            if progressive:
+                helper.data = mesh
+                previous_triangles = triangle_count(mesh)
+    return lod_meshes
+
+# Deviation is measured on at most this many points of each mesh
+MAX_DEVIATION_SAMPLES = 8000
+
+# Bisection steps per LOD when choosing ratios automatically
+AUTO_RATIO_STEPS = 7
+
+def sample_points(vertices, limit = MAX_DEVIATION_SAMPLES):
+    if len(vertices) <= limit:
+        return vertices
+    return vertices[np.linspace(0, len(vertices) - 1, limit).astype(np.int64)]
+
+# Most grid cells a triangle grid may register its triangles in, bigger cells are used past that
+DEVIATION_GRID_BUDGET = 4000000
+
+# Points tested against a triangle grid at once
+DEVIATION_CHUNK = 4096
+
+def point_triangle_distances(points, a, b, c):
+    """Distance from every point to the triangle (a, b, c) in the same row, all rows at once (the closest
+    point regions from Ericson's Real-Time Collision Detection, as NumPy masks)."""
+    ab = b - a
+    ac = c - a
+    ap = points - a
+    bp = points - b
+    cp = points - c
+    d1 = np.einsum('ij,ij->i', ab, ap)
+    d2 = np.einsum('ij,ij->i', ac, ap)
+    d3 = np.einsum('ij,ij->i', ab, bp)
+    d4 = np.einsum('ij,ij->i', ac, bp)
+    d5 = np.einsum('ij,ij->i', ab, cp)
+    d6 = np.einsum('ij,ij->i', ac, cp)
+    va = d3 * d6 - d5 * d4
+    vb = d5 * d2 - d1 * d6
+    vc = d1 * d4 - d3 * d2
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        denominator = va + vb + vc
+        closest = a + ab * (vb / denominator)[:, None] + ac * (vc / denominator)[:, None]
+        # Later regions win, in the reverse of Ericson's order
+        regions = (
+            ((va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0), lambda: b + (c - b) * ((d4 - d3) / ((d4 - d3) + (d5 - d6)))[:, None]),
+            ((vb <= 0) & (d2 >= 0) & (d6 <= 0), lambda: a + ac * (d2 / (d2 - d6))[:, None]),
+            ((d6 >= 0) & (d5 <= d6), lambda: c),
+            ((vc <= 0) & (d1 >= 0) & (d3 <= 0), lambda: a + ab * (d1 / (d1 - d3))[:, None]),
+            ((d3 >= 0) & (d4 <= d3), lambda: b),
+            ((d1 <= 0) & (d2 <= 0), lambda: a),
+        )
+        for mask, region in regions:
+            if mask.any():
+                closest = np.where(mask[:, None], region(), closest)
+        distances = np.linalg.norm(points - closest, axis=1)
+
+    # Degenerate triangles: the nearest corner bounds the distance
+    bad = ~np.isfinite(distances)
+    if bad.any():
+        distances[bad] = np.min([np.linalg.norm(points[bad] - corner[bad], axis=1) for corner in (a, b, c)], axis=0)
+    return distances
+
+class TriangleGrid:
+    """Uniform grid over a triangle mesh for one tolerance. Every triangle is registered in all cells its
+    bounding box, grown by the tolerance, overlaps. A triangle within the tolerance of a point is then always
+    registered in the point's own cell, so far() only measures the triangles of that one cell."""
+
+    def __init__(self, vertices, triangles, tolerance, budget = DEVIATION_GRID_BUDGET):
+        corners = vertices[triangles]
+        self.a, self.b, self.c = corners[:, 0], corners[:, 1], corners[:, 2]
+        low = corners.min(axis=1)
+        high = corners.max(axis=1)
+        # Cells about a triangle big keep the registrations per triangle and candidates per point low
+        cell = max(float(np.median((high - low).max(axis=1))) if len(triangles) else 0.0, float(np.linalg.norm(high.max(axis=0) - low.min(axis=0))) * 1e-6, 1e-12)
+        self.tolerance = tolerance
+        low -= tolerance
+        high += tolerance
+        self.origin = low.min(axis=0)
+        while True:
+            first = np.floor((low - self.origin) / cell).astype(np.int64)
+            spans = np.floor((high - self.origin) / cell).astype(np.int64) - first + 1
+            if np.prod(spans, axis=1).sum() <= budget:
+                break
+            cell *= 2.0
+        self.cell = cell
+        self.dims = np.floor((high.max(axis=0) - self.origin) / cell).astype(np.int64) + 1
+
+        # One entry per (triangle, overlapped cell), sorted by cell key
+        counts = np.prod(spans, axis=1)
+        owner = np.repeat(np.arange(len(triangles)), counts)
+        k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        sx, sy = spans[owner, 0], spans[owner, 1]
+        cells = first[owner] + np.stack((k % sx, (k // sx) % sy, k // (sx * sy)), axis=1)
+        keys = self.key(cells)
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.owner = owner[order]
+
+    def key(self, cells):
+        return (cells[:, 0] * self.dims[1] + cells[:, 1]) * self.dims[2] + cells[:, 2]
+
+    def far(self, points, stop = False):
+        """Indices of the points further than the grid's tolerance from the mesh. With stop, returns as soon
+        as there is one."""
+        found = []
+        for start in range(0, len(points), DEVIATION_CHUNK):
+            chunk = points[start:start + DEVIATION_CHUNK]
+            cells = np.floor((chunk - self.origin) / self.cell).astype(np.int64)
+            inside = np.all((cells >= 0) & (cells < self.dims), axis=1)
+            keys = self.key(np.where(inside[:, None], cells, 0))
+            first = np.searchsorted(self.keys, keys, side="left")
+            counts = np.where(inside, np.searchsorted(self.keys, keys, side="right") - first, 0)
+
+            # Candidate (point, triangle) pairs, grouped by point
+            nearest = np.full(len(chunk), np.inf)
+            measured = counts > 0
+            if measured.any():
+                counts = counts[measured]
+                entries = np.repeat(first[measured], counts) + (np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts))
+                pair_points = np.repeat(np.flatnonzero(measured), counts)
+                triangles = self.owner[entries]
+                distances = point_triangle_distances(chunk[pair_points], self.a[triangles], self.b[triangles], self.c[triangles])
+                nearest[measured] = np.minimum.reduceat(distances, np.cumsum(counts) - counts)
+            outside = np.flatnonzero(nearest > self.tolerance) + start
+            if len(outside):
+                found.append(outside)
+                if stop:
+                    break
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+# Deviation is first tested against this fraction of the tolerance. Most points of a usable LOD are that
+# close, and the small grow keeps the candidate triangles per point few; only the rest is tested again.
+DEVIATION_FIRST_PASS = 0.125
+
+def within_deviation(original_grid, original_points, vertices, triangles, tolerance):
+    """Two-sided Hausdorff-style test between the original and a decimated mesh: no original point lies
+    further than tolerance from the decimated surface, and no decimated vertex from the original surface.
+    original_grid(tolerance) returns the TriangleGrid of the original mesh for that tolerance."""
+    if len(triangles) == 0:
+        return False
+    grids = {}
+
+    def decimated_grid(grid_tolerance):
+        if grid_tolerance not in grids:
+            grids[grid_tolerance] = TriangleGrid(vertices, triangles, grid_tolerance)
+        return grids[grid_tolerance]
+
+    for grid, points in ((decimated_grid, original_points), (original_grid, sample_points(vertices))):
+        points = points[grid(tolerance * DEVIATION_FIRST_PASS).far(points)]
+        if len(points) and len(grid(tolerance).far(points, stop=True)):
+            return False
+    return True
+
+def lod_tolerances(lod_props, mesh):
+    """Largest allowed deviation of every LOD in mesh units, or None when the ratios are set by hand."""
+    if lod_props.ratio_mode == 'MANUAL' or len(mesh.vertices) == 0:
+        return None
+    vertices = np.empty(len(mesh.vertices) * 3, dtype=np.float64)
+    mesh.vertices.foreach_get("co", vertices)
+    diagonal = float(np.linalg.norm(np.ptp(vertices.reshape(-1, 3), axis=0)))
+    if lod_props.ratio_mode == 'ERROR':
+        return [diagonal * lod_props.max_error / 100.0 * lod_props.error_growth ** i for i in range(len(LOD_NAMES))]
+    # One pixel covers diagonal / (pixels the object is tall on screen) units, every LOD is shown at half the size
+    return [diagonal * lod_props.pixel_error / (lod_props.screen_height * lod_props.screen_size * 0.5 ** i) for i in range(len(LOD_NAMES))]
+
+def choose_lod_ratios(decimate, vertices, triangles, tolerances, min_ratio, steps = AUTO_RATIO_STEPS):
+    """Smallest ratio for every LOD whose deviation stays within its tolerance, found by bisection.
+    decimate(ratio) returns the (vertices, triangles) of the mesh decimated to that ratio. Every LOD is at
+    most as detailed as the one before it."""
+    original_points = sample_points(vertices)
+    original_grids = {}
+
+    def original_grid(tolerance):
+        if tolerance not in original_grids:
+            original_grids[tolerance] = TriangleGrid(vertices, triangles, tolerance)
+        return original_grids[tolerance]
+
+    def within(ratio, tolerance):
+        return within_deviation(original_grid, original_points, *decimate(ratio), tolerance)
+
+    ratios = []
+    high = 1.0
+    for tolerance in tolerances:
+        low = min(min_ratio, high)
+        if within(low, tolerance):
+            high = low
+        else:
+            for _ in range(steps):
+                middle = 0.5 * (low + high)
+                if within(middle, tolerance):
+                    high = middle
+                else:
+                    low = middle
+        ratios.append(high)
+    return ratios
+
+def choose_modifier_ratios(context, obj, tolerances, min_ratio):
+    """choose_lod_ratios with the DECIMATE modifier doing the decimation."""
+    vertices, triangles = read_mesh_triangles(obj.data)[:2]
+    with decimate_helper(context, obj.data) as (helper, decimate_mod):
+        def decimate(ratio):
+            decimate_mod.ratio = ratio
+            evaluated = helper.evaluated_get(context.evaluated_depsgraph_get())
+            try:
+                return read_mesh_triangles(evaluated.to_mesh())[:2]
+            finally:
+                evaluated.to_mesh_clear()
+        return choose_lod_ratios(decimate, vertices, triangles, tolerances, min_ratio)
+
+def make_lod_meshes(context, lod_props, obj, bake):
+    """Decimated meshes for every LOD of obj and the ratios used. Returns None instead of meshes when the
+    modifier backend should add DECIMATE modifiers rather than bake (bake is False and not progressive)."""
+    ratios = [lod_props.lod0_ratio, lod_props.lod1_ratio, lod_props.lod2_ratio, lod_props.lod3_ratio]
+    # Automatic ratios decimate each LOD as far as its tolerance allows
+    tolerances = lod_tolerances(lod_props, obj.data)
+    # The quadric backend cuts all levels from one nested collapse sequence, so it is progressive already
+    if lod_props.decimation_backend == 'QUADRIC':
+        return decimate_quadric(obj.data, ratios, tolerances, lod_props.min_ratio)
+    if tolerances:
+        ratios = choose_modifier_ratios(context, obj, tolerances, lod_props.min_ratio)
+    if bake or lod_props.progressive:
+        return bake_lod_meshes(context, obj, ratios, lod_props.progressive), ratios
+    return None, ratios
+
+def benchmark_decimation_backends(obj, ratios = (0.9, 0.75, 0.5, 0.2)):
+    """Times the DECIMATE modifier, the progressive chain and the quadric backend on obj. Nothing is left behind in the file.
+    Run it from the Python console: benchmark_decimation_backends(bpy.context.active_object)"""
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    modifier_faces = []
+    start = perf_counter()
+    for ratio in ratios:
+        decimate_mod = obj.modifiers.new("benchmark_decimate", 'DECIMATE')
+        decimate_mod.ratio = ratio
+        depsgraph.update()
+        evaluated = obj.evaluated_get(depsgraph)
+        modifier_faces.append(len(evaluated.to_mesh().polygons))
+        evaluated.to_mesh_clear()
+        obj.modifiers.remove(decimate_mod)
+    modifier_seconds = perf_counter() - start
+
+    start = perf_counter()
+    lod_meshes = bake_lod_meshes(bpy.context, obj, ratios)
+    progressive_seconds = perf_counter() - start
+    progressive_faces = [len(mesh.polygons) for mesh in lod_meshes]
+    for mesh in lod_meshes:
+        bpy.data.meshes.remove(mesh)
+
+    start = perf_counter()
+    lod_meshes = decimate_quadric(obj.data, ratios)[0]
+    quadric_seconds = perf_counter() - start
+    quadric_faces = [len(mesh.polygons) for mesh in lod_meshes]
+    for mesh in lod_meshes:
+        bpy.data.meshes.remove(mesh)
+
+    print("Decimate modifier: {:.3f}s faces {}".format(modifier_seconds, modifier_faces))
+    print("Progressive chain: {:.3f}s faces {}".format(progressive_seconds, progressive_faces))
+    print("Quadric (NumPy):   {:.3f}s triangles {}".format(quadric_seconds, quadric_faces))
+    return modifier_seconds, progressive_seconds, quadric_seconds
 
 class OBJECT_OT_generate_lods(Operator):
     bl_idname = "object.generate_lods"
@@ -42,20 +528,17 @@ class OBJECT_OT_generate_lods(Operator):
     bl_options = {'REGISTER', 'UNDO'}
 
     def execute(self, context):
-        obj = context.active_object
          # Get the LODProperties
         lod_props = context.scene.lod_properties
+        objects = get_lod_source_objects(context, lod_props)
 
-        if obj is None:
+        if not objects:
             self.report({'WARNING'}, "No object selected")
             return {'CANCELLED'}
 
-        # Get the collections that the original object belongs to
-        original_collections = obj.users_collection
-
-        # Use the ratios from LODProperties
-        decimate_ratios = [lod_props.lod0_ratio, lod_props.lod1_ratio, lod_props.lod2_ratio, lod_props.lod3_ratio]
-        lod_names = ["_LOD0", "_LOD1", "_LOD2", "_LOD3"]
+        if lod_props.decimation_backend == 'QUADRIC' and _QuadricDecimator is None:
+            self.report({'ERROR'}, "_QuadricDecimator.py was not found next to the add-on")
+            return {'CANCELLED'}
 
         ##############################################
         # Optional - Create a new "LOD" collection in the root and make that the parent for the LOD objects.
@@ -66,40 +549,198 @@ class OBJECT_OT_generate_lods(Operator):
         #     lod_collection = bpy.data.collections["LOD"]
         ##############################################
 
-        original_position = obj.location.copy()
+        # Calculate the separation distance as a percentage of the width of every object's bounding box
+        separation_distances = 1.1 * bounding_box_widths(objects)  # 10% of the width
 
-        # Calculate the width of the object's bounding box
-        bounding_box = obj.bound_box
-        width = max([co[0] for co in bounding_box]) - min([co[0] for co in bounding_box])
+        # New objects are linked per collection once everything is created. The Python API has no bulk link, and
+        # a link call costs a few microseconds per object, so they are linked one call at a time.
+        links = {}
 
-        # Calculate the separation distance as a percentage of the width
-        separation_distance = 1.1 * width  # 10% of the width
+        wm = context.window_manager
+        wm.progress_begin(0, len(objects))
+        profiler = start_profiler("generate_lods")
+        with profiled_pass(profiler, "generate_lods", objects):
+            for n, obj in enumerate(objects):
+                original_position = obj.location.copy()
+                # apply_lods moves every object back to where its source was
+                obj["lod_original_position"] = original_position[:]
 
-        for i, ratio in enumerate(decimate_ratios):
-            new_obj = obj.copy()
-            new_obj.data = obj.data.copy()
-            new_obj.animation_data_clear()
+                lod_meshes, ratios = make_lod_meshes(context, lod_props, obj, bake=False)
+                obj["lod_ratios"] = [round(ratio, 4) for ratio in ratios]
 
-            # Remove any ".001", ".002" from the object name
-            normalizedObjectName = new_obj.name.split(".")[0]
-            new_obj.name = normalizedObjectName + lod_names[i]
+                for i, ratio in enumerate(ratios):
+                    new_obj = obj.copy()
+                    new_obj.data = lod_meshes[i] if lod_meshes else obj.data.copy()
+                    new_obj.animation_data_clear()
+                    new_obj["lod_source"] = obj.name
 
-            decimate_mod = new_obj.modifiers.new(new_obj.name + "_decimate", 'DECIMATE')
-            decimate_mod.ratio = ratio
+                    # Remove any ".001", ".002" from the object name
+                    normalizedObjectName = new_obj.name.split(".")[0]
+                    new_obj.name = normalizedObjectName + LOD_NAMES[i]
 
-            # Link the new object to the same collections as the original object
-            for collection in original_collections:
-                collection.objects.link(new_obj)
+                    # Quadric and progressive LODs are decimated already, Apply LODs only moves them back
+                    if lod_meshes is None:
+                        decimate_mod = new_obj.modifiers.new(new_obj.name + "_decimate", 'DECIMATE')
+                        decimate_mod.ratio = ratio
 
-            # Adjust the translation to be a percentage of the width of the object
-            new_obj.location.x = original_position.x + (i + 1) * separation_distance  
+                    # Link the new object to the same collections as the original object
+                    for collection in obj.users_collection:
+                        links.setdefault(collection, []).append(new_obj)
 
-        context.scene["lod_original_position"] = original_position
+                    # Adjust the translation to be a percentage of the width of the object
+                    new_obj.location.x = original_position.x + (i + 1) * separation_distances[n]
 
+                wm.progress_update(n)
+
+            for collection, new_objects in links.items():
+                link = collection.objects.link
+                for new_obj in new_objects:
+                    link(new_obj)
+        finish_profiler(profiler)
+        wm.progress_end()
+
+        context.scene["lod_original_position"] = objects[-1].location.copy()
+
+        self.report({'INFO'}, "Generated LODs for {} objects".format(len(objects)))
         return {'FINISHED'}
 
 
 
+class OBJECT_OT_export_lod_groups(Operator, ExportHelper):
+    """Generate the LODs in memory and export them as LOD groups to one Unity FBX"""
+    bl_idname = "object.export_lod_groups"
+    bl_label = "Generate + Export Unity FBX"
+    bl_options = {'REGISTER'}
+
+    filename_ext = ".fbx"
+
+    filter_glob: bpy.props.StringProperty(
+        default="*.fbx",
+        options={'HIDDEN'},
+    )
+
+    keep_in_scene: bpy.props.BoolProperty(
+        name="Keep LOD Groups",
+        description="Leave the exported LOD groups in the scene instead of removing them after the export",
+        default=False,
+    )
+
+    def execute(self, context):
+        lod_props = context.scene.lod_properties
+        objects = get_lod_source_objects(context, lod_props)
+
+        if not objects:
+            self.report({'WARNING'}, "No object selected")
+            return {'CANCELLED'}
+
+        if lod_props.decimation_backend == 'QUADRIC' and _QuadricDecimator is None:
+            self.report({'ERROR'}, "_QuadricDecimator.py was not found next to the add-on")
+            return {'CANCELLED'}
+
+        # Registered by blender-to-unity-fbx-exporter.py
+        if not hasattr(bpy.types, "EXPORT_SCENE_OT_unity_fbx"):
+            self.report({'ERROR'}, "The Unity FBX exporter add-on is not enabled")
+            return {'CANCELLED'}
+
+        if context.mode != 'OBJECT':
+            bpy.ops.object.mode_set(mode='OBJECT')
+
+        # Every source object becomes an empty named after it with its LODs as children, the layout Unity's
+        # LODGroup setup expects: Tree > Tree_LOD0, Tree_LOD1, ... Unity matches the exact _LOD<n> suffix, so the
+        # objects that already own those names (the source objects, LODs from Generate LODs) are renamed
+        # while the groups are exported.
+        wanted_names = []
+        object_groups = [obj.name.split(".")[0] for obj in objects]
+        for group_name in object_groups:
+            wanted_names.append(group_name)
+            wanted_names.extend(group_name + lod_name for lod_name in LOD_NAMES)
+        if len(set(wanted_names)) != len(wanted_names):
+            self.report({'ERROR'}, "Several selected objects would export as the same LOD group")
+            return {'CANCELLED'}
+
+        # Everything is tracked by name, older exporter versions restore the scene through undo, which
+        # invalidates Python references to IDs
+        source_names = [obj.name for obj in objects]
+        active_name = context.view_layer.objects.active.name if context.view_layer.objects.active else None
+        renamed = []
+        for name in wanted_names:
+            owner = bpy.data.objects.get(name)
+            if owner is not None and owner.library is None:
+                owner.name = name + ".lod_export_original"
+                renamed.append((owner.name, name))
+
+        group_names = []
+        mesh_names = []
+        try:
+            profiler = start_profiler("export_lod_groups")
+            groups = []
+            with profiled_pass(profiler, "generate_lods", objects):
+                for obj, group_name in zip(objects, object_groups):
+                    lod_meshes, ratios = make_lod_meshes(context, lod_props, obj, bake=True)
+                    mesh_names.extend(mesh.name for mesh in lod_meshes)
+
+                    parent = bpy.data.objects.new(group_name, None)
+                    parent.matrix_world = obj.matrix_world.copy()
+                    context.scene.collection.objects.link(parent)
+                    groups.append(parent)
+                    group_names.append(parent.name)
+
+                    for i, mesh in enumerate(lod_meshes):
+                        lod_obj = bpy.data.objects.new(group_name + LOD_NAMES[i], mesh)
+                        lod_obj.parent = parent
+                        context.scene.collection.objects.link(lod_obj)
+                        groups.append(lod_obj)
+                        group_names.append(lod_obj.name)
+
+            wrong_names = [name for name in group_names if name not in wanted_names]
+            if wrong_names:
+                self.report({'ERROR'}, "LOD groups could not get their exact names: " + ", ".join(wrong_names))
+                return {'CANCELLED'}
+
+            # One export of just the LOD groups
+            for selected in context.selected_objects:
+                selected.select_set(False)
+            for group_obj in groups:
+                group_obj.select_set(True)
+            # The exporter moves the active object to the origin, which would move only the first group.
+            # No object is active, every group keeps its source's transform.
+            context.view_layer.objects.active = None
+            with profiled_pass(profiler, "export_unity_fbx", groups):
+                bpy.ops.export_scene.unity_fbx(filepath=self.filepath, selected_objects=True, active_collection=False, from_copy=True)
+            finish_profiler(profiler)
+        finally:
+            kept = []
+            for name in group_names:
+                group_obj = bpy.data.objects.get(name)
+                if group_obj is None:
+                    continue
+                if self.keep_in_scene:
+                    # Free the names for the originals, kept groups get Blender's .001 suffixes
+                    group_obj.name = name + ".lod_group"
+                    kept.append((group_obj, name))
+                else:
+                    bpy.data.objects.remove(group_obj)
+            if not self.keep_in_scene:
+                for name in mesh_names:
+                    mesh = bpy.data.meshes.get(name)
+                    if mesh and mesh.users == 0:
+                        bpy.data.meshes.remove(mesh)
+            for temp_name, name in renamed:
+                owner = bpy.data.objects.get(temp_name)
+                if owner is not None:
+                    owner.name = name
+            for group_obj, name in kept:
+                group_obj.name = name
+            context.view_layer.objects.active = bpy.data.objects.get(active_name) if active_name else None
+
+        for name in source_names:
+            obj = bpy.data.objects.get(name)
+            if obj:
+                obj.select_set(True)
+
+        self.report({'INFO'}, "Exported LOD groups for {} objects to {}".format(len(source_names), self.filepath))
+        return {'FINISHED'}
+
 class OBJECT_OT_apply_lods(Operator):
     bl_idname = "object.apply_lods"
     bl_label = "Apply LODs"
@@ -114,19 +755,23 @@ class OBJECT_OT_apply_lods(Operator):
 
         original_position = context.scene.get("lod_original_position")
 
-        if original_position is None:
+        if original_position is None and not any("lod_original_position" in obj for obj in lod_collection.objects):
             self.report({'WARNING'}, "Original position not found")
             return {'CANCELLED'}
 
+        profiler = start_profiler("apply_lods")
         for obj in lod_collection.objects:
-            context.view_layer.objects.active = obj  # Make the object active
-            bpy.ops.object.mode_set(mode='OBJECT')  # Ensure we're in object mode
-            modifiers_to_apply = [mod for mod in obj.modifiers if mod.type == 'DECIMATE' and mod.name.endswith("_decimate")]
-            for mod in modifiers_to_apply:
-                # Apply the modifier by name
-                bpy.ops.object.modifier_apply(modifier=mod.name)
-
-            obj.location = original_position
+            with profiled_pass(profiler, "apply_lods", [obj]):
+                context.view_layer.objects.active = obj  # Make the object active
+                bpy.ops.object.mode_set(mode='OBJECT')  # Ensure we're in object mode
+                modifiers_to_apply = [mod for mod in obj.modifiers if mod.type == 'DECIMATE' and mod.name.endswith("_decimate")]
+                for mod in modifiers_to_apply:
+                    # Apply the modifier by name
+                    bpy.ops.object.modifier_apply(modifier=mod.name)
+
+                # Batch generated objects remember their own source position
+                obj.location = obj.get("lod_original_position", original_position)
+        finish_profiler(profiler)
 
         return {'FINISHED'}
 
@@ -140,23 +785,44 @@ class VIEW3D_PT_lod_generator(Panel):
         layout = self.layout
         lod_props = context.scene.lod_properties
 
-        layout.prop(lod_props, "lod0_ratio")
-        layout.prop(lod_props, "lod1_ratio")
-        layout.prop(lod_props, "lod2_ratio")
-        layout.prop(lod_props, "lod3_ratio")
+        layout.prop(lod_props, "ratio_mode")
+        if lod_props.ratio_mode == 'MANUAL':
+            layout.prop(lod_props, "lod0_ratio")
+            layout.prop(lod_props, "lod1_ratio")
+            layout.prop(lod_props, "lod2_ratio")
+            layout.prop(lod_props, "lod3_ratio")
+        else:
+            if lod_props.ratio_mode == 'ERROR':
+                layout.prop(lod_props, "max_error")
+                layout.prop(lod_props, "error_growth")
+            else:
+                layout.prop(lod_props, "screen_size")
+                layout.prop(lod_props, "screen_height")
+                layout.prop(lod_props, "pixel_error")
+            layout.prop(lod_props, "min_ratio")
+
+        layout.prop(lod_props, "batch_mode")
+        if lod_props.batch_mode == 'COLLECTION':
+            layout.prop(lod_props, "batch_collection")
+        layout.prop(lod_props, "decimation_backend")
+        if lod_props.decimation_backend == 'MODIFIER':
+            layout.prop(lod_props, "progressive")
 
         layout.operator(OBJECT_OT_generate_lods.bl_idname)
         layout.operator(OBJECT_OT_apply_lods.bl_idname)
+        layout.operator(OBJECT_OT_export_lod_groups.bl_idname)
 
 def register():
     bpy.utils.register_class(LODProperties)
     bpy.types.Scene.lod_properties = bpy.props.PointerProperty(type=LODProperties)
     bpy.utils.register_class(OBJECT_OT_generate_lods)
     bpy.utils.register_class(OBJECT_OT_apply_lods)
+    bpy.utils.register_class(OBJECT_OT_export_lod_groups)
     bpy.utils.register_class(VIEW3D_PT_lod_generator)
 
 def unregister():
     bpy.utils.unregister_class(VIEW3D_PT_lod_generator)
+    bpy.utils.unregister_class(OBJECT_OT_export_lod_groups)
     bpy.utils.unregister_class(OBJECT_OT_apply_lods)
     bpy.utils.unregister_class(OBJECT_OT_generate_lods)
     del bpy.types.Scene.lod_properties
@@ -0,0 +1,220 @@
+"""
+Table-driven object name normalization for the tile scripts.
+
+Keep this file next to _PrepareMainTileExport.py (or any other script that imports it). It does not import
+bpy, so it can be used from any script and tested in plain Python.
+
+The alias tables below map the spellings artists actually use to the canonical names the Unity importer
+expects. NameMatcher finds the closest canonical name for misspelled ones:
+
+    matcher = NameMatcher(NAVMESH_NAMES, NAVMESH_PREFIX_TYPOS, "NavMesh")
+    matcher.closest("NavMshFloor")  # "NavMeshFloor"
+
+Exact names are a dict lookup. Everything else is searched in a BK-tree over the canonical names with a
+banded edit distance that gives up on a candidate as soon as it can't beat the best match so far. Results
+are memoized, so a scene full of the same misspelling costs one search.
+"""
+
+NAVMESH_PREFIX = "NavMesh"
+
+# Canonical NavMesh names, in order of preference when two are equally close
+NAVMESH_NAMES = (
+    "NavMeshFloor",
+    "NavMeshCeiling",
+    "NavMeshEastSouthWall",
+    "NavMeshNorthEastWall",
+    "NavMeshSouthWestWall",
+    "NavMeshSouthEastWall",
+    "NavMeshWestNorthWall",
+    "NavMeshEastWall",
+    "NavMeshWestWall",
+    "NavMeshNorthWall",
+    "NavMeshSouthWall",
+    "NavMeshEastSouth",
+    "NavMeshNorthEast",
+    "NavMeshSouthWest",
+    "NavMeshWestNorth",
+)
+
+# Misspelled "NavMesh" prefixes, replaced before matching (case insensitive)
+NAVMESH_PREFIX_TYPOS = ("NavMsh", "NvMesh", "NaMesh", "NavMes", "Navesh", "Navmesh")
+
+# LOD spellings -> the name they are renamed to
+LOD_ALIASES = {
+    "LOD-0": "_LOD0", "LOD0": "_LOD0",
+    "LOD-1": "_LOD1", "LOD1": "_LOD1", "_LOD01": "_LOD1",
+    "LOD-2": "_LOD2", "LOD2": "_LOD2", "_LOD02": "_LOD2",
+    "LOD-3": "_LOD3", "LOD3": "_LOD3", "_LOD03": "_LOD3",
+}
+
+HULL_NAMES = frozenset(("MainHull", "Main Hull", "Main hull", "main hull", "Mainhull", "Mainhul", "roof", "Roof"))
+
+# The hull object that is made active
+ACTIVE_NAMES = frozenset(("MainHull",))
+
+LIGHT_NAMES = frozenset(("Area-Light-1", "Area-Light-2", "Area-Light-3", "Area-Light-4", "Area-Light-5"))
+
+# Every object that belongs to the Main Tile Object, including older NavMesh names and common misspellings
+MAIN_TILE_NAMES = HULL_NAMES | frozenset(LOD_ALIASES.values()) | frozenset(NAVMESH_NAMES) | frozenset((
+    "NavMeshCelling", "NavMesCelling", "NavMeshEast", "NavMeshWest", "NavMeshNorth", "NavMeshSouth",
+))
+
+
+#########################
+# Levenshtein distance between a and b, or limit + 1 as soon as it is certain to be more than limit.
+# Only the diagonal band of width 2 * limit + 1 is computed, cells outside it can't be within the limit.
+#########################
+def bounded_edit_distance(a, b, limit):
+    if len(a) < len(b):
+        a, b = b, a
+    if len(a) - len(b) > limit:
+        return limit + 1
+    if not b:
+        return len(a)
+
+    over = limit + 1
+    previous = [j if j <= limit else over for j in range(len(b) + 1)]
+    for i, ca in enumerate(a, 1):
+        start = max(1, i - limit)
+        end = min(len(b), i + limit)
+        current = [over] * (len(b) + 1)
+        current[0] = i if i <= limit else over
+        best = current[0]
+        for j in range(start, end + 1):
+            cost = previous[j - 1] + (ca != b[j - 1])
+            if previous[j] + 1 < cost:
+                cost = previous[j] + 1
+            if current[j - 1] + 1 < cost:
+                cost = current[j - 1] + 1
+            current[j] = cost if cost <= limit else over
+            if cost < best:
+                best = cost
+        # Every cell in the band is already over the limit, so the final distance is too
+        if best > limit:
+            return over
+        previous = current
+    return previous[len(b)]
+
+
+class BKTree:
+    """Burkhard-Keller tree over a fixed list of words. Children are keyed by their distance to the parent,
+    so the triangle inequality prunes every subtree that can't hold a closer word."""
+
+    def __init__(self, words):
+        self.root = None
+        for order, word in enumerate(words):
+            self.add(word, order)
+
+    def add(self, word, order):
+        node = (word, order, {})
+        if self.root is None:
+            self.root = node
+            return
+        parent = self.root
+        while True:
+            distance = bounded_edit_distance(word, parent[0], max(len(word), len(parent[0])))
+            child = parent[2].get(distance)
+            if child is None:
+                parent[2][distance] = node
+                return
+            parent = child
+
+    def closest(self, word, limit = None):
+        # Closest word and its distance. Ties go to the word added first. (None, None) when nothing is
+        # within limit.
+        best_word = None
+        best_distance = limit if limit is not None else float("inf")
+        best_order = -1
+        stack = [self.root] if self.root else []
+        while stack:
+            candidate, order, children = stack.pop()
+            # Candidates further away than the best so far are abandoned early
+            bound = best_distance if best_distance != float("inf") else max(len(word), len(candidate))
+            distance = bounded_edit_distance(word, candidate, bound)
+            exact = distance <= bound
+            if exact and (best_word is None or (distance, order) < (best_distance, best_order)):
+                best_word, best_distance, best_order = candidate, distance, order
+
+            # Only the lower bound of an abandoned candidate's distance is known, so only that side prunes
+            for child_distance, child in children.items():
+                if child_distance >= distance - best_distance and (not exact or child_distance <= distance + best_distance):
+                    stack.append(child)
+        if best_word is None:
+            return None, None
+        return best_word, best_distance
+
+
+class NameMatcher:
+    """Maps names to the closest of a set of canonical names. prefix_typos are replaced by prefix first."""
+
+    def __init__(self, canonical_names, prefix_typos = (), prefix = ""):
+        self.canonical = {name: name for name in canonical_names}
+        self.prefix = prefix
+        self.prefix_typos = tuple(typo.lower() for typo in prefix_typos)
+        self.tree = BKTree(canonical_names)
+        self.memo = {}
+
+    def fix_prefix(self, name):
+        if self.prefix and not name.startswith(self.prefix):
+            lowered = name.lower()
+            for typo in self.prefix_typos:
+                if lowered.startswith(typo):
+                    return self.prefix + name[len(typo):]
+        return name
+
+    def closest(self, name):
+        match = self.canonical.get(name)
+        if match is not None:
+            return match
+        match = self.memo.get(name)
+        if match is None:
+            fixed = self.fix_prefix(name)
+            match = self.canonical.get(fixed) or self.tree.closest(fixed)[0] or fixed
+            self.memo[name] = match
+        return match
+
+
+def navmesh_matcher():
+    return NameMatcher(NAVMESH_NAMES, NAVMESH_PREFIX_TYPOS, NAVMESH_PREFIX)
+
+
+def is_navmesh_name(name):
+    return name.lower().startswith(NAVMESH_PREFIX.lower())
+
+
+#########################
+# Dispatch table for the Main Tile Object: name -> (canonical name, select, make active). LOD aliases map
+# to their new name, everything else in the tables to itself.
+#########################
+def tile_actions():
+    actions = {}
+    for name in MAIN_TILE_NAMES:
+        actions[name] = (name, True, name in ACTIVE_NAMES)
+    for name in LIGHT_NAMES:
+        actions[name] = (name, True, False)
+    for alias, target in LOD_ALIASES.items():
+        actions[alias] = (target, True, False)
+    return actions
+
+
+TILE_ACTIONS = tile_actions()
+
+
+#########################
+# Plans the renames and selection for the Main Tile Object in one pass over names, one dict lookup per name.
+# Returns (index, new name or None, select, make active) for every name that gets renamed or selected.
+#########################
+def plan_tile_selection(names, actions = TILE_ACTIONS, matcher = None):
+    matcher = matcher or navmesh_matcher()
+    plan = []
+    for index, name in enumerate(names):
+        target = matcher.closest(name) if is_navmesh_name(name) else name
+        action = actions.get(target)
+        if action is None:
+            if target != name:
+                plan.append((index, target, False, False))
+            continue
+        canonical, select, active = action
+        plan.append((index, canonical if canonical != name else None, select, active))
+    return plan
+
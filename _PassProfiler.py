@@ -0,0 +1,160 @@
+"""
+Per-pass instrumentation for the optimization scripts.
+
+Keep this file next to the scripts that use it (_CompleteOptimizationScript.py, WeekendMeshJoinScript.py
+and _LODGenerator.py). They import it when it is there and simply run without profiling when it isn't.
+
+Wrap every pass in PassProfiler.Pass to record its wall time, how often it ran, how many bpy.ops calls it
+made and the vertex/face counts of the objects it worked on before and after. cProfile and tracemalloc
+can be switched on for a deeper look. Write() saves everything as JSON so nightly runs can be compared.
+"""
+import bpy
+import cProfile
+import io
+import json
+import pstats
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from time import perf_counter
+
+
+#########################
+# Sums the vertices and faces of the mesh objects in objects. Objects that were deleted by the pass
+# (ie. joined into another one) no longer count.
+#########################
+def MeshCounts(objects):
+    verts = 0
+    faces = 0
+    for obj in objects:
+        try:
+            if obj.type == 'MESH':
+                verts += len(obj.data.vertices)
+                faces += len(obj.data.polygons)
+        except ReferenceError:
+            pass
+    return verts, faces
+
+
+class PassProfiler:
+    def __init__(self, name, useCProfile = False, useTracemalloc = False):
+        self.name = name
+        self.started = datetime.now()
+        self.passes = {}
+        self.opsCalls = {}
+        self.useCProfile = useCProfile
+        self.useTracemalloc = useTracemalloc
+        self.cProfile = cProfile.Profile() if useCProfile else None
+        self._opCall = None
+
+    #########################
+    # Starts counting bpy.ops calls (and tracemalloc if enabled). Call Stop() when the script is done.
+    #########################
+    def Start(self):
+        # bpy.ops routes every operator call through the module level _op_call, so wrapping it is enough
+        # to see all of them.
+        if self._opCall is None and hasattr(bpy.ops, "_op_call"):
+            self._opCall = bpy.ops._op_call
+            opsCalls = self.opsCalls
+            opCall = self._opCall
+
+            def CountedOpCall(idname, *args):
+                opsCalls[idname] = opsCalls.get(idname, 0) + 1
+                return opCall(idname, *args)
+
+            bpy.ops._op_call = CountedOpCall
+        if self.useTracemalloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        return self
+
+    def Stop(self):
+        if self._opCall is not None:
+            bpy.ops._op_call = self._opCall
+            self._opCall = None
+        if self.useTracemalloc and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def __enter__(self):
+        return self.Start()
+
+    def __exit__(self, *exc):
+        self.Stop()
+        return False
+
+    #########################
+    # Instruments one run of a pass over objects. Runs of the same pass are added together.
+    #########################
+    @contextmanager
+    def Pass(self, passName, objects = ()):
+        objects = list(objects)
+        vertsBefore, facesBefore = MeshCounts(objects)
+        opsBefore = sum(self.opsCalls.values())
+        if self.useTracemalloc and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        if self.cProfile:
+            self.cProfile.enable()
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            seconds = perf_counter() - start
+            if self.cProfile:
+                self.cProfile.disable()
+            vertsAfter, facesAfter = MeshCounts(objects)
+
+            stats = self.passes.setdefault(passName, {
+                "calls": 0, "seconds": 0.0, "opsCalls": 0,
+                "vertsBefore": 0, "vertsAfter": 0, "facesBefore": 0, "facesAfter": 0,
+            })
+            stats["calls"] += 1
+            stats["seconds"] += seconds
+            stats["opsCalls"] += sum(self.opsCalls.values()) - opsBefore
+            stats["vertsBefore"] += vertsBefore
+            stats["vertsAfter"] += vertsAfter
+            stats["facesBefore"] += facesBefore
+            stats["facesAfter"] += facesAfter
+            if self.useTracemalloc and tracemalloc.is_tracing():
+                stats["peakMemoryBytes"] = max(stats.get("peakMemoryBytes", 0), tracemalloc.get_traced_memory()[1])
+
+    #########################
+    # The most expensive functions cProfile saw, by cumulative time.
+    #########################
+    def TopFunctions(self, limit = 25):
+        if not self.cProfile:
+            return []
+        stats = pstats.Stats(self.cProfile, stream=io.StringIO())
+        rows = []
+        for (filename, line, function), (primitiveCalls, calls, ownTime, cumulativeTime, callers) in stats.stats.items():
+            rows.append({"function": "{}:{}({})".format(filename, line, function), "calls": calls, "ownSeconds": round(ownTime, 6), "cumulativeSeconds": round(cumulativeTime, 6)})
+        rows.sort(key=lambda row: -row["cumulativeSeconds"])
+        return rows[:limit]
+
+    def ToDict(self):
+        return {
+            "name": self.name,
+            "file": bpy.data.filepath,
+            "blender": bpy.app.version_string,
+            "date": self.started.isoformat(timespec="seconds"),
+            "passes": [dict(name=passName, **stats) for passName, stats in self.passes.items()],
+            "opsCalls": dict(sorted(self.opsCalls.items(), key=lambda item: -item[1])),
+            "topFunctions": self.TopFunctions(),
+        }
+
+    #########################
+    # Saves the profile as JSON. With cProfile on, the raw stats also go next to it as .prof for snakeviz etc.
+    #########################
+    def Write(self, filepath):
+        with open(filepath, "w") as f:
+            json.dump(self.ToDict(), f, indent=2)
+        if self.cProfile:
+            self.cProfile.dump_stats(filepath.rsplit(".", 1)[0] + ".prof")
+
+    #########################
+    # Prints one line per pass, slowest first.
+    #########################
+    def PrintSummary(self):
+        print("PASS TIMINGS ({})".format(self.name))
+        for passName, stats in sorted(self.passes.items(), key=lambda item: -item[1]["seconds"]):
+            print("{:<32} {:>9.3f}s  {} calls  {} ops  verts {} -> {}  faces {} -> {}".format(
+                passName, stats["seconds"], stats["calls"], stats["opsCalls"],
+                stats["vertsBefore"], stats["vertsAfter"], stats["facesBefore"], stats["facesAfter"]))
@@ -1,17 +1,105 @@
 """
 Automates the process of correcting and renaming objects in a scene
 and then selecting all objects needed for the Main Tile Object.
- 
-The script first calculates the Levenshtein distance between strings to find the closest matching 
-names for NavMesh objects, even when the "NavMesh" prefix is misspelled. The script then deselects 
-all objects, iterates through the objects in the scene, corrects the misspelled NavMesh names, selects 
-and renames LOD objects, selects all main tile objects, and selects lights in the scene.
+
+The script first finds the closest matching names for NavMesh objects by edit distance (see
+_NameNormalization.py), even when the "NavMesh" prefix is misspelled. The script then walks the objects
+in the scene once, looking up every (corrected) name in one dispatch table that says what the object is
+renamed to, whether it is selected and whether it is made active. Selection is set once per object and
+the renames are applied together after the walk. Set DRY_RUN to only print what would change.
+
+With USE_GEOMETRY_CLASSIFIER the names are not matched at all: every object of the tile's collection is
+labelled from its geometry (see _TileClassifier.py) and the labels decide renames and selection.
+
+Set BENCHMARK_OBJECTS (ie. 50000) to time this script against the original chained version on a generated
+scene of that many objects instead. The open scene is not touched.
 """
 import bpy
+import os
+import sys
+from time import perf_counter
+
+# The alias tables and the NavMesh name matcher live in _NameNormalization.py, keep it next to this script
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from _NameNormalization import LIGHT_NAMES, LOD_ALIASES, MAIN_TILE_NAMES, NAVMESH_NAMES, plan_tile_selection
+
+# Select and rename the hull, LODs, NavMesh surfaces and lights by their geometry (see _TileClassifier.py)
+# instead of by their names. Needs _TileClassifier.py next to this script.
+USE_GEOMETRY_CLASSIFIER = False
+
+# Collection holding the tile the classifier looks at, the active collection when empty
+TILE_COLLECTION = ""
+
+# Mesh features of the classifier are kept here between runs (relative to the .blend file)
+FEATURE_CACHE_FILE = "//_TileFeatures.json"
+
+# Print the planned renames and selection without changing the scene
+DRY_RUN = False
+
+# Number of objects of the generated benchmark scene, 0 runs the script normally
+BENCHMARK_OBJECTS = 0
+
+#########################
+# (new name or None, select, make active) by index into objects, for every object that is renamed or selected.
+#########################
+def PlanMainTile(objects):
+    names = [o.name for o in objects]
+
+    if USE_GEOMETRY_CLASSIFIER:
+        # One label per object of the tile decides its new name and selection, no name matching
+        from _TileClassifier import classify_objects, load_feature_cache, plan_from_labels, save_feature_cache
+        collection = bpy.data.collections[TILE_COLLECTION] if TILE_COLLECTION else bpy.context.view_layer.active_layer_collection.collection
+        cacheFile = bpy.path.abspath(FEATURE_CACHE_FILE) if bpy.data.filepath else ""
+        if cacheFile:
+            load_feature_cache(cacheFile)
+        labels = classify_objects(collection.all_objects)
+        if cacheFile:
+            save_feature_cache(cacheFile)
+        tilePlan = plan_from_labels(names, labels)
+    else:
+        tilePlan = plan_tile_selection(names)
+
+    return {index: (new_name, select, active) for index, new_name, select, active in tilePlan}
+
+#########################
+# Renames and selects the Main Tile Object in one walk over the scene, or only prints the plan with dryRun.
+#########################
+def PrepareMainTile(dryRun = False):
+    objects = list(bpy.context.scene.objects)
+    plan = PlanMainTile(objects)
+
+    if dryRun:
+        for index, (new_name, select, active) in sorted(plan.items()):
+            name = objects[index].name
+            print("{} -> {}{}{}".format(name, new_name or name, " (selected)" if select else "", " (active)" if active else ""))
+        print("{} renames, {} selected".format(sum(1 for new_name, _, _ in plan.values() if new_name), sum(1 for _, select, _ in plan.values() if select)))
+        return
 
-def levenshtein_distance(s1, s2):
+    # DESELECT ALL
+    bpy.ops.object.select_all(action='DESELECT')
+
+    renames = []
+    for index, (new_name, select, active) in plan.items():
+        o = objects[index]
+        if select:
+            o.select_set(True)
+        if active:
+            bpy.context.view_layer.objects.active = o
+        if new_name:
+            renames.append((o, new_name))
+
+    # RENAME (NavMesh corrections and LODs)
+    for o, new_name in renames:
+        o.name = new_name
+
+#########################
+# The original version of this script, kept only for BenchmarkPrepareMainTile: a full Levenshtein
+# distance to every NavMesh name and up to eight tuple scans per object, renaming and selecting while
+# iterating the scene.
+#########################
+def LegacyLevenshteinDistance(s1, s2):
     if len(s1) < len(s2):
-        return levenshtein_distance(s2, s1)
+        return LegacyLevenshteinDistance(s2, s1)
 
     if len(s2) == 0:
         return len(s1)
@@ -28,25 +116,7 @@ def levenshtein_distance(s1, s2):
 
     return previous_row[-1]
 
-def fix_misspelled_navmesh_names(obj_name):
-    navmesh_names = [
-        "NavMeshFloor",
-        "NavMeshCeiling",
-        "NavMeshEastSouthWall",
-        "NavMeshNorthEastWall",
-        "NavMeshSouthWestWall",
-        "NavMeshSouthEastWall",
-        "NavMeshWestNorthWall",
-        "NavMeshEastWall",
-        "NavMeshWestWall",
-        "NavMeshNorthWall",
-        "NavMeshSouthWall",
-        "NavMeshEastSouth",
-        "NavMeshNorthEast",
-        "NavMeshSouthWest",
-        "NavMeshWestNorth",
-    ]
-
+def LegacyFixMisspelledNavmeshNames(obj_name):
     if not obj_name.startswith("NavMesh"):
         for prefix in ["NavMsh", "NvMesh", "NaMesh", "NavMes", "Navesh", "Navmesh"]:
             if obj_name.lower().startswith(prefix.lower()):
@@ -55,40 +125,84 @@ def fix_misspelled_navmesh_names(obj_name):
 
     closest_distance = float('inf')
     closest_name = obj_name
-    for navmesh_name in navmesh_names:
-        distance = levenshtein_distance(obj_name, navmesh_name)
+    for navmesh_name in NAVMESH_NAMES:
+        distance = LegacyLevenshteinDistance(obj_name, navmesh_name)
         if distance < closest_distance:
             closest_distance = distance
             closest_name = navmesh_name
 
     return closest_name
 
-# DESELECT ALL
-bpy.ops.object.select_all(action='DESELECT')
-
-for o in bpy.context.scene.objects:
-    # Correct misspelled NavMesh names
-    if o.name.startswith("NavMesh") or o.name.lower().startswith("navmesh"):
-        o.name = fix_misspelled_navmesh_names(o.name)
-    
-    # SELECT LODs AND RENAME         
-    if o.name in ("LOD-0", "LOD0"):
-        o.select_set(True)
-        o.name = "_LOD0"
-    if o.name in ("LOD-1", "LOD1", "_LOD01"):
-        o.select_set(True)
-        o.name = "_LOD1"
-    if o.name in ("LOD-2", "LOD2", "_LOD02"):
-        o.select_set(True)
-        o.name = "_LOD2"
-    if o.name in ("LOD-3", "LOD3", "_LOD03"):
-        o.select_set(True)
-        o.name = "_LOD3"
-    # SELECT ALL MAIN TILE OBJECTS    
-    if o.name in ("MainHull","Main Hull","Main hull","main hull","Mainhull","Mainhul","roof","Roof","_LOD0","_LOD1","_LOD2","_LOD3","NavMeshFloor","NavMeshCelling","NavMeshCeiling","NavMesCelling","NavMeshEastSouthWall","NavMeshNorthEastWall","NavMeshSouthWestWall","NavMeshSouthEastWall","NavMeshWestNorthWall","NavMeshEast","NavMeshEastWall","NavMeshWest","NavMeshWestWall","NavMeshNorth","NavMeshNorthWall","NavMeshSouth","NavMeshSouthWall","NavMeshWest","NavMeshEastSouth","NavMeshNorthEast","NavMeshSouthWest","NavMeshWestNorth"):
-        o.select_set(True)
-    # SELECT LIGHTS
-    if o.name in ("Area-Light-1", "Area-Light-2", "Area-Light-3", "Area-Light-4", "Area-Light-5",):
-        o.select_set(True)
-    if o.name in ("MainHull",):
-        bpy.context.view_layer.objects.active = o
+def LegacyPrepareMainTile():
+    bpy.ops.object.select_all(action='DESELECT')
+
+    for o in bpy.context.scene.objects:
+        if o.name.startswith("NavMesh") or o.name.lower().startswith("navmesh"):
+            o.name = LegacyFixMisspelledNavmeshNames(o.name)
+
+        if o.name in ("LOD-0", "LOD0"):
+            o.select_set(True)
+            o.name = "_LOD0"
+        if o.name in ("LOD-1", "LOD1", "_LOD01"):
+            o.select_set(True)
+            o.name = "_LOD1"
+        if o.name in ("LOD-2", "LOD2", "_LOD02"):
+            o.select_set(True)
+            o.name = "_LOD2"
+        if o.name in ("LOD-3", "LOD3", "_LOD03"):
+            o.select_set(True)
+            o.name = "_LOD3"
+        if o.name in ("MainHull","Main Hull","Main hull","main hull","Mainhull","Mainhul","roof","Roof","_LOD0","_LOD1","_LOD2","_LOD3","NavMeshFloor","NavMeshCelling","NavMeshCeiling","NavMesCelling","NavMeshEastSouthWall","NavMeshNorthEastWall","NavMeshSouthWestWall","NavMeshSouthEastWall","NavMeshWestNorthWall","NavMeshEast","NavMeshEastWall","NavMeshWest","NavMeshWestWall","NavMeshNorth","NavMeshNorthWall","NavMeshSouth","NavMeshSouthWall","NavMeshWest","NavMeshEastSouth","NavMeshNorthEast","NavMeshSouthWest","NavMeshWestNorth"):
+            o.select_set(True)
+        if o.name in ("Area-Light-1", "Area-Light-2", "Area-Light-3", "Area-Light-4", "Area-Light-5",):
+            o.select_set(True)
+        if o.name in ("MainHull",):
+            bpy.context.view_layer.objects.active = o
+
+#########################
+# Times LegacyPrepareMainTile against PrepareMainTile on a temporary scene of count empties: the tile
+# names, LOD aliases and a few misspelled NavMesh names, the rest props. Both start from the same names and
+# must end with the same selection. The scene is removed again.
+#########################
+def BenchmarkPrepareMainTile(count = 50000):
+    # One spelling per LOD and misspellings of NavMesh names that aren't in the scene, so no rename clashes
+    # with an existing name (Blender would add .001 and the two versions treat that differently)
+    misspelled = {"NavMeshFlor": "NavMeshFloor", "NavmeshCeling": "NavMeshCeiling", "NavMeshNorthWal": "NavMeshNorthWall"}
+    tileNames = sorted((MAIN_TILE_NAMES | LIGHT_NAMES) - set(LOD_ALIASES.values()) - set(misspelled.values()))
+    tileNames += ["LOD-0", "LOD1", "_LOD02", "LOD-3"] + list(misspelled)
+    names = tileNames + ["Prop_{}".format(i) for i in range(max(0, count - len(tileNames)))]
+
+    scene = bpy.data.scenes.new("Prepare Main Tile Benchmark")
+    viewLayer = scene.view_layers[0]
+    objects = [bpy.data.objects.new(name, None) for name in names]
+    for o in objects:
+        scene.collection.objects.link(o)
+
+    results = {}
+    try:
+        with bpy.context.temp_override(scene=scene, view_layer=viewLayer):
+            for label, run in (("Original chained loop", LegacyPrepareMainTile), ("Dispatch table walk", PrepareMainTile)):
+                for o, name in zip(objects, names):
+                    o.name = name
+                bpy.ops.object.select_all(action='DESELECT')
+                viewLayer.objects.active = None
+
+                start = perf_counter()
+                run()
+                seconds = perf_counter() - start
+                selected = sorted(o.name for o in objects if o.select_get(view_layer=viewLayer))
+                results[label] = (seconds, selected)
+                print("{}: {:.3f}s ({} objects, {} selected)".format(label, seconds, len(objects), len(selected)))
+    finally:
+        bpy.data.batch_remove(objects)
+        bpy.data.scenes.remove(scene)
+
+    (_, legacySelected), (_, selected) = results.values()
+    print("Same selection" if legacySelected == selected else "Selections differ: " + ", ".join(sorted(set(legacySelected) ^ set(selected))))
+    return {label: seconds for label, (seconds, _) in results.items()}
+
+
+if BENCHMARK_OBJECTS:
+    BenchmarkPrepareMainTile(BENCHMARK_OBJECTS)
+else:
+    PrepareMainTile(DRY_RUN)
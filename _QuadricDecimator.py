@@ -0,0 +1,314 @@
+"""
+Quadric error metric (Garland-Heckbert) mesh decimator on plain NumPy arrays.
+
+An alternative to Blender's DECIMATE modifier for _LODGenerator.py. It does not import bpy, so it runs in
+background mode, in plain Python for tests, and on synthetic meshes for benchmarks (BenchmarkDecimator).
+Keep it next to _LODGenerator.py to enable the "Quadric (NumPy)" backend there.
+
+Edges are collapsed cheapest first from a heap. The collapse order is recorded once, so every LOD ratio is
+cut from the same run instead of decimating the full mesh again for each level:
+
+    decimator = QuadricDecimator(vertices, triangles)
+    decimator.Run(minFaces)
+    vertices, triangles, faceIndex = decimator.Extract(targetFaces)
+
+faceIndex holds the original triangle of every surviving triangle, so per-face data (materials) and
+per-corner data (UVs) can be carried over from the source mesh.
+"""
+import heapq
+import numpy as np
+from time import perf_counter
+
+# Boundary edges get a constraint plane with this weight so open borders (tile edges) keep their shape.
+BOUNDARY_WEIGHT = 100.0
+
+# Systems with a smaller determinant fall back to the best of the two endpoints and the midpoint.
+SINGULAR_DETERMINANT = 1e-12
+
+
+#########################
+# Plane quadrics (4x4) of every triangle, weighted by triangle area.
+#########################
+def FaceQuadrics(vertices, triangles):
+    v0 = vertices[triangles[:, 0]]
+    normals = np.cross(vertices[triangles[:, 1]] - v0, vertices[triangles[:, 2]] - v0)
+    doubleAreas = np.linalg.norm(normals, axis=1)
+    unitNormals = normals / np.maximum(doubleAreas, 1e-30)[:, None]
+    planes = np.concatenate([unitNormals, -np.einsum('ij,ij->i', unitNormals, v0)[:, None]], axis=1)
+    return 0.5 * doubleAreas[:, None, None] * np.einsum('ij,ik->ijk', planes, planes), unitNormals
+
+
+#########################
+# Unique undirected edges of a triangle list, plus how many triangles use each one.
+#########################
+def TriangleEdges(triangles):
+    edges = np.sort(np.concatenate([triangles[:, [0, 1]], triangles[:, [1, 2]], triangles[:, [2, 0]]]), axis=1)
+    return np.unique(edges, axis=0, return_counts=True)
+
+
+#########################
+# Unnormalized normals of a (k, 3, 3) array of triangle corners. Cheaper than np.cross on tiny arrays.
+#########################
+def TriangleNormals(corners):
+    u = corners[:, 1] - corners[:, 0]
+    v = corners[:, 2] - corners[:, 0]
+    return np.stack([u[:, 1] * v[:, 2] - u[:, 2] * v[:, 1], u[:, 2] * v[:, 0] - u[:, 0] * v[:, 2], u[:, 0] * v[:, 1] - u[:, 1] * v[:, 0]], axis=1)
+
+
+class QuadricDecimator:
+    def __init__(self, vertices, triangles, boundaryWeight = BOUNDARY_WEIGHT):
+        self.originalVertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+        self.originalTriangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+        self.vertices = self.originalVertices.copy()
+        self.triangles = self.originalTriangles.copy()
+        vertexCount = len(self.vertices)
+        faceCount = len(self.triangles)
+
+        faceQuadrics, faceNormals = FaceQuadrics(self.vertices, self.triangles)
+        self.quadrics = np.zeros((vertexCount, 4, 4))
+        for corner in range(3):
+            np.add.at(self.quadrics, self.triangles[:, corner], faceQuadrics)
+
+        # Constraint planes along open borders, perpendicular to the face that owns the edge.
+        edges, uses = TriangleEdges(self.triangles)
+        if boundaryWeight > 0 and np.any(uses == 1):
+            self.AddBoundaryQuadrics(edges[uses == 1], faceNormals, boundaryWeight)
+
+        self.vertexFaces = [set() for _ in range(vertexCount)]
+        for face, (a, b, c) in enumerate(self.triangles.tolist()):
+            self.vertexFaces[a].add(face)
+            self.vertexFaces[b].add(face)
+            self.vertexFaces[c].add(face)
+
+        self.version = np.zeros(vertexCount, dtype=np.int64)
+        self.faceDeath = np.full(faceCount, np.iinfo(np.int64).max)
+        self.liveFaces = faceCount
+
+        # The collapse record: vertex kept, vertex removed, new position and faces left after each step.
+        self.kept = []
+        self.removed = []
+        self.positions = []
+        self.faceCounts = []
+
+        # Heap entries are (cost, a, b, version of a, version of b, position). Entries whose versions are out
+        # of date are stale and get skipped when popped.
+        costs, positions = self.EdgeCosts(edges[:, 0], edges[:, 1])
+        self.heap = list(zip(costs.tolist(), edges[:, 0].tolist(), edges[:, 1].tolist(), [0] * len(edges), [0] * len(edges), map(tuple, positions.tolist())))
+        heapq.heapify(self.heap)
+
+    def AddBoundaryQuadrics(self, boundaryEdges, faceNormals, weight):
+        # Find the one face of every boundary edge.
+        edgeFaces = {}
+        for face, (a, b, c) in enumerate(self.triangles.tolist()):
+            for u, v in ((a, b), (b, c), (c, a)):
+                edgeFaces[(min(u, v), max(u, v))] = face
+        owners = np.array([edgeFaces[(a, b)] for a, b in boundaryEdges.tolist()], dtype=np.int64)
+
+        starts = self.vertices[boundaryEdges[:, 0]]
+        directions = self.vertices[boundaryEdges[:, 1]] - starts
+        lengths = np.linalg.norm(directions, axis=1)
+        normals = np.cross(directions, faceNormals[owners])
+        normals /= np.maximum(np.linalg.norm(normals, axis=1), 1e-30)[:, None]
+        planes = np.concatenate([normals, -np.einsum('ij,ij->i', normals, starts)[:, None]], axis=1)
+        quadrics = (weight * lengths * lengths)[:, None, None] * np.einsum('ij,ik->ijk', planes, planes)
+        np.add.at(self.quadrics, boundaryEdges[:, 0], quadrics)
+        np.add.at(self.quadrics, boundaryEdges[:, 1], quadrics)
+
+    #########################
+    # Collapse cost and target position for a batch of edges (a[i], b[i]). Uses the position that minimizes
+    # the summed quadric when it is solvable, otherwise the best of the endpoints and the midpoint.
+    # Runs for a handful of edges after every collapse, so the 3x3 solve is written out by hand.
+    #########################
+    def EdgeCosts(self, a, b):
+        a = np.asarray(a, dtype=np.int64)
+        b = np.asarray(b, dtype=np.int64)
+        quadrics = self.quadrics[a] + self.quadrics[b]
+
+        candidates = np.ones((4, len(a), 4))
+        candidates[0, :, :3] = self.vertices[a]
+        candidates[1, :, :3] = self.vertices[b]
+        candidates[2, :, :3] = 0.5 * (candidates[0, :, :3] + candidates[1, :, :3])
+        candidates[3, :, :3] = candidates[2, :, :3]
+
+        # Adjugate of the upper 3x3 block. The quadric is symmetric, so the adjugate is too.
+        q = quadrics
+        c00 = q[:, 1, 1] * q[:, 2, 2] - q[:, 1, 2] * q[:, 2, 1]
+        c01 = q[:, 0, 2] * q[:, 2, 1] - q[:, 0, 1] * q[:, 2, 2]
+        c02 = q[:, 0, 1] * q[:, 1, 2] - q[:, 0, 2] * q[:, 1, 1]
+        c11 = q[:, 0, 0] * q[:, 2, 2] - q[:, 0, 2] * q[:, 2, 0]
+        c12 = q[:, 0, 2] * q[:, 1, 0] - q[:, 0, 0] * q[:, 1, 2]
+        c22 = q[:, 0, 0] * q[:, 1, 1] - q[:, 0, 1] * q[:, 1, 0]
+        determinant = q[:, 0, 0] * c00 + q[:, 0, 1] * c01 + q[:, 0, 2] * c02
+        solvable = np.abs(determinant) > SINGULAR_DETERMINANT
+        if np.any(solvable):
+            inverse = 1.0 / determinant[solvable]
+            rx, ry, rz = -q[solvable, 0, 3], -q[solvable, 1, 3], -q[solvable, 2, 3]
+            candidates[3, solvable, 0] = (c00[solvable] * rx + c01[solvable] * ry + c02[solvable] * rz) * inverse
+            candidates[3, solvable, 1] = (c01[solvable] * rx + c11[solvable] * ry + c12[solvable] * rz) * inverse
+            candidates[3, solvable, 2] = (c02[solvable] * rx + c12[solvable] * ry + c22[solvable] * rz) * inverse
+
+        costs = np.einsum('cij,ijk,cik->ci', candidates, quadrics, candidates)
+        best = np.argmin(costs, axis=0)
+        columns = np.arange(len(a))
+        return np.maximum(costs[best, columns], 0.0), candidates[best, columns, :3]
+
+    def Neighbours(self, vertex):
+        neighbours = set()
+        for face in self.vertexFaces[vertex]:
+            neighbours.update(self.triangles[face].tolist())
+        neighbours.discard(vertex)
+        return neighbours
+
+    #########################
+    # True when moving the faces around a and b to position would fold one of them over.
+    #########################
+    def FlipsFaces(self, a, b, position, shared):
+        faces = [face for face in self.vertexFaces[a] | self.vertexFaces[b] if face not in shared]
+        if not faces:
+            return False
+        corners = self.triangles[faces]
+        before = self.vertices[corners]
+        after = before.copy()
+        after[(corners == a) | (corners == b)] = position
+        return bool(np.any(np.einsum('ij,ij->i', TriangleNormals(before), TriangleNormals(after)) <= 0.0))
+
+    #########################
+    # Collapses edges cheapest first until at most minFaces triangles are left (or nothing can collapse).
+    #########################
+    def Run(self, minFaces):
+        heap = self.heap
+        version = self.version
+        while heap and self.liveFaces > minFaces:
+            cost, a, b, stampA, stampB, position = heapq.heappop(heap)
+            if version[a] != stampA or version[b] != stampB:
+                continue
+
+            shared = self.vertexFaces[a] & self.vertexFaces[b]
+            if not shared:
+                continue
+            # Only collapse edges whose endpoints share no neighbours other than the tips of the shared
+            # faces, otherwise the mesh would turn non-manifold.
+            if len(self.Neighbours(a) & self.Neighbours(b)) != len(shared):
+                continue
+
+            if self.FlipsFaces(a, b, position, shared):
+                continue
+
+            self.Collapse(a, b, position, shared)
+
+            # Only edges touching a changed.
+            neighbours = sorted(self.Neighbours(a))
+            if neighbours:
+                costs, positions = self.EdgeCosts(np.full(len(neighbours), a), neighbours)
+                stamp = int(version[a])
+                for cost, neighbour, position in zip(costs.tolist(), neighbours, positions.tolist()):
+                    heapq.heappush(heap, (cost, a, neighbour, stamp, int(version[neighbour]), tuple(position)))
+        return self
+
+    def Collapse(self, a, b, position, shared):
+        step = len(self.kept)
+        for face in shared:
+            self.faceDeath[face] = step
+            for vertex in self.triangles[face].tolist():
+                self.vertexFaces[vertex].discard(face)
+        self.liveFaces -= len(shared)
+
+        for face in self.vertexFaces[b]:
+            corners = self.triangles[face]
+            corners[corners == b] = a
+            self.vertexFaces[a].add(face)
+        self.vertexFaces[b] = set()
+
+        self.vertices[a] = position
+        self.quadrics[a] += self.quadrics[b]
+        self.version[a] += 1
+        self.version[b] += 1
+
+        self.kept.append(a)
+        self.removed.append(b)
+        self.positions.append(position)
+        self.faceCounts.append(self.liveFaces)
+
+    #########################
+    # Rebuilds the mesh as it was after the first collapse that got down to targetFaces triangles.
+    # Returns (vertices, triangles, faceIndex) with compacted vertex indices.
+    #########################
+    def Extract(self, targetFaces):
+        faceCounts = np.array(self.faceCounts, dtype=np.int64)
+        steps = int(np.searchsorted(-faceCounts, -targetFaces, side='left')) + 1 if len(faceCounts) else 0
+        steps = min(steps, len(faceCounts))
+        if len(self.originalTriangles) <= targetFaces:
+            steps = 0
+
+        vertexCount = len(self.originalVertices)
+        kept = np.array(self.kept[:steps], dtype=np.int64)
+        removed = np.array(self.removed[:steps], dtype=np.int64)
+
+        # Where every removed vertex ended up, following chains of collapses.
+        parent = np.arange(vertexCount)
+        parent[removed] = kept
+        while True:
+            resolved = parent[parent]
+            if np.array_equal(resolved, parent):
+                break
+            parent = resolved
+
+        # Every kept vertex takes the position of the last collapse that moved it.
+        vertices = self.originalVertices.copy()
+        if steps:
+            lastStep = np.full(vertexCount, -1, dtype=np.int64)
+            np.maximum.at(lastStep, kept, np.arange(steps))
+            moved = lastStep >= 0
+            vertices[moved] = np.array(self.positions[:steps])[lastStep[moved]]
+
+        faceIndex = np.flatnonzero(self.faceDeath >= steps)
+        triangles = parent[self.originalTriangles[faceIndex]]
+        used, triangles = np.unique(triangles, return_inverse=True)
+        return vertices[used], triangles.reshape(-1, 3), faceIndex
+
+
+#########################
+# Decimates once and cuts a LOD for every ratio (fraction of triangles to keep, like the DECIMATE modifier).
+#########################
+def DecimateLevels(vertices, triangles, ratios):
+    decimator = QuadricDecimator(vertices, triangles)
+    faceCount = len(decimator.originalTriangles)
+    targets = [max(1, int(round(faceCount * ratio))) for ratio in ratios]
+    decimator.Run(min(targets))
+    return [decimator.Extract(target) for target in targets]
+
+
+#########################
+# A UV sphere with segments * rings * 2 triangles, handy for tests and benchmarks.
+#########################
+def MakeSphereMesh(segments = 64, rings = 32):
+    theta = np.linspace(0.0, np.pi, rings + 1)[1:-1]
+    phi = np.linspace(0.0, 2.0 * np.pi, segments, endpoint=False)
+    t, p = np.meshgrid(theta, phi, indexing='ij')
+    body = np.stack([np.sin(t) * np.cos(p), np.sin(t) * np.sin(p), np.cos(t)], axis=-1).reshape(-1, 3)
+    vertices = np.concatenate([[[0.0, 0.0, 1.0]], body, [[0.0, 0.0, -1.0]]])
+    bottom = len(vertices) - 1
+
+    def Ring(r, s):
+        return 1 + r * segments + s % segments
+
+    triangles = []
+    for s in range(segments):
+        triangles.append((0, Ring(0, s), Ring(0, s + 1)))
+        triangles.append((bottom, Ring(rings - 2, s + 1), Ring(rings - 2, s)))
+        for r in range(rings - 2):
+            triangles.append((Ring(r, s), Ring(r + 1, s), Ring(r + 1, s + 1)))
+            triangles.append((Ring(r, s), Ring(r + 1, s + 1), Ring(r, s + 1)))
+    return vertices, np.array(triangles, dtype=np.int64)
+
+
+#########################
+# Times the decimator on a synthetic sphere. Runs with or without Blender.
+#########################
+def BenchmarkDecimator(segments = 256, rings = 128, ratios = (0.9, 0.75, 0.5, 0.2)):
+    vertices, triangles = MakeSphereMesh(segments, rings)
+    start = perf_counter()
+    levels = DecimateLevels(vertices, triangles, ratios)
+    elapsed = perf_counter() - start
+    print("Quadric decimator: {} triangles -> {} in {:.3f}s".format(len(triangles), [len(level[1]) for level in levels], elapsed))
+    return elapsed
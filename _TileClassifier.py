@@ -0,0 +1,237 @@
+"""
+Labels the objects of a tile from their geometry instead of their names.
+
+Keep this file next to _PrepareMainTileExport.py. Features are read for all objects in one pass with
+foreach_get and NumPy: world space bounding box, dominant face normal, triangle count and object type.
+The mesh part of the features is cached per mesh content hash, so running it again on an unchanged tile (or
+on instances of the same mesh) only hashes the mesh. The labels are then one lookup per object:
+
+    labels = classify_objects(bpy.context.scene.objects)
+    labels[obj.name]  # "HULL", "_LOD1", "NavMeshFloor", "NavMeshNorthWall", "LIGHT" or "OTHER"
+
+load_feature_cache/save_feature_cache keep the mesh features in a JSON file between runs. Only the features of
+meshes looked up since loading are saved, so the file doesn't keep meshes that were edited or deleted.
+"""
+import hashlib
+import json
+import numpy as np
+
+HULL = "HULL"
+LIGHT = "LIGHT"
+OTHER = "OTHER"
+LOD_LABELS = ("_LOD0", "_LOD1", "_LOD2", "_LOD3")
+
+# The hull is renamed to this, the name _NameNormalization.py makes active
+HULL_NAME = "MainHull"
+
+# An object thinner than this fraction of its largest extent is flat (floor, ceiling or wall)
+FLAT_RATIO = 0.05
+
+# Or one whose faces point this consistently the same way (1 for a perfect plane), ie. a diagonal wall
+PLANARITY = 0.95
+
+# LODs cover the hull's bounding box within this fraction of its size
+LOD_EXTENT_TOLERANCE = 0.1
+
+# A wall facing more than this fraction along both horizontal axes is a corner wall (ie. NorthEast)
+CORNER_COMPONENT = 0.35
+
+# Mesh features by mesh content hash: (local dominant normal, triangle count, planarity)
+FEATURE_CACHE = {}
+
+# Content hashes looked up since load_feature_cache, the entries save_feature_cache keeps
+USED_FEATURES = set()
+
+
+#########################
+# Content hash of a mesh's vertex positions and topology.
+#########################
+def mesh_hash(mesh):
+    h = hashlib.blake2b(digest_size=16)
+    co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", co)
+    loops = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loops)
+    starts = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("loop_start", starts)
+    for values in (co, loops, starts):
+        h.update(values.tobytes())
+    return h.hexdigest()
+
+
+#########################
+# Area weighted sum of the face normals (local space), triangle count and planarity of a mesh, cached by
+# content hash. Planarity is the length of that sum over the total area.
+#########################
+def mesh_features(mesh):
+    key = mesh_hash(mesh)
+    USED_FEATURES.add(key)
+    cached = FEATURE_CACHE.get(key)
+    if cached is None:
+        count = len(mesh.polygons)
+        normals = np.empty(count * 3, dtype=np.float32)
+        mesh.polygons.foreach_get("normal", normals)
+        areas = np.empty(count, dtype=np.float32)
+        mesh.polygons.foreach_get("area", areas)
+        sizes = np.empty(count, dtype=np.int32)
+        mesh.polygons.foreach_get("loop_total", sizes)
+        # Flat surfaces (floors, walls) are one-sided, so the signed average keeps their direction
+        normal = (normals.reshape(-1, 3) * areas[:, None]).sum(axis=0) if count else np.zeros(3)
+        total = float(areas.sum())
+        planarity = float(np.linalg.norm(normal)) / total if total > 0 else 0.0
+        cached = (normal.tolist(), int((sizes - 2).sum()), planarity)
+        FEATURE_CACHE[key] = cached
+    return cached
+
+
+def load_feature_cache(filepath):
+    USED_FEATURES.clear()
+    try:
+        with open(filepath) as f:
+            FEATURE_CACHE.update({key: tuple(features) for key, features in json.load(f).items()})
+    except (OSError, ValueError):
+        pass
+
+
+def save_feature_cache(filepath):
+    for key in set(FEATURE_CACHE) - USED_FEATURES:
+        del FEATURE_CACHE[key]
+    with open(filepath, "w") as f:
+        json.dump(FEATURE_CACHE, f)
+
+
+#########################
+# Features of all objects as arrays, one row per object: world bounding box min/max, world dominant normal
+# (unit length, zero for non-meshes), triangle count, planarity and whether the object is a mesh or a light.
+#########################
+def object_features(objects):
+    objects = list(objects)
+    n = len(objects)
+    corners = np.array([obj.bound_box[:] for obj in objects], dtype=np.float64).reshape(n, 8, 3)
+    matrices = np.array([obj.matrix_world for obj in objects], dtype=np.float64).reshape(n, 4, 4)
+    world = np.einsum('nij,nkj->nki', matrices[:, :3, :3], corners) + matrices[:, None, :3, 3]
+
+    local_normals = np.zeros((n, 3))
+    triangles = np.zeros(n, dtype=np.int64)
+    planarity = np.zeros(n)
+    for i, obj in enumerate(objects):
+        if obj.type == 'MESH':
+            local_normals[i], triangles[i], planarity[i] = mesh_features(obj.data)
+
+    # Normals go to world space with the inverse transpose of the rotation/scale part
+    normal_matrices = np.linalg.inv(matrices[:, :3, :3] + np.eye(3) * 1e-12).transpose(0, 2, 1)
+    normals = np.einsum('nij,nj->ni', normal_matrices, local_normals)
+    lengths = np.linalg.norm(normals, axis=1)
+    normals = np.divide(normals, lengths[:, None], out=np.zeros_like(normals), where=lengths[:, None] > 0)
+
+    return {
+        "min": world.min(axis=1),
+        "max": world.max(axis=1),
+        "normal": normals,
+        "triangles": triangles,
+        "planarity": planarity,
+        "mesh": np.array([obj.type == 'MESH' for obj in objects], dtype=bool),
+        "light": np.array([obj.type == 'LIGHT' for obj in objects], dtype=bool),
+    }
+
+
+#########################
+# Name of the wall facing (x, y) away from the tile center, ie. "NavMeshNorthWall" or "NavMeshEastSouthWall".
+# North is +Y and East is +X.
+#########################
+def wall_label(x, y):
+    east = x > CORNER_COMPONENT
+    west = x < -CORNER_COMPONENT
+    north = y > CORNER_COMPONENT
+    south = y < -CORNER_COMPONENT
+    if east and south:
+        return "NavMeshEastSouthWall"
+    if north and east:
+        return "NavMeshNorthEastWall"
+    if south and west:
+        return "NavMeshSouthWestWall"
+    if west and north:
+        return "NavMeshWestNorthWall"
+    if abs(x) >= abs(y):
+        return "NavMeshEastWall" if x > 0 else "NavMeshWestWall"
+    return "NavMeshNorthWall" if y > 0 else "NavMeshSouthWall"
+
+
+#########################
+# Labels every object from the arrays of object_features. The hull is the mesh with the largest bounding
+# box (most triangles among equals); meshes covering the same box with fewer triangles are its LODs, in order
+# of detail; flat meshes inside the hull's box are NavMesh floor, ceiling or walls depending on their normal
+# and on which side of the hull they are, and lights inside it are LIGHT. Without a hull everything is OTHER.
+#########################
+def classify_features(features):
+    lo, hi = features["min"], features["max"]
+    extents = hi - lo
+    centers = 0.5 * (lo + hi)
+    count = len(extents)
+    labels = np.full(count, OTHER, dtype=object)
+
+    meshes = features["mesh"]
+    largest = extents.max(axis=1)
+    flat = meshes & ((extents.min(axis=1) <= FLAT_RATIO * np.maximum(largest, 1e-12)) | (features["planarity"] >= PLANARITY))
+    solid = np.flatnonzero(meshes & ~flat)
+    if len(solid) == 0:
+        return labels.tolist()
+
+    # Hull and LODs: solid meshes with (nearly) the hull's bounding box
+    volume = np.prod(np.maximum(extents[solid], 1e-9), axis=1)
+    biggest = solid[np.argmax(volume)]
+    tolerance = LOD_EXTENT_TOLERANCE * largest[biggest]
+    same_box = solid[(np.abs(lo[solid] - lo[biggest]).max(axis=1) <= tolerance) & (np.abs(hi[solid] - hi[biggest]).max(axis=1) <= tolerance)]
+    by_detail = same_box[np.argsort(-features["triangles"][same_box], kind="stable")]
+    hull = by_detail[0]
+    labels[hull] = HULL
+    for label, index in zip(LOD_LABELS, by_detail[1:]):
+        labels[index] = label
+
+    # Only flat meshes and lights inside the hull's bounding box belong to the tile, planes, decals and
+    # lights elsewhere in the scene stay OTHER
+    inside = np.all((centers >= lo[hull] - tolerance) & (centers <= hi[hull] + tolerance), axis=1)
+    labels[features["light"] & inside] = LIGHT
+
+    # NavMesh surfaces: horizontal ones by height, vertical ones by the side of the hull they are on
+    normals = features["normal"]
+    hull_center = centers[hull]
+    hull_half = np.maximum(0.5 * extents[hull], 1e-9)
+    for index in np.flatnonzero(flat & inside):
+        nx, ny, nz = normals[index]
+        if abs(nz) >= max(abs(nx), abs(ny)):
+            labels[index] = "NavMeshFloor" if centers[index][2] <= hull_center[2] else "NavMeshCeiling"
+        else:
+            offset = (centers[index] - hull_center) / hull_half
+            labels[index] = wall_label(offset[0], offset[1])
+    return labels.tolist()
+
+
+#########################
+# Label for every object, by name.
+#########################
+def classify_objects(objects):
+    objects = list(objects)
+    if not objects:
+        return {}
+    return dict(zip((obj.name for obj in objects), classify_features(object_features(objects))))
+
+
+#########################
+# Renames and selection from the labels, in the format of _NameNormalization.plan_tile_selection:
+# (index, new name or None, select, make active) for every labelled object. NavMesh and LOD labels are the
+# names the objects get, the hull is renamed to HULL_NAME and made active.
+#########################
+def plan_from_labels(names, labels):
+    plan = []
+    for index, name in enumerate(names):
+        label = labels.get(name, OTHER)
+        if label == OTHER:
+            continue
+        if label == LIGHT:
+            plan.append((index, None, True, False))
+        elif label == HULL:
+            plan.append((index, HULL_NAME if name != HULL_NAME else None, True, True))
+        else:
+            plan.append((index, label if label != name else None, True, False))
+    return plan
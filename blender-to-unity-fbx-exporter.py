@@ -16,6 +16,14 @@ bl_info = {
 import bpy
 import mathutils
 import math
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import numpy as np
+from collections import deque
+from time import perf_counter
 
 
 # Multi-user datablocks are preserved here. Unique copies are made for applying the rotation.
@@ -32,39 +40,85 @@ disabled_collections = []
 disabled_objects = []
 
 
-def unhide_collections(col):
+class SceneIndex:
+	"""Per-export lookup tables, built with a single pass over bpy.data.objects.
+
+	Checking `ob.name in view_layer.objects`, reading `ob.children` or searching bpy.data.objects for the
+	users of a datablock each walk every object in the file, which made preparing large levels quadratic."""
+
+	def __init__(self, view_layer, objects = None):
+		self.view_layer = view_layer
+		self.view_layer_names = {ob.name for ob in view_layer.objects}
+		# Datablock -> objects using it, parent name -> child objects
+		self.users = dict()
+		self.children = dict()
+		# Names of objects with an armature modifier, and the number of visible modifiers per object
+		self.armature_deformed = set()
+		self.active_modifiers = dict()
+
+		for ob in bpy.data.objects if objects is None else objects:
+			if ob.data:
+				self.users.setdefault(ob.data, []).append(ob)
+			if ob.parent:
+				self.children.setdefault(ob.parent.name, []).append(ob)
+			modifiers = 0
+			for mod in ob.modifiers:
+				if mod.type == 'ARMATURE':
+					self.armature_deformed.add(ob.name)
+				if mod.show_viewport:
+					modifiers += 1
+			self.active_modifiers[ob.name] = modifiers
+
+	def in_view_layer(self, ob):
+		return ob.name in self.view_layer_names
+
+	def children_of(self, ob):
+		return self.children.get(ob.name, ())
+
+
+def walk_layer_collections(root):
+	# Breadth-first over the layer collection tree without recursion, so any nesting depth works.
+	# Excluded collections and everything below them are skipped, their objects aren't in the view layer.
+	queue = deque([root])
+	while queue:
+		col = queue.popleft()
+		if col.exclude:
+			continue
+		yield col
+		queue.extend(col.children)
+
+
+def unhide_collections(root):
 	global hidden_collections
 	global disabled_collections
 
-	# No need to unhide excluded collections. Their objects aren't included in current view layer.
-	if col.exclude:
-		return
+	# Find hidden and disabled child collections first, then change them all at once
+	hidden = []
+	disabled = []
+	for col in walk_layer_collections(root):
+		for item in col.children:
+			if item.exclude:
+				continue
+			if item.hide_viewport:
+				hidden.append(item)
+			if item.collection.hide_viewport:
+				disabled.append(item)
 
-	# Find hidden child collections and unhide them
-	hidden = [item for item in col.children if not item.exclude and item.hide_viewport]
 	for item in hidden:
 		item.hide_viewport = False
-
-	# Add them to the list so they could be restored later
-	hidden_collections.extend(hidden)
-
-	# Same with the disabled collections
-	disabled = [item for item in col.children if not item.exclude and item.collection.hide_viewport]
 	for item in disabled:
 		item.collection.hide_viewport = False
 
+	# Add them to the lists so they could be restored later
+	hidden_collections.extend(hidden)
 	disabled_collections.extend(disabled)
 
-	# Recursively unhide child collections
-	for item in col.children:
-		unhide_collections(item)
 
-
-def unhide_objects():
+def unhide_objects(index):
 	global hidden_objects
 	global disabled_objects
 
-	view_layer_objects = [ob for ob in bpy.data.objects if ob.name in bpy.context.view_layer.objects]
+	view_layer_objects = [ob for ob in bpy.data.objects if index.in_view_layer(ob)]
 
 	for ob in view_layer_objects:
 		if ob.hide_get():
@@ -75,40 +129,37 @@ def unhide_objects():
 			ob.hide_viewport = False
 
 
-def make_single_user_data():
+def make_single_user_data(index):
 	global shared_data
 
-	for ob in bpy.data.objects:
-		if ob.data and ob.data.users > 1:
-			# Figure out actual users of this datablock (not counting fake users)
-			users = [user for user in bpy.data.objects if user.data == ob.data]
-			if len(users) > 1:
-				# Store shared mesh data (MESH objects only).
-				# Other shared datablocks (CURVE, FONT, etc) are always exported as separate meshes
-				# by the built-in FBX exporter.
-				if ob.type == 'MESH':
-					# Shared mesh data will be restored if users have no active modifiers
-					modifiers = 0
-					for user in users:
-						modifiers += len([mod for mod in user.modifiers if mod.show_viewport])
-					if modifiers == 0:
-						shared_data[ob.name] = ob.data
+	# Actual users of every datablock (not counting fake users)
+	for data, users in index.users.items():
+		if len(users) > 1:
+			# Store shared mesh data (MESH objects only).
+			# Other shared datablocks (CURVE, FONT, etc) are always exported as separate meshes
+			# by the built-in FBX exporter.
+			# Shared mesh data will be restored if users have no active modifiers
+			keep_shared = sum(index.active_modifiers[user.name] for user in users) == 0
 
-				# Single-user data is mandatory in all object types, otherwise we can't apply the rotation.
-				ob.data = ob.data.copy()
+			# Single-user data is mandatory in all object types, otherwise we can't apply the rotation.
+			# The last user keeps the original datablock.
+			for ob in users[:-1]:
+				if ob.type == 'MESH' and keep_shared:
+					shared_data[ob.name] = data
+				ob.data = data.copy()
 
 
-def apply_object_modifiers():
+def apply_object_modifiers(index):
 	# Select objects in current view layer not using an armature modifier
 	bpy.ops.object.select_all(action='DESELECT')
 	for ob in bpy.data.objects:
-		if ob.name in bpy.context.view_layer.objects:
-			bypass_modifiers = False
-			for mod in ob.modifiers:
-				if mod.type == 'ARMATURE':
-					bypass_modifiers = True
-			if not bypass_modifiers:
-				ob.select_set(True)
+		if index.in_view_layer(ob) and ob.name not in index.armature_deformed:
+			ob.select_set(True)
+
+	# convert needs an active object. Without one (ie. from the batch exporter) curves and text were left
+	# unconverted and the FBX exporter skipped them.
+	if bpy.context.view_layer.objects.active is None and bpy.context.selected_objects:
+		bpy.context.view_layer.objects.active = bpy.context.selected_objects[0]
 
 	# Conversion to mesh may not be available depending on the remaining objects
 	if bpy.ops.object.convert.poll():
@@ -129,9 +180,27 @@ def apply_rotation(ob):
 	bpy.ops.object.transform_apply(location = False, rotation = True, scale = False)
 
 
-def fix_object(ob):
-	# Only fix objects in current view layer
-	if ob.name in bpy.context.view_layer.objects:
+def walk_hierarchy(root_objects, index, depth_first = False):
+	# Breadth-first over the object hierarchy using the index's children table, parents before their
+	# children. No recursion, so hierarchies thousands of levels deep work, and every object is visited once.
+	# depth_first visits the objects in the order of the old recursive walk instead.
+	queue = deque(reversed(root_objects) if depth_first else root_objects)
+	seen = set()
+	while queue:
+		ob = queue.pop() if depth_first else queue.popleft()
+		if ob.name in seen:
+			continue
+		seen.add(ob.name)
+		yield ob
+		# Children may be in the current view layer even if their parent isn't.
+		queue.extend(reversed(index.children_of(ob)) if depth_first else index.children_of(ob))
+
+
+def fix_object(root, index, depth_first = False):
+	for ob in walk_hierarchy([root], index, depth_first):
+		# Only fix objects in current view layer
+		if not index.in_view_layer(ob):
+			continue
 
 		# Reset parent's inverse so we can work with local transform directly
 		reset_parent_inverse(ob)
@@ -146,13 +215,656 @@ def fix_object(ob):
 		# Reapply the previous local transform with an X+90 rotation
 		ob.matrix_local = mat_original @ mathutils.Matrix.Rotation(math.radians(90.0), 4, 'X')
 
-	# Recursively fix child objects in current view layer.
-	# Children may be in the current view layer even if their parent isn't.
-	for child in ob.children:
-		fix_object(child)
+
+X_MINUS_90 = mathutils.Matrix.Rotation(math.radians(-90.0), 4, 'X')
+X_PLUS_90 = mathutils.Matrix.Rotation(math.radians(90.0), 4, 'X')
+
+
+def bake_rotation(data, matrix):
+	# Same data types transform_apply bakes the rotation into
+	if isinstance(data, (bpy.types.Mesh, bpy.types.Curve, bpy.types.Lattice)):
+		data.transform(matrix, shape_keys=True)
+	elif isinstance(data, bpy.types.Armature):
+		data.transform(matrix)
+
+
+def fix_hierarchy(root_objects, index):
+	# Same result as fix_object on every root, computed with matrices in a single walk instead of one
+	# transform_apply (and depsgraph update) per object. Every fixed object keeps its world transform
+	# rotated by X+90 and gets X-90 baked into its data, each datablock only once.
+	index.view_layer.update()
+	fixed_worlds = dict()
+	baked = set()
+
+	for ob in walk_hierarchy(root_objects, index):
+		parent = ob.parent
+
+		if index.in_view_layer(ob):
+			world = ob.matrix_world @ X_PLUS_90
+			parent_world = fixed_worlds.get(parent.name, parent.matrix_world) if parent else mathutils.Matrix.Identity(4)
+			ob.matrix_parent_inverse.identity()
+			ob.matrix_basis = parent_world.inverted() @ world
+			fixed_worlds[ob.name] = world
+
+			if ob.data and ob.data not in baked:
+				baked.add(ob.data)
+				bake_rotation(ob.data, X_MINUS_90)
+
+		elif parent and parent.name in fixed_worlds:
+			# transform_apply keeps children outside the view layer in place through their parent inverse
+			ob.matrix_parent_inverse = X_MINUS_90 @ ob.matrix_parent_inverse
+
+
+def fix_rotations(root_objects, index, rotation_engine):
+	if rotation_engine == 'MATRIX':
+		fix_hierarchy(root_objects, index)
+	else:
+		for ob in root_objects:
+			fix_object(ob, index)
+
+
+def make_rotation_test_scene(instances = 3):
+	# Fills the current scene with the cases compare_rotation_engines has to agree on: a mesh shared by
+	# several rotated and scaled instances, children of those instances (one with a parent inverse, one
+	# sharing the mesh too) and a parented curve. Returns the created objects.
+	collection = bpy.context.scene.collection
+	mesh = bpy.data.meshes.new("RotationTestMesh")
+	mesh.from_pydata([(0, 0, 0), (1, 0, 0), (1, 1, 0.5), (0, 1, 1)], [], [(0, 1, 2, 3)])
+	curve = bpy.data.curves.new("RotationTestCurve", 'CURVE')
+	curve.dimensions = '3D'
+	spline = curve.splines.new('POLY')
+	spline.points.add(2)
+	spline.points.foreach_set("co", (0, 0, 0, 1, 1, 0, 0.5, 1, 1, 1, 1, 1))
+
+	created = []
+	for i in range(instances):
+		root = bpy.data.objects.new("RotationTestRoot{}".format(i), mesh)
+		root.location = (3.0 * i, 0.0, 0.0)
+		root.rotation_euler = (0.3 * i, 0.2, 0.1 * i)
+		root.scale = (1.0, 1.0 + 0.5 * i, 1.0)
+
+		child = bpy.data.objects.new("RotationTestChild{}".format(i), mesh)
+		child.parent = root
+		child.location = (0.0, 2.0, 0.0)
+		child.rotation_euler = (0.0, 0.4, 0.0)
+
+		inverse_child = bpy.data.objects.new("RotationTestInverseChild{}".format(i), mesh.copy())
+		inverse_child.parent = root
+		inverse_child.matrix_parent_inverse = mathutils.Matrix.Translation((0.5, -1.0, 0.25))
+
+		curve_child = bpy.data.objects.new("RotationTestCurve{}".format(i), curve)
+		curve_child.parent = child
+
+		for ob in (root, child, inverse_child, curve_child):
+			collection.objects.link(ob)
+			created.append(ob)
+	bpy.context.view_layer.update()
+	return created
+
+
+def compare_rotation_engines(tolerance = 1e-4):
+	# Regression check for the rotation engines. Fixes the rotations of the open file with the operator
+	# engine in the depth-first order of the original exporter, then with both engines as they run now
+	# (undoing in between), and compares the resulting local/world matrices and world space mesh and curve
+	# points of every object. Returns "<engine>: <object>" for every object that differs, the file is left
+	# as it was. make_rotation_test_scene builds a test scene with instanced meshes and children, and
+	# running this script with --compare-rotation-engines checks from the command line.
+	def snapshot(fix):
+		global shared_data
+		shared_data = dict()
+		bpy.ops.ed.undo_push(message="Compare rotation engines")
+		if bpy.ops.object.mode_set.poll():
+			bpy.ops.object.mode_set(mode="OBJECT")
+		index = SceneIndex(bpy.context.view_layer)
+		make_single_user_data(index)
+		root_objects = [ob for ob in bpy.data.objects if not ob.parent]
+		fix(root_objects, index)
+		for item in shared_data:
+			bpy.data.objects[item].data = shared_data[item]
+		bpy.context.view_layer.update()
+
+		result = dict()
+		for ob in bpy.data.objects:
+			world = ob.matrix_world
+			points = []
+			if ob.type == 'MESH':
+				points = [world @ v.co for v in ob.data.vertices[:100]]
+			elif ob.type == 'CURVE':
+				points = [world @ point.co.to_3d() for spline in ob.data.splines for point in spline.points][:100]
+			result[ob.name] = (ob.matrix_local.copy(), world.copy(), points)
+
+		bpy.ops.ed.undo_push(message="")
+		bpy.ops.ed.undo()
+		return result
+
+	def differs(a, b):
+		return any(abs(x - y) > tolerance for row_a, row_b in zip(a, b) for x, y in zip(row_a, row_b))
+
+	def fix_depth_first(root_objects, index):
+		for ob in root_objects:
+			fix_object(ob, index, depth_first=True)
+
+	expected = snapshot(fix_depth_first)
+	mismatches = []
+	for rotation_engine in ('OPERATOR', 'MATRIX'):
+		actual = snapshot(lambda root_objects, index: fix_rotations(root_objects, index, rotation_engine))
+		for name, (local, world, points) in expected.items():
+			other_local, other_world, other_points = actual[name]
+			if differs(local, other_local) or differs(world, other_world) or len(points) != len(other_points) or any(differs([a], [b]) for a, b in zip(points, other_points)):
+				mismatches.append("{}: {}".format(rotation_engine, name))
+
+	print("Rotation engines match" if not mismatches else "Rotation engines differ for: " + ", ".join(mismatches))
+	return mismatches
+
+
+def imported_transforms(filepath):
+	# World matrices and world space vertex positions of the objects in an FBX file, by name. The file is
+	# imported into a temporary scene that is removed again.
+	scene = bpy.data.scenes.new("Unity FBX Comparison")
+	view_layer = scene.view_layers[0]
+	result = dict()
+	try:
+		with bpy.context.temp_override(scene=scene, view_layer=view_layer):
+			bpy.ops.import_scene.fbx(filepath=filepath)
+		view_layer.update()
+		for ob in scene.objects:
+			points = [ob.matrix_world @ v.co for v in ob.data.vertices[:100]] if ob.type == 'MESH' else []
+			result[ob.name] = (ob.matrix_world.copy(), points)
+	finally:
+		imported = list(scene.objects)
+		data = [ob.data for ob in imported if ob.data]
+		bpy.data.batch_remove(imported)
+		bpy.data.batch_remove([item for item in data if item.users == 0])
+		bpy.data.scenes.remove(scene)
+	return result
+
+
+def compare_export_modes(tolerance = 1e-4):
+	# Regression check for Export From Copy (the matrix engine on a temporary scene). Exports the open file in
+	# place with the operator engine and from a copy, imports both FBX files again and compares the object
+	# matrices and vertex positions. Returns the names of the objects that differ.
+	directory = tempfile.mkdtemp(prefix="unity_fbx_compare_")
+	try:
+		results = []
+		for from_copy in (False, True):
+			filepath = os.path.join(directory, "from_copy.fbx" if from_copy else "in_place.fbx")
+			export_unity_fbx(bpy.context, filepath, False, False, False, False, 'Y', 'X', False, False, 'OPERATOR', from_copy)
+			results.append(imported_transforms(filepath) if os.path.isfile(filepath) else dict())
+	finally:
+		shutil.rmtree(directory, ignore_errors=True)
+
+	def differs(a, b):
+		return any(abs(x - y) > tolerance for row_a, row_b in zip(a, b) for x, y in zip(row_a, row_b))
+
+	expected, actual = results
+	mismatches = sorted(set(expected) ^ set(actual))
+	for name in sorted(set(expected) & set(actual)):
+		(world, points), (other_world, other_points) = expected[name], actual[name]
+		if differs(world, other_world) or len(points) != len(other_points) or differs(points, other_points):
+			mismatches.append(name)
+
+	print("Export modes match" if not mismatches else "Export modes differ for: " + ", ".join(mismatches))
+	return mismatches
+
+
+def benchmark_hierarchy_walks(depth = 5000, width = 5000):
+	# Times walk_hierarchy and unhide_collections on synthetic hierarchies in a temporary scene: a chain of
+	# depth nested empties and collections, and width empties and collections under a single parent.
+	# The old recursive walk is timed on the same data for comparison, it fails on the deep chain once
+	# depth passes Python's recursion limit. Run it from the Python console; everything is removed again.
+	global hidden_collections
+	global disabled_collections
+
+	def recursive_walk(ob, index, visited):
+		visited.append(ob)
+		for child in index.children_of(ob):
+			recursive_walk(child, index, visited)
+
+	scene = bpy.data.scenes.new("Hierarchy Benchmark")
+	view_layer = scene.view_layers[0]
+	created_objects = []
+	created_collections = []
+	results = dict()
+	try:
+		for shape in ("deep", "wide"):
+			count = depth if shape == "deep" else width
+			root = bpy.data.objects.new("{}_root".format(shape), None)
+			scene.collection.objects.link(root)
+			created_objects.append(root)
+			parent = root
+			for i in range(count):
+				ob = bpy.data.objects.new("{}_{}".format(shape, i), None)
+				ob.parent = parent
+				scene.collection.objects.link(ob)
+				created_objects.append(ob)
+				if shape == "deep":
+					parent = ob
+
+			col_parent = scene.collection
+			for i in range(count):
+				col = bpy.data.collections.new("{}_collection_{}".format(shape, i))
+				col.hide_viewport = True
+				col_parent.children.link(col)
+				created_collections.append(col)
+				if shape == "deep":
+					col_parent = col
+
+			index = SceneIndex(view_layer, created_objects)
+
+			start = perf_counter()
+			visited = sum(1 for _ in walk_hierarchy([root], index))
+			results[shape + " walk_hierarchy"] = (perf_counter() - start, visited)
+
+			start = perf_counter()
+			try:
+				visited = []
+				recursive_walk(root, index, visited)
+				results[shape + " recursive walk"] = (perf_counter() - start, len(visited))
+			except RecursionError:
+				results[shape + " recursive walk"] = (perf_counter() - start, "RecursionError")
+
+			hidden_collections = []
+			disabled_collections = []
+			start = perf_counter()
+			unhide_collections(view_layer.layer_collection)
+			results[shape + " unhide_collections"] = (perf_counter() - start, sum(1 for col in disabled_collections if col.name.startswith(shape)))
+
+			for col in disabled_collections:
+				col.collection.hide_viewport = True
+			hidden_collections = []
+			disabled_collections = []
+	finally:
+		bpy.data.batch_remove(created_objects + created_collections)
+		bpy.data.scenes.remove(scene)
+
+	for name, (seconds, count) in results.items():
+		print("{:<28} {:>9.4f}s  {}".format(name, seconds, count))
+	return results
+
+
+def exported_objects(context, active_collection, selected_objects):
+	# The objects the FBX exporter would write with these selection options
+	objects = list(context.view_layer.objects)
+	if active_collection:
+		collection_objects = set(context.view_layer.active_layer_collection.collection.all_objects)
+		objects = [ob for ob in objects if ob in collection_objects]
+	if selected_objects:
+		objects = [ob for ob in objects if ob.select_get()]
+	return [ob for ob in objects if ob.type in {'EMPTY', 'MESH', 'ARMATURE', 'FONT', 'CURVE', 'SURFACE'}]
+
+
+def export_unity_fbx_from_copy(context, filepath, active_collection, selected_objects, deform_bones, leaf_bones, primary_bone_axis, secondary_bone_axis, tangent_space, triangulate_faces):
+	# Non-destructive export. The Unity-ready objects are built in a temporary scene from the evaluated
+	# objects, exported and freed again, so the user's scene is never modified and no undo snapshot of the
+	# whole file is needed. Originals are only renamed while the copies are exported under their names.
+	print("Preparing 3D model for Unity from a temporary copy...")
+
+	if bpy.ops.object.mode_set.poll():
+		bpy.ops.object.mode_set(mode="OBJECT")
+
+	depsgraph = context.evaluated_depsgraph_get()
+	index = SceneIndex(context.view_layer)
+	originals = exported_objects(context, active_collection, selected_objects)
+	active = context.view_layer.objects.active
+
+	temp_scene = bpy.data.scenes.new("Unity FBX Export")
+	copies = dict()
+	new_data = []
+	baked_meshes = dict()
+	renamed = []
+
+	try:
+		for ob in originals:
+			if ob.type in {'MESH', 'FONT', 'CURVE', 'SURFACE'} and ob.name not in index.armature_deformed:
+				# Modifiers applied and curves converted, once per shared datablock without modifiers
+				key = ob.data if index.active_modifiers[ob.name] == 0 and ob.type == 'MESH' else ob
+				mesh = baked_meshes.get(key)
+				if mesh is None:
+					mesh = bpy.data.meshes.new_from_object(ob.evaluated_get(depsgraph), preserve_all_data_layers=True, depsgraph=depsgraph)
+					baked_meshes[key] = mesh
+					new_data.append(mesh)
+				if ob.type == 'MESH':
+					copy = ob.copy()
+					copy.data = mesh
+					copy.modifiers.clear()
+				else:
+					copy = bpy.data.objects.new(ob.name, mesh)
+					# The baked mesh has the curve's data materials, slots linked to the object are set again
+					for slot, source in zip(copy.material_slots, ob.material_slots):
+						if source.link == 'OBJECT':
+							slot.link = 'OBJECT'
+							slot.material = source.material
+			else:
+				copy = ob.copy()
+				if ob.data:
+					copy.data = ob.data.copy()
+					new_data.append(copy.data)
+			temp_scene.collection.objects.link(copy)
+			copies[ob] = copy
+
+		# Rebuild the hierarchy between the copies with the current world transforms and clean parent inverses
+		for ob, copy in copies.items():
+			parent = copies.get(ob.parent)
+			copy.parent = parent
+			copy.matrix_parent_inverse.identity()
+			copy.matrix_basis = ob.parent.matrix_world.inverted() @ ob.matrix_world if parent else ob.matrix_world.copy()
+			for mod in copy.modifiers:
+				if getattr(mod, "object", None) in copies:
+					mod.object = copies[mod.object]
+
+		# Same as moving the active object to the origin in export_unity_fbx
+		if active in copies:
+			copies[active].location = (0, 0, 0)
+
+		# A new view layer only lists its objects once it is updated, SceneIndex would find none of them
+		temp_view_layer = temp_scene.view_layers[0]
+		temp_view_layer.update()
+		temp_index = SceneIndex(temp_view_layer, list(copies.values()))
+		fix_hierarchy([copy for copy in copies.values() if not copy.parent], temp_index)
+
+		# The copies take over the names of the originals, those are what ends up in the FBX
+		for ob, copy in copies.items():
+			if ob.library is None:
+				name = ob.name
+				ob.name = name + ".unity_export_original"
+				copy.name = name
+				renamed.append((ob, name))
+
+		params = unity_fbx_params(filepath, False, False, deform_bones, leaf_bones, primary_bone_axis, secondary_bone_axis, tangent_space, triangulate_faces)
+		print("Invoking default FBX Exporter:", params)
+		if hasattr(context, "temp_override"):
+			with context.temp_override(scene=temp_scene, view_layer=temp_view_layer):
+				bpy.ops.export_scene.fbx(**params)
+		else:
+			bpy.ops.export_scene.fbx(dict(scene=temp_scene, view_layer=temp_view_layer), **params)
+		print("FBX file for Unity saved.")
+
+	except Exception as e:
+		print(e)
+		print("File not saved.")
+
+	finally:
+		bpy.data.batch_remove(list(copies.values()))
+		for ob, name in renamed:
+			ob.name = name
+		bpy.data.batch_remove([data for data in new_data if data.users == 0])
+		bpy.data.scenes.remove(temp_scene)
+
+	return {'FINISHED'}
 
 
-def export_unity_fbx(context, filepath, active_collection, selected_objects, deform_bones, leaf_bones, primary_bone_axis, secondary_bone_axis, tangent_space, triangulate_faces):
+def unity_fbx_params(filepath, active_collection, selected_objects, deform_bones, leaf_bones, primary_bone_axis, secondary_bone_axis, tangent_space, triangulate_faces):
+	return dict(filepath=filepath, apply_scale_options='FBX_SCALE_UNITS', object_types={'EMPTY', 'MESH', 'ARMATURE'}, use_active_collection=active_collection, use_selection=selected_objects, use_armature_deform_only=deform_bones, add_leaf_bones=leaf_bones, primary_bone_axis=primary_bone_axis, secondary_bone_axis=secondary_bone_axis, use_tspace=tangent_space, use_triangles=triangulate_faces)
+
+
+# Bump when a change to this exporter changes the FBX files it writes, so cached exports are rebuilt
+EXPORT_CACHE_VERSION = 3
+
+# Default size limit of the export cache directory
+EXPORT_CACHE_MAX_BYTES = 4 * 1024 ** 3
+
+
+class ExportCache:
+	"""Content-addressed store of exported FBX files. Each file is named after the hash of everything that
+	went into it (see export_cache_key), so an unchanged export is a file copy. Files are touched when used
+	and the least recently used ones are removed once the directory grows past max_bytes. There is no index
+	file, so several Blender processes can share one directory."""
+
+	def __init__(self, cache_dir, max_bytes = EXPORT_CACHE_MAX_BYTES):
+		self.cache_dir = cache_dir
+		self.max_bytes = max_bytes
+		# "cached", "exported", "up to date" or "would rebuild" after each export_unity_fbx call
+		self.last_status = None
+		os.makedirs(cache_dir, exist_ok=True)
+
+	def path(self, key):
+		return os.path.join(self.cache_dir, key + ".fbx")
+
+	def contains(self, key):
+		return os.path.isfile(self.path(key))
+
+	def fetch(self, key, filepath):
+		# Copies the cached export to filepath. Returns False when there is none.
+		cached = self.path(key)
+		try:
+			shutil.copyfile(cached, filepath)
+			os.utime(cached)
+		except FileNotFoundError:
+			return False
+		return True
+
+	def store(self, key, filepath):
+		temp = self.path(key) + ".{}.tmp".format(os.getpid())
+		shutil.copyfile(filepath, temp)
+		os.replace(temp, self.path(key))
+		self.evict()
+
+	def evict(self):
+		entries = []
+		for entry in os.scandir(self.cache_dir):
+			if entry.name.endswith(".fbx"):
+				stat = entry.stat()
+				entries.append((stat.st_mtime, stat.st_size, entry.path))
+		total = sum(size for _, size, _ in entries)
+		for _, size, path in sorted(entries):
+			if total <= self.max_bytes:
+				break
+			try:
+				os.remove(path)
+			except FileNotFoundError:
+				pass
+			total -= size
+
+
+def hash_array(h, collection, attribute, count, dtype):
+	values = np.empty(count, dtype=dtype)
+	collection.foreach_get(attribute, values)
+	h.update(values.tobytes())
+
+
+# Generic attribute types -> (foreach_get property, values per element, dtype)
+ATTRIBUTE_ARRAYS = {
+	'FLOAT': ("value", 1, np.float32),
+	'INT': ("value", 1, np.int32),
+	'INT8': ("value", 1, np.int32),
+	'BOOLEAN': ("value", 1, bool),
+	'FLOAT2': ("vector", 2, np.float32),
+	'FLOAT_VECTOR': ("vector", 3, np.float32),
+	'FLOAT_COLOR': ("color", 4, np.float32),
+	'BYTE_COLOR': ("color", 4, np.float32),
+}
+
+
+def hash_mesh(h, mesh):
+	hash_array(h, mesh.vertices, "co", len(mesh.vertices) * 3, np.float32)
+	hash_array(h, mesh.edges, "vertices", len(mesh.edges) * 2, np.int32)
+	hash_array(h, mesh.edges, "use_seam", len(mesh.edges), bool)
+	hash_array(h, mesh.edges, "use_edge_sharp", len(mesh.edges), bool)
+	hash_array(h, mesh.loops, "vertex_index", len(mesh.loops), np.int32)
+	hash_array(h, mesh.polygons, "loop_start", len(mesh.polygons), np.int32)
+	hash_array(h, mesh.polygons, "material_index", len(mesh.polygons), np.int32)
+	hash_array(h, mesh.polygons, "use_smooth", len(mesh.polygons), bool)
+	for layer in mesh.uv_layers:
+		h.update(layer.name.encode())
+		hash_array(h, layer.data, "uv", len(mesh.loops) * 2, np.float32)
+
+	# Color attributes and any other generic attribute. Internal ones (.select_vert, .hide_poly, ...) only
+	# hold editing state
+	for attribute in mesh.attributes:
+		if attribute.name.startswith("."):
+			continue
+		h.update(repr((attribute.name, attribute.domain, attribute.data_type)).encode())
+		array = ATTRIBUTE_ARRAYS.get(attribute.data_type)
+		if array:
+			prop, width, dtype = array
+			hash_array(h, attribute.data, prop, len(attribute.data) * width, dtype)
+
+	# Custom split normals
+	if mesh.has_custom_normals:
+		if hasattr(mesh, "calc_normals_split"):
+			mesh.calc_normals_split()
+		hash_array(h, mesh.loops, "normal", len(mesh.loops) * 3, np.float32)
+
+	if mesh.shape_keys:
+		for block in mesh.shape_keys.key_blocks:
+			h.update(repr((block.name, block.relative_key.name, block.value, block.slider_min, block.slider_max, block.mute, block.vertex_group)).encode())
+			hash_array(h, block.data, "co", len(block.data) * 3, np.float32)
+
+
+def hash_vertex_groups(h, ob, mesh_weights):
+	# Names and weights, what armature skinning in the FBX is made of. The FBX exporter only writes weights
+	# for meshes with an Armature modifier, other vertex groups only matter through the evaluated mesh. The
+	# weights belong to the mesh, so they are read once per mesh (mesh_weights keeps their digests) into flat
+	# NumPy arrays: the number of groups of every vertex, then their group indices and weights.
+	h.update(repr([group.name for group in ob.vertex_groups]).encode())
+	if not ob.vertex_groups or ob.type != 'MESH' or not any(mod.type == 'ARMATURE' for mod in ob.modifiers):
+		return
+	digest = mesh_weights.get(ob.data)
+	if digest is None:
+		vertices = ob.data.vertices
+		counts = np.fromiter((len(v.groups) for v in vertices), dtype=np.int32, count=len(vertices))
+		total = int(counts.sum())
+		groups = np.fromiter((g.group for v in vertices for g in v.groups), dtype=np.int32, count=total)
+		weights = np.fromiter((g.weight for v in vertices for g in v.groups), dtype=np.float32, count=total)
+		digest = hashlib.blake2b(counts.tobytes() + groups.tobytes() + weights.tobytes(), digest_size=20).digest()
+		mesh_weights[ob.data] = digest
+	h.update(digest)
+
+
+def hash_action(h, action):
+	h.update(action.name.encode())
+	for fcurve in action.fcurves:
+		h.update(repr((fcurve.data_path, fcurve.array_index, fcurve.extrapolation, fcurve.mute)).encode())
+		points = fcurve.keyframe_points
+		h.update(repr([(point.interpolation, point.easing) for point in points]).encode())
+		for attribute in ("co", "handle_left", "handle_right"):
+			hash_array(h, points, attribute, len(points) * 2, np.float32)
+
+
+def socket_value(socket):
+	value = getattr(socket, "default_value", None)
+	if value is None or isinstance(value, (bool, int, float, str)):
+		return value
+	if isinstance(value, bpy.types.ID):
+		return value.name
+	return tuple(value)
+
+
+def hash_material(h, material):
+	# The settings and node tree the FBX exporter reads the material from
+	h.update(repr((material.name, tuple(material.diffuse_color), material.metallic, material.roughness, material.blend_method, material.use_backface_culling)).encode())
+	if material.use_nodes and material.node_tree:
+		for node in material.node_tree.nodes:
+			image = getattr(node, "image", None)
+			h.update(repr((node.name, node.bl_idname, image.filepath if image else None, [(socket.identifier, socket_value(socket)) for socket in node.inputs])).encode())
+		h.update(repr([(link.from_node.name, link.from_socket.identifier, link.to_node.name, link.to_socket.identifier) for link in material.node_tree.links]).encode())
+
+
+def hash_referenced_objects(h, mod, depsgraph):
+	# Geometry and placement of the objects a modifier uses (ie. a Boolean cutter), only their names are
+	# part of modifier_settings
+	objects = []
+	for prop in mod.bl_rna.properties:
+		if prop.type != 'POINTER':
+			continue
+		value = getattr(mod, prop.identifier, None)
+		if isinstance(value, bpy.types.Object):
+			objects.append(value)
+		elif isinstance(value, bpy.types.Collection):
+			objects.extend(value.all_objects)
+	for ob in objects:
+		h.update(repr([tuple(row) for row in ob.matrix_world]).encode())
+		if ob.type in {'MESH', 'FONT', 'CURVE', 'SURFACE'}:
+			evaluated = ob.evaluated_get(depsgraph)
+			hash_mesh(h, evaluated.to_mesh())
+			evaluated.to_mesh_clear()
+
+
+def modifier_settings(mod):
+	settings = [mod.type, mod.name]
+	for prop in mod.bl_rna.properties:
+		if prop.identifier == "rna_type" or prop.type == 'COLLECTION':
+			continue
+		value = getattr(mod, prop.identifier, None)
+		if prop.type == 'POINTER':
+			value = value.name if isinstance(value, bpy.types.ID) else None
+		elif getattr(prop, "array_length", 0):
+			value = tuple(value)
+		settings.append((prop.identifier, value))
+	return repr(settings)
+
+
+def export_cache_key(context, filepath, active_collection, selected_objects, options):
+	# Hash of everything that ends up in the FBX: the exported objects' transforms, hierarchy, materials,
+	# modifier stacks (and the objects they use), animation, skinning and mesh data, plus the exporter options.
+	# The FBX stores the .blend file's path and texture paths relative to the output folder, so a cached
+	# file is only reused for the same .blend file and output folder.
+	h = hashlib.blake2b(digest_size=20)
+	h.update(repr((EXPORT_CACHE_VERSION, bl_info["version"], bpy.app.version_string, sorted(options.items()))).encode())
+	h.update(repr((os.path.normcase(os.path.abspath(bpy.data.filepath)) if bpy.data.filepath else "", os.path.normcase(os.path.dirname(os.path.abspath(filepath))))).encode())
+	active = context.view_layer.objects.active
+	h.update(repr(active.name if active else None).encode())
+
+	depsgraph = context.evaluated_depsgraph_get()
+	materials = set()
+	mesh_weights = dict()
+	for ob in sorted(exported_objects(context, active_collection, selected_objects), key=lambda ob: ob.name):
+		h.update(repr((ob.name, ob.type, ob.parent.name if ob.parent else None, [tuple(row) for row in ob.matrix_world])).encode())
+		h.update(repr([slot.material.name if slot.material else None for slot in ob.material_slots]).encode())
+		for slot in ob.material_slots:
+			if slot.material and slot.material not in materials:
+				materials.add(slot.material)
+				hash_material(h, slot.material)
+		for mod in ob.modifiers:
+			h.update(modifier_settings(mod).encode())
+			hash_referenced_objects(h, mod, depsgraph)
+		if ob.animation_data and ob.animation_data.action:
+			hash_action(h, ob.animation_data.action)
+		hash_vertex_groups(h, ob, mesh_weights)
+
+		# Meshes with modifiers are hashed as they are exported, with the modifiers applied
+		if ob.type == 'MESH' and not ob.modifiers:
+			hash_mesh(h, ob.data)
+		elif ob.type in {'MESH', 'FONT', 'CURVE', 'SURFACE'}:
+			evaluated = ob.evaluated_get(depsgraph)
+			hash_mesh(h, evaluated.to_mesh())
+			evaluated.to_mesh_clear()
+		elif ob.type == 'ARMATURE':
+			for attribute in ("head_local", "tail_local"):
+				hash_array(h, ob.data.bones, attribute, len(ob.data.bones) * 3, np.float32)
+			h.update(repr([bone.name for bone in ob.data.bones]).encode())
+	return h.hexdigest()
+
+
+def export_unity_fbx(context, filepath, active_collection, selected_objects, deform_bones, leaf_bones, primary_bone_axis, secondary_bone_axis, tangent_space, triangulate_faces, rotation_engine = 'OPERATOR', from_copy = False, cache = None, dry_run = False):
+	# With an ExportCache, unchanged exports are copied from the cache instead of being prepared and written
+	# again. dry_run only sets cache.last_status to tell whether the export would be rebuilt.
+	if cache is not None:
+		options = dict(deform_bones=deform_bones, leaf_bones=leaf_bones, primary_bone_axis=primary_bone_axis, secondary_bone_axis=secondary_bone_axis, tangent_space=tangent_space, triangulate_faces=triangulate_faces, rotation_engine=rotation_engine, from_copy=from_copy)
+		key = export_cache_key(context, filepath, active_collection, selected_objects, options)
+		if dry_run:
+			cache.last_status = "up to date" if cache.contains(key) else "would rebuild"
+			print(cache.last_status.capitalize() + ":", filepath)
+			return {'FINISHED'}
+		if cache.fetch(key, filepath):
+			cache.last_status = "cached"
+			print("Unchanged, FBX copied from the export cache:", filepath)
+			return {'FINISHED'}
+
+	# Only a file this call wrote goes into the cache, not one left over from an earlier export
+	previous_mtime = os.path.getmtime(filepath) if os.path.isfile(filepath) else None
+	if from_copy:
+		result = export_unity_fbx_from_copy(context, filepath, active_collection, selected_objects, deform_bones, leaf_bones, primary_bone_axis, secondary_bone_axis, tangent_space, triangulate_faces)
+	else:
+		result = export_unity_fbx_in_place(context, filepath, active_collection, selected_objects, deform_bones, leaf_bones, primary_bone_axis, secondary_bone_axis, tangent_space, triangulate_faces, rotation_engine)
+
+	if cache is not None and os.path.isfile(filepath) and os.path.getmtime(filepath) != previous_mtime:
+		cache.store(key, filepath)
+		cache.last_status = "exported"
+	return result
+
+
+def export_unity_fbx_in_place(context, filepath, active_collection, selected_objects, deform_bones, leaf_bones, primary_bone_axis, secondary_bone_axis, tangent_space, triangulate_faces, rotation_engine = 'OPERATOR'):
 	global shared_data
 	global hidden_collections
 	global hidden_objects
@@ -194,21 +906,22 @@ def export_unity_fbx(context, filepath, active_collection, selected_objects, def
 	if bpy.ops.object.mode_set.poll():
 		bpy.ops.object.mode_set(mode="OBJECT")
 
+	# Everything the steps below look up per object, gathered once
+	index = SceneIndex(bpy.context.view_layer)
+
 	# Ensure all the collections and objects in this view layer are visible
 	unhide_collections(bpy.context.view_layer.layer_collection)
-	unhide_objects()
+	unhide_objects(index)
 
 	# Create a single copy in multi-user datablocks. Will be restored after fixing rotations.
-	make_single_user_data()
+	make_single_user_data(index)
 
 	# Apply modifiers to objects (except those affected by an armature)
-	apply_object_modifiers()
+	apply_object_modifiers(index)
 	
 	try:
 		# Fix rotations
-		for ob in root_objects:
-			print(ob.name, ob.type)
-			fix_object(ob)
+		fix_rotations(root_objects, index, rotation_engine)
 
 		# Restore multi-user meshes
 		for item in shared_data:
@@ -235,7 +948,7 @@ def export_unity_fbx(context, filepath, active_collection, selected_objects, def
 			ob.select_set(True)
 
 		# Export FBX file
-		params = dict(filepath=filepath, apply_scale_options='FBX_SCALE_UNITS', object_types={'EMPTY', 'MESH', 'ARMATURE'}, use_active_collection=active_collection, use_selection=selected_objects, use_armature_deform_only=deform_bones, add_leaf_bones=leaf_bones, primary_bone_axis=primary_bone_axis, secondary_bone_axis=secondary_bone_axis, use_tspace=tangent_space, use_triangles=triangulate_faces)
+		params = unity_fbx_params(filepath, active_collection, selected_objects, deform_bones, leaf_bones, primary_bone_axis, secondary_bone_axis, tangent_space, triangulate_faces)
 
 		print("Invoking default FBX Exporter:", params)
 		bpy.ops.export_scene.fbx(**params)
@@ -353,6 +1066,27 @@ class ExportUnityFbx(Operator, ExportHelper):
 		default=False,
 	)
 
+	cache_dir: StringProperty(
+		name="Export Cache",
+		description="Folder to keep exported FBX files in. Exports of unchanged objects and settings are copied from it instead of being rebuilt. Empty to disable",
+		default="",
+		subtype='DIR_PATH',
+	)
+
+	from_copy: BoolProperty(
+		name="Export From Copy",
+		description="Build the Unity-ready objects in a temporary scene instead of changing this one and undoing it afterwards. Faster and lighter on memory for big files",
+		default=False,
+	)
+
+	rotation_engine: EnumProperty(
+		name="Rotation Fix",
+		items=(('OPERATOR', "Apply Transform", "Apply the rotation of every object with the transform operator"),
+				('MATRIX', "Matrix Math", "Bake the rotation into the object data with matrices. Much faster on large hierarchies"),
+		),
+		default='OPERATOR',
+	)
+
 	triangulate_faces: BoolProperty(
 		name="Triangulate Faces",
 		description="Convert all faces to triangles. This is necessary for exporting tangents in meshes with N-gons. Otherwise Unity will show a warning when importing tangents in these meshes",
@@ -373,6 +1107,11 @@ class ExportUnityFbx(Operator, ExportHelper):
 		layout.row().label(text = "Meshes")
 		layout.row().prop(self, "tangent_space")
 		layout.row().prop(self, "triangulate_faces")
+		layout.row().prop(self, "from_copy")
+		layout.row().prop(self, "cache_dir")
+		row = layout.row()
+		row.enabled = not self.from_copy
+		row.prop(self, "rotation_engine")
 
 		layout.separator()
 		layout.row().label(text = "Armatures")
@@ -392,7 +1131,8 @@ class ExportUnityFbx(Operator, ExportHelper):
 		split.column().prop(self, "secondary_bone_axis", text="")
 
 	def execute(self, context):
-		return export_unity_fbx(context, self.filepath, self.active_collection, self.selected_objects, self.deform_bones, self.leaf_bones, self.primary_bone_axis, self.secondary_bone_axis, self.tangent_space, self.triangulate_faces)
+		cache = ExportCache(bpy.path.abspath(self.cache_dir)) if self.cache_dir else None
+		return export_unity_fbx(context, self.filepath, self.active_collection, self.selected_objects, self.deform_bones, self.leaf_bones, self.primary_bone_axis, self.secondary_bone_axis, self.tangent_space, self.triangulate_faces, self.rotation_engine, self.from_copy, cache)
 
 
 # Only needed if you want to add into a dynamic menu
@@ -411,6 +1151,17 @@ def unregister():
 
 
 if __name__ == "__main__":
+	# blender --background [file.blend] --python blender-to-unity-fbx-exporter.py -- --compare-rotation-engines
+	# runs compare_rotation_engines and compare_export_modes on the file (on make_rotation_test_scene without
+	# one) and exits with 1 when any transform differs.
+	argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+	if "--compare-rotation-engines" in argv:
+		if not bpy.data.filepath:
+			make_rotation_test_scene()
+		mismatches = compare_rotation_engines()
+		mismatches += compare_export_modes()
+		sys.exit(1 if mismatches else 0)
+
 	register()
 
 	# test call